@@ -0,0 +1,278 @@
+"""
+Generates synthetic inputs of adjustable size for the benchmark suite:
+pandoc-style AsciiDoc intermediates, workbooks with images, docx media of
+mixed formats and docx files. The same seed always gives the same
+content.
+
+    python benchmarks/corpus.py --out corpus --pages 200 --bibliography 300
+    python benchmarks/corpus.py --out corpus --rows 50000 --cols 10 --sheets 4 --images 8
+"""
+import io
+import os
+import random
+import argparse
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+import docx_native
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+WORDS = ["system", "value", "report", "interface", "the", "of", "and", "a", "data", "shall", "be", "module",
+         "signal", "latency", "é", "naïve", "3.14", "2024", "C++", "x_y", "a|b", "<<ref>>", "{empty}", "50%"]
+
+# Paragraphs of 30 to 70 words, about 3000 characters of text per page
+PARAGRAPHS_PER_PAGE = 8
+
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def wrapped(rng, words, citations=0):
+    """A paragraph wrapped at 72 columns as pandoc writes it, with [n] citations."""
+    chosen = [rng.choice(WORDS) for _ in range(words)]
+    for _ in range(citations):
+        chosen.insert(rng.randrange(len(chosen) + 1), f"[{rng.randint(1, citations * 50)}]")
+    lines, line = [], ""
+    for word in chosen:
+        if line and len(line) + 1 + len(word) > 72:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def make_asciidoc(path, pages, bibliography, stem="doc", seed=0):
+    """
+    Writes AsciiDoc shaped like pandoc's output for a docx: a table of
+    contents, numbered sections with _Toc/_Ref anchors, paragraphs citing
+    the bibliography, note and example lines, figures with captions, tables
+    and a bibliography of the given number of entries.
+    """
+    rng = random.Random(seed)
+    parts = ["Table of Contents\n\n"
+             + " ".join(f"link:#_Toc{n}[{n} {text(rng, 3)}]" for n in range(1, pages // 4 + 2)) + "\n\n"]
+    figures = tables = 0
+    for page in range(pages):
+        if page % 4 == 0:
+            section = page // 4 + 1
+            parts.append(f"== [#_Toc{section} .anchor]####{section} {text(rng, 3)}\n\n")
+        for _ in range(PARAGRAPHS_PER_PAGE):
+            roll = rng.random()
+            if roll < 0.05:
+                parts.append(f"Note: {text(rng, 12)}\n\n")
+            elif roll < 0.08:
+                parts.append(f"EXAMPLE {rng.randint(1, 9)}: {text(rng, 10)}\n\n")
+            elif roll < 0.1:
+                parts.append(f"[SOURCE: {text(rng, 4)}] {text(rng, 8)}\n\n")
+            else:
+                parts.append(wrapped(rng, rng.randint(30, 70), rng.randint(0, 3) if bibliography else 0) + "\n\n")
+        if page % 2 == 1:
+            figures += 1
+            extension = rng.choice([".png", ".emf", ".wmf", ".jpeg"])
+            parts.append(f"image:{stem}/extracted_media/media/image{figures}{extension}"
+                         f"[image{figures},width=400,height=300]\n\n"
+                         f"Figure {figures}: {text(rng, 6)}\n\n")
+        if page % 3 == 2:
+            tables += 1
+            rows = "\n\n".join(f"|{text(rng, 3)} |{rng.randint(0, 999)} |{text(rng, 5)}" for _ in range(rng.randint(3, 12)))
+            parts.append(f"[#_Ref{tables} .anchor]####Table {tables}: {text(rng, 5)}\n\n"
+                         f'[width="100%",cols="34%,33%,33%",options="header",]\n|===\n{rows}\n|===\n\n')
+    if bibliography:
+        parts.append("== Bibliography\n\n")
+        for key in range(1, bibliography + 1):
+            parts.append(f"[{key}] {text(rng, 4)}, _{text(rng, 6)}_, {rng.randint(1990, 2024)}.\n\n")
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("".join(parts))
+
+
+def noise_image(rng, width, height, mode="RGB"):
+    """An image of random pixels, so it does not compress to nothing."""
+    return Image.frombytes(mode, (width, height), rng.randbytes(width * height * len(mode)))
+
+
+def image_bytes(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+# Docx media mix: (file name extension, Pillow format). EMF and WMF need
+# platform renderers, so metafile names carry raster data; the .wmf files
+# are rendered to png through Pillow and the .emf ones hold png data, which
+# only needs renaming, as in real documents.
+MEDIA_FORMATS = [(".png", "PNG"), (".jpeg", "JPEG"), (".gif", "GIF"), (".bmp", "BMP"), (".tiff", "TIFF"),
+                 (".emf", "PNG"), (".wmf", "BMP")]
+
+
+def make_media_docx(path, count, size=256, seed=0):
+    """
+    A docx holding count images of mixed formats in word/media, for timing
+    imageConverter.extract_docx_media and read_docx_media, which convert
+    the media of every docx. Only word/media is read from it.
+    """
+    rng = random.Random(seed)
+    with ZipFile(path, "w", ZIP_DEFLATED) as archive:
+        for n in range(1, count + 1):
+            extension, image_format = MEDIA_FORMATS[(n - 1) % len(MEDIA_FORMATS)]
+            image = noise_image(rng, rng.randint(size // 2, size), rng.randint(size // 2, size))
+            if image_format == "GIF":
+                image = image.convert("P")
+            archive.writestr(f"word/media/image{n}{extension}", image_bytes(image, image_format), ZIP_STORED)
+
+
+def relationships(rels):
+    return (f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{PKG_REL_NS}">'
+            + "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in rels)
+            + "</Relationships>")
+
+
+def column_name(index):
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def cell(rng, reference, column):
+    kind = column % 4
+    if kind == 1:
+        return f'<c r="{reference}"><v>{rng.randint(0, 100000)}</v></c>'
+    if kind == 2:
+        return "" if rng.random() < 0.1 else f'<c r="{reference}"><v>{rng.random() * 1000:.4f}</v></c>'
+    value = text(rng, rng.randint(1, 6))
+    if kind == 3 and rng.random() < 0.05:
+        value += "\nsecond line"
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+def sheet_xml(rng, rows, cols, has_drawing):
+    header = "".join(f'<c r="{column_name(c)}1" t="inlineStr"><is><t>Column {c}</t></is></c>' for c in range(cols))
+    body = [f'<row r="1">{header}</row>']
+    for r in range(2, rows + 2):
+        body.append(f'<row r="{r}">' + "".join(cell(rng, f"{column_name(c)}{r}", c) for c in range(cols)) + "</row>")
+    drawing = '<drawing r:id="rId1"/>' if has_drawing else ""
+    return (f'<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+            f'<sheetData>{"".join(body)}</sheetData>{drawing}</worksheet>')
+
+
+def make_workbook(path, rows, cols, sheets, images=0, image_size=256, seed=0):
+    """
+    Writes a workbook of sheets x rows x cols cells of text, integers and
+    decimals, with images shown on every sheet. The XML is written directly,
+    which is much faster than openpyxl for large sheets.
+    """
+    rng = random.Random(seed)
+    with ZipFile(path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/><Default Extension="png" ContentType="image/png"/>'
+                         '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                         + "".join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                                   for n in range(1, sheets + 1))
+                         + "</Types>")
+        archive.writestr("_rels/.rels", relationships([("rId1", REL_NS + "/officeDocument", "xl/workbook.xml")]))
+        archive.writestr("xl/workbook.xml",
+                         f'<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+                         + "".join(f'<sheet name="Sheet {n}" sheetId="{n}" r:id="rId{n}"/>' for n in range(1, sheets + 1))
+                         + "</sheets></workbook>")
+        archive.writestr("xl/_rels/workbook.xml.rels", relationships(
+            [(f"rId{n}", REL_NS + "/worksheet", f"worksheets/sheet{n}.xml") for n in range(1, sheets + 1)]))
+
+        for n in range(1, sheets + 1):
+            archive.writestr(f"xl/worksheets/sheet{n}.xml", sheet_xml(rng, rows, cols, images > 0))
+            if not images:
+                continue
+            archive.writestr(f"xl/worksheets/_rels/sheet{n}.xml.rels",
+                             relationships([("rId1", REL_NS + "/drawing", f"../drawings/drawing{n}.xml")]))
+            pictures = "".join(
+                f'<xdr:twoCellAnchor><xdr:pic><xdr:blipFill><a:blip r:embed="rId{i}"/></xdr:blipFill></xdr:pic></xdr:twoCellAnchor>'
+                for i in range(1, images + 1))
+            archive.writestr(f"xl/drawings/drawing{n}.xml",
+                             '<?xml version="1.0" encoding="UTF-8"?><xdr:wsDr xmlns:xdr="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing" '
+                             f'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" xmlns:r="{REL_NS}">{pictures}</xdr:wsDr>')
+            archive.writestr(f"xl/drawings/_rels/drawing{n}.xml.rels", relationships(
+                [(f"rId{i}", REL_NS + "/image", f"../media/image{i}.png") for i in range(1, images + 1)]))
+
+        for i in range(1, images + 1):
+            archive.writestr(f"xl/media/image{i}.png", image_bytes(noise_image(rng, image_size, image_size), "PNG"),
+                             ZIP_STORED)
+
+
+def make_docx(path, blocks, seed=0):
+    """A docx of the given number of blocks, from the native reader benchmark's generator."""
+    docx_native.make_document(path, random.Random(seed), fallback=True, blocks=blocks)
+
+
+# Corpus sizes used when none are given
+DEFAULT_SETTINGS = {"pages": 200, "bibliography": 300, "rows": 20000, "cols": 8, "sheets": 3, "images": 6,
+                    "media": 70, "documents": 6, "blocks": 200, "seed": 0}
+
+
+def make_corpus(out, settings):
+    """
+    Writes every kind of input to out: doc_no_format.adoc, book.xlsx,
+    media.docx and doc0.docx, doc1.docx, ...
+
+        Args:
+            out (str): Directory to write to.
+            settings (dict): Sizes, with the keys of DEFAULT_SETTINGS.
+    """
+    seed = settings["seed"]
+    os.makedirs(out, exist_ok=True)
+    make_asciidoc(os.path.join(out, "doc_no_format.adoc"), settings["pages"], settings["bibliography"], seed=seed)
+    make_workbook(os.path.join(out, "book.xlsx"), settings["rows"], settings["cols"], settings["sheets"],
+                  settings["images"], seed=seed)
+    make_media_docx(os.path.join(out, "media.docx"), settings["media"], seed=seed)
+    for n in range(settings["documents"]):
+        make_docx(os.path.join(out, f"doc{n}.docx"), settings["blocks"], seed=seed + n)
+
+
+def add_settings_arguments(parser):
+    parser.add_argument("--pages", type=int, help="Pages of the AsciiDoc intermediate")
+    parser.add_argument("--bibliography", type=int, help="Bibliography entries of the AsciiDoc intermediate")
+    parser.add_argument("--rows", type=int, help="Rows per sheet")
+    parser.add_argument("--cols", type=int, help="Columns per sheet")
+    parser.add_argument("--sheets", type=int, help="Sheets of the workbook")
+    parser.add_argument("--images", type=int, help="Images shown on every sheet")
+    parser.add_argument("--media", type=int, help="Images in the mixed media docx")
+    parser.add_argument("--documents", type=int, help="Number of docx files")
+    parser.add_argument("--blocks", type=int, help="Blocks per docx file")
+    parser.add_argument("--seed", type=int)
+
+
+# Settings that grow the amount of work rather than its shape
+SCALED_SETTINGS = {"pages", "bibliography", "rows", "media", "blocks"}
+
+
+def settings_from_arguments(args, scale=1.0):
+    """DEFAULT_SETTINGS, sizes multiplied by scale, then overridden by the given arguments."""
+    settings = {name: max(1, round(value * scale)) if name in SCALED_SETTINGS else value
+                for name, value in DEFAULT_SETTINGS.items()}
+    settings.update({name: getattr(args, name) for name in DEFAULT_SETTINGS if getattr(args, name) is not None})
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="Directory to write the corpus to")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    make_corpus(args.out, settings_from_arguments(args))
+    print(f"Wrote corpus to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Compares the native docx reader (docxConverter) with pandoc on a corpus of
+documents: how many give byte-identical AsciiDoc, how many fall back to
+pandoc, how many differ, and the documents per second of each.
+
+    python benchmarks/docx_native.py --documents 200
+    python benchmarks/docx_native.py --corpus path/to/docx/folder
+
+Without --corpus, documents are generated with headings, formatted text,
+lists, tables and images, plus a share using things only pandoc handles.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from zipfile import ZipFile, ZIP_DEFLATED
+from xml.sax.saxutils import escape, quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import docxConverter
+import pandoc
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+NAMESPACES = (f'xmlns:w="{W_NS}" xmlns:r="{REL_NS}" '
+              'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+              'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+              'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"')
+
+# 1x1 png
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                    "1f15c4890000000d49444154789c6360f80f0000010101005a4d6f1d0000000049454e44ae426082")
+
+WORDS = ["alpha", "beta", "gamma", "delta", "report", "value", "system", "the", "of", "and", "a", "data",
+         "é", "naïve", "fiancée", "x", "42", "3.14", "2024", "-", "--", "...", "(see", "below)", "it's",
+         "“quoted”", "‘single’", "end.", "note:", "a;b", "50%", "$5", "&", "@home", "over/under", "a=b"]
+SPECIAL_WORDS = ["a*b", "x_y", "[1]", "[ref]", "{x}", "<tag>", "a+b", "#1", "`code`", "a|b", "back\\slash",
+                 "**", "__init__", "C++", "<<a>>", "{plus}", "non\u00a0breaking", "x^2", "~tilde~"]
+MARKER_WORDS = ["1.", "2)", "(3)", "a.", "b)", "i.", "iv.", "A.", "B)", "II.", "I.", "1.5", "@.", "10."]
+# Things the native reader leaves to pandoc
+FALLBACK_RUN_PROPERTIES = ["<w:u w:val=\"single\"/>", "<w:strike/>", "<w:vertAlign w:val=\"superscript\"/>",
+                           "<w:smallCaps/>", "<w:rStyle w:val=\"Emphasis\"/>"]
+
+TEXT_WIDTH = 9360
+
+
+def sentence(rng, words, markers=False):
+    chosen = [rng.choice(SPECIAL_WORDS) if rng.random() < 0.15 else rng.choice(WORDS) for _ in range(words)]
+    if markers and rng.random() < 0.2:
+        chosen[0] = rng.choice(MARKER_WORDS)
+    return " ".join(chosen)
+
+
+def run(text, bold=False, italic=False, extra=""):
+    properties = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "") + extra
+    return (f"<w:r>{f'<w:rPr>{properties}</w:rPr>' if properties else ''}"
+            f'<w:t xml:space="preserve">{escape(text)}</w:t></w:r>')
+
+
+def runs(rng, words, markers=False, breaks=True, fallback=False):
+    text = sentence(rng, words, markers)
+    pieces, position = [], 0
+    while position < len(text):
+        end = min(len(text), position + rng.randint(1, 30))
+        pieces.append(text[position:end])
+        position = end
+    xml = []
+    for piece in pieces:
+        extra = rng.choice(FALLBACK_RUN_PROPERTIES) if fallback and rng.random() < 0.1 else ""
+        roll = rng.random()
+        if roll < 0.03 and breaks:
+            xml.append("<w:r><w:br/></w:r>")
+        elif roll < 0.05:
+            xml.append("<w:r><w:tab/></w:r>")
+        xml.append(run(piece, rng.random() < 0.25, rng.random() < 0.2, extra))
+    return "".join(xml)
+
+
+def paragraph(content, style=None, numbering=None):
+    properties = (f'<w:pStyle w:val="{style}"/>' if style else "") + \
+                 (f'<w:numPr><w:ilvl w:val="{numbering[1]}"/><w:numId w:val="{numbering[0]}"/></w:numPr>'
+                  if numbering else "")
+    return f"<w:p>{f'<w:pPr>{properties}</w:pPr>' if properties else ''}{content}</w:p>"
+
+
+def picture(rng, image_id):
+    width, height = rng.randint(100000, 6000000), rng.randint(100000, 6000000)
+    description = f" descr={quoteattr(sentence(rng, rng.randint(1, 12)))}" if rng.random() < 0.5 else ""
+    return ('<w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{width}" cy="{height}"/><wp:docPr id="{image_id}" name="Picture {image_id}"{description}/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{image_id}" name="image{image_id}.png"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="rIdImage{image_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{width}" cy="{height}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic></a:graphicData></a:graphic>'
+            '</wp:inline></w:drawing></w:r>')
+
+
+def table(rng):
+    columns = rng.randint(1, 6)
+    widths = [rng.randint(500, 3000) for _ in range(columns)]
+    if sum(widths) > TEXT_WIDTH or rng.random() < 0.3:
+        widths = [TEXT_WIDTH // columns] * columns
+    first_row = rng.choice(["1", "0"])
+    rows = []
+    for _ in range(rng.randint(1, 6)):
+        cells = []
+        for width in widths:
+            text = runs(rng, rng.randint(1, 8) if rng.random() < 0.8 else rng.randint(10, 25), breaks=False) \
+                if rng.random() < 0.85 else ""
+            cells.append(f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>{paragraph(text)}</w:tc>')
+        rows.append(f"<w:tr>{''.join(cells)}</w:tr>")
+    return (f'<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:w="0" w:type="auto"/>'
+            f'<w:tblLook w:val="04A0" w:firstRow="{first_row}" w:lastRow="0" w:firstColumn="1" w:lastColumn="0" '
+            'w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>'
+            + "".join(f'<w:gridCol w:w="{width}"/>' for width in widths)
+            + "</w:tblGrid>" + "".join(rows) + "</w:tbl>")
+
+
+def numbering_xml():
+    formats = {1: "bullet", 2: "decimal", 3: "lowerLetter", 4: "upperRoman", 5: "decimal"}
+    definitions, nums = [], []
+    for num_id, first in formats.items():
+        levels = []
+        for level in range(3):
+            fmt = first if level == 0 else ["bullet", "decimal", "lowerRoman"][(num_id + level) % 3]
+            start = 3 if num_id == 5 and level == 0 else 1
+            text = "•" if fmt == "bullet" else f"%{level + 1}."
+            levels.append(f'<w:lvl w:ilvl="{level}"><w:start w:val="{start}"/><w:numFmt w:val="{fmt}"/>'
+                          f'<w:lvlText w:val="{text}"/><w:lvlJc w:val="left"/>'
+                          f'<w:pPr><w:ind w:left="{720 * (level + 1)}" w:hanging="360"/></w:pPr></w:lvl>')
+        definitions.append(f'<w:abstractNum w:abstractNumId="{num_id}">{"".join(levels)}</w:abstractNum>')
+        nums.append(f'<w:num w:numId="{num_id}"><w:abstractNumId w:val="{num_id}"/></w:num>')
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:numbering xmlns:w="{W_NS}">{"".join(definitions + nums)}</w:numbering>'
+
+
+def styles_xml():
+    headings = "".join(
+        f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+        f'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:pPr><w:keepNext/><w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+        '<w:rPr><w:b/><w:sz w:val="28"/></w:rPr></w:style>' for level in range(1, 5))
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:styles xmlns:w="{W_NS}">'
+            '<w:docDefaults><w:rPrDefault><w:rPr><w:sz w:val="22"/><w:lang w:val="en-US"/></w:rPr></w:rPrDefault></w:docDefaults>'
+            '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+            + headings +
+            '<w:style w:type="paragraph" w:styleId="ListParagraph"><w:name w:val="List Paragraph"/>'
+            '<w:basedOn w:val="Normal"/><w:pPr><w:ind w:left="720"/><w:contextualSpacing/></w:pPr></w:style>'
+            '<w:style w:type="paragraph" w:styleId="Quote"><w:name w:val="Quote"/><w:basedOn w:val="Normal"/></w:style>'
+            '<w:style w:type="character" w:styleId="Emphasis"><w:name w:val="Emphasis"/><w:rPr><w:i/></w:rPr></w:style>'
+            '<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/></w:style>'
+            '</w:styles>')
+
+
+def make_document(path, rng, fallback=False, blocks=None):
+    """
+    Writes a generated docx of the given number of blocks, or 5 to 40. With
+    fallback set, some paragraphs use underline, quotes and other things the
+    native reader leaves to pandoc.
+    """
+    body, images = [], 0
+    for _ in range(blocks or rng.randint(5, 40)):
+        roll = rng.random()
+        if roll < 0.1:
+            level = rng.randint(1, 4)
+            body.append(paragraph(runs(rng, rng.randint(1, 8), breaks=False), f"Heading{level}"))
+        elif roll < 0.25:
+            num_id = rng.randint(1, 5)
+            level = 0
+            for _ in range(rng.randint(1, 6)):
+                level = max(0, min(2, level + rng.choice([-1, 0, 0, 1])))
+                body.append(paragraph(runs(rng, rng.randint(1, 20), markers=True), "ListParagraph", (num_id, level)))
+        elif roll < 0.32:
+            body.append(table(rng))
+        elif roll < 0.38:
+            images += 1
+            text = runs(rng, rng.randint(0, 6), breaks=False) if rng.random() < 0.3 else ""
+            body.append(paragraph(text + picture(rng, images)))
+        elif fallback and roll < 0.4:
+            body.append(paragraph(runs(rng, 8), "Quote"))
+        else:
+            body.append(paragraph(runs(rng, rng.randint(1, 80), markers=True, fallback=fallback)))
+
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {NAMESPACES}><w:body>'
+                + "".join(body) +
+                '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/><w:pgMar w:top="1440" w:right="1440" w:bottom="1440" '
+                'w:left="1440" w:header="720" w:footer="720" w:gutter="0"/></w:sectPr></w:body></w:document>')
+    relationships = [("rIdStyles", REL_NS + "/styles", "styles.xml"),
+                     ("rIdNumbering", REL_NS + "/numbering", "numbering.xml")]
+    relationships += [(f"rIdImage{n}", REL_NS + "/image", f"media/image{n}.png") for n in range(1, images + 1)]
+
+    with ZipFile(path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/><Default Extension="png" ContentType="image/png"/>'
+                         '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                         '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+                         '<Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+                         '</Types>')
+        archive.writestr("_rels/.rels", relationships_xml([("rId1", REL_NS + "/officeDocument", "word/document.xml")]))
+        archive.writestr("word/_rels/document.xml.rels", relationships_xml(relationships))
+        archive.writestr("word/document.xml", document)
+        archive.writestr("word/styles.xml", styles_xml())
+        archive.writestr("word/numbering.xml", numbering_xml())
+        for n in range(1, images + 1):
+            archive.writestr(f"word/media/image{n}.png", PNG)
+
+
+def relationships_xml(relationships):
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{PKG_REL_NS}">'
+            + "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in relationships)
+            + "</Relationships>")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="Folder of .docx files to compare instead of generated ones")
+    parser.add_argument("--documents", type=int, default=100, help="Number of documents to generate")
+    parser.add_argument("--fallback-share", type=float, default=0.2,
+                        help="Share of generated documents using things only pandoc handles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--show", type=int, default=3, help="Number of differing documents to print a diff for")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        if args.corpus:
+            documents = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                               if name.endswith(".docx"))
+        else:
+            rng = random.Random(args.seed)
+            documents = []
+            for n in range(args.documents):
+                path = os.path.join(work_dir, f"doc{n}.docx")
+                make_document(path, rng, fallback=rng.random() < args.fallback_share)
+                documents.append(path)
+
+        # Without pandoc there is nothing to compare with, and the run says
+        # so rather than reporting no differences
+        compared = pandoc.pandoc_version() is not None
+        counts = {"identical": 0, "fallback": 0, "differs": 0}
+        native_seconds = pandoc_seconds = 0.0
+        shown = 0
+        for document in documents:
+            media_folder = os.path.splitext(os.path.basename(document))[0] + "/extracted_media/"
+            start = time.perf_counter()
+            native = docxConverter.convert_docx_to_adoc(document, media_folder)
+            native_seconds += time.perf_counter() - start
+            if not compared:
+                counts["fallback"] += native is None
+                continue
+
+            start = time.perf_counter()
+            expected = subprocess.run(pandoc.pandoc_command(media_folder, document), check=True, capture_output=True,
+                                      text=True, encoding="utf-8").stdout
+            pandoc_seconds += time.perf_counter() - start
+
+            if native is None:
+                counts["fallback"] += 1
+            elif native == expected:
+                counts["identical"] += 1
+            else:
+                counts["differs"] += 1
+                if shown < args.show:
+                    shown += 1
+                    show_difference(document, expected, native)
+
+        if compared:
+            print(f"{len(documents)} documents: {counts['identical']} identical, {counts['fallback']} fell back to pandoc, "
+                  f"{counts['differs']} differ")
+        else:
+            print(f"{len(documents)} documents: {counts['fallback']} fell back to pandoc; "
+                  "comparison with pandoc NOT RUN, pandoc is not installed")
+        print(f"native: {len(documents) / native_seconds:8.1f} documents/s ({native_seconds:.2f}s, fallbacks included)")
+        if compared:
+            print(f"pandoc: {len(documents) / pandoc_seconds:8.1f} documents/s ({pandoc_seconds:.2f}s)")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def show_difference(document, expected, native):
+    import difflib
+    print(f"--- {document}")
+    for line in list(difflib.unified_diff(expected.splitlines(), native.splitlines(), "pandoc", "native",
+                                          lineterm=""))[:40]:
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
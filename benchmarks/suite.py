@@ -0,0 +1,395 @@
+"""
+Times every conversion stage and the whole pipeline on a generated corpus,
+checks that the fast paths write the same bytes as the reference ones, and
+compares the results with a stored baseline.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json
+    python benchmarks/suite.py --only format,xlsx --scale 0.2
+
+Each case runs --repeat times on fresh copies of its inputs and the best
+time is kept, along with a SHA-256 of its output. Against a baseline, a
+case more than --tolerance slower is a regression, and any change in its
+output digest is reported. Either makes the suite exit with status 1, as
+does a fast path whose output differs from its reference path, or a
+startup that imports pandas, openpyxl or PIL before a file needs them. The
+pipeline cases run main_no_gui.py with pandoc, and are skipped when pandoc
+is not installed; their per-stage times come from a second run with
+--report.
+
+Timings only compare between runs on the same machine. Digests compare
+anywhere with the same corpus settings and pandoc version.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+import corpus
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Fast paths and the reference path whose output they must match byte for byte
+SAME_OUTPUT = [
+    ("format", "format_legacy"),
+    ("format_streaming", "format_legacy"),
+    ("xlsx_streaming", "xlsx"),
+    ("xlsx_sheet_jobs", "xlsx"),
+    ("docx_media_read", "docx_media"),
+    ("pipeline_native_docx", "pipeline"),
+]
+
+# Differences smaller than this many seconds are never a regression
+NOISE_SECONDS = 0.05
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def directory_digest(path, exclude=()):
+    """Digest of the names and contents of every file under path."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(full_path, path).replace(os.sep, "/")
+            if relative_path in exclude:
+                continue
+            digest.update(relative_path.encode("utf-8") + b"\0")
+            with open(full_path, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def files_digest(files):
+    """directory_digest of the files a dict of relative path -> contents would make."""
+    digest = hashlib.sha256()
+    for relative_path in sorted(files):
+        digest.update(relative_path.encode("utf-8") + b"\0")
+        digest.update(hashlib.sha256(files[relative_path]).digest())
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextlib.contextmanager
+def timed(times):
+    start = time.perf_counter()
+    yield
+    times.append(time.perf_counter() - start)
+
+
+# Cases. Each gets the corpus directory, an empty work directory and a
+# timed() context for the part to measure, and returns its output digest.
+
+def case_format(corpus_dir, work, timer):
+    import formatting
+    with open(os.path.join(corpus_dir, "doc_no_format.adoc"), encoding="utf-8") as file:
+        content = file.read()
+    with timer:
+        content = formatting.format_content(content, "doc")
+    return text_digest(content)
+
+
+def case_format_legacy(corpus_dir, work, timer):
+    import main_no_gui
+    with open(os.path.join(corpus_dir, "doc_no_format.adoc"), encoding="utf-8") as file:
+        content = file.read()
+    with timer:
+        content = main_no_gui.process_content(content, "doc", legacy=True)
+    return text_digest(content)
+
+
+def case_format_streaming(corpus_dir, work, timer):
+    import formatting
+    input_file = os.path.join(corpus_dir, "doc_no_format.adoc")
+    output = io.StringIO()
+    with timer:
+        with open(input_file, encoding="utf-8") as file:
+            bibliography = formatting.index_bibliography(file)
+        with open(input_file, encoding="utf-8") as file:
+            for chunk in formatting.format_lines(file, "doc", bibliography):
+                output.write(chunk)
+    return text_digest(output.getvalue())
+
+
+def xlsx_case(streaming, sheet_workers):
+    def case(corpus_dir, work, timer):
+        import xlsxConverter
+        with working_directory(work), timer:
+            os.makedirs("book", exist_ok=True)
+            xlsxConverter.convert_xlsx_to_adoc_with_images(os.path.join(corpus_dir, "book.xlsx"), "book",
+                                                           "book/extracted_images/", streaming, sheet_workers)
+        return directory_digest(os.path.join(work, "book"))
+    return case
+
+
+def case_xlsx_images(corpus_dir, work, timer):
+    import xlsxConverter
+    output_dir = os.path.join(work, "images")
+    with timer:
+        xlsxConverter.extract_images_from_xlsx(os.path.join(corpus_dir, "book.xlsx"), output_dir)
+    return directory_digest(output_dir)
+
+
+def case_docx_media(corpus_dir, work, timer):
+    import imageConverter
+    media_folder = os.path.join(work, "extracted_media")
+    with timer:
+        imageConverter.extract_docx_media(os.path.join(corpus_dir, "media.docx"), media_folder)
+    return directory_digest(media_folder)
+
+
+def case_docx_media_read(corpus_dir, work, timer):
+    # The in-memory conversion of api.py
+    import imageConverter
+    with timer:
+        media = imageConverter.read_docx_media(os.path.join(corpus_dir, "media.docx"))
+    return files_digest({f"media/{name}": data for name, data in media.items()})
+
+
+def case_docx_native(corpus_dir, work, timer):
+    import docxConverter
+    documents = sorted(name for name in os.listdir(corpus_dir) if name.startswith("doc") and name.endswith(".docx"))
+    outputs = []
+    with timer:
+        for name in documents:
+            outputs.append(docxConverter.convert_docx_to_adoc(os.path.join(corpus_dir, name),
+                                                              f"{name[:-5]}/extracted_media/"))
+    # Documents left to pandoc count as their own output
+    return text_digest("\0".join(output if output is not None else "(pandoc)" for output in outputs))
+
+
+# Loaded by the converters that need them, never when the CLI starts
+LAZY_MODULES = ["pandas", "openpyxl", "PIL", "xlsxConverter", "imageConverter", "docxConverter"]
+
+STARTUP_SCRIPT = f"""
+import sys
+import main_no_gui
+print(",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+"""
+
+
+def case_startup(corpus_dir, work, timer):
+    with timer:
+        loaded = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=SRC_DIR, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    if loaded:
+        raise RuntimeError(f"importing main_no_gui loads {loaded}")
+    return text_digest(loaded)
+
+
+def pipeline_case(*options):
+    def case(corpus_dir, work, timer):
+        inputs = sorted(name for name in os.listdir(corpus_dir) if name.startswith("doc") and name.endswith(".docx"))
+        inputs.append("book.xlsx")
+        command = [sys.executable, os.path.join(SRC_DIR, "main_no_gui.py"), "--input", *inputs, "--no-cache", *options]
+        # The stage times come from a second, profiled run, so the
+        # profiler's overhead stays out of the end-to-end time
+        profiled = os.path.join(work, "profiled")
+        timed_work = os.path.join(work, "timed")
+        for directory in (timed_work, profiled):
+            os.makedirs(directory)
+            for name in inputs:
+                shutil.copyfile(os.path.join(corpus_dir, name), os.path.join(directory, name))
+        with timer:
+            subprocess.run(command, cwd=timed_work, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run(command + ["--report", "report.json"], cwd=profiled, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        report = read_json(os.path.join(profiled, "report.json"))
+        stages = {name: total["wall_s"] for name, total in report["totals"].items()}
+        return directory_digest(timed_work, exclude={*inputs, "my_log_file.log"}), stages
+    return case
+
+
+CASES = [
+    ("startup", case_startup),
+    ("format", case_format),
+    ("format_legacy", case_format_legacy),
+    ("format_streaming", case_format_streaming),
+    ("xlsx", xlsx_case(False, 1)),
+    ("xlsx_streaming", xlsx_case(True, 1)),
+    ("xlsx_sheet_jobs", xlsx_case(False, 2)),
+    ("xlsx_images", case_xlsx_images),
+    ("docx_media", case_docx_media),
+    ("docx_media_read", case_docx_media_read),
+    ("docx_native", case_docx_native),
+    ("pipeline", pipeline_case()),
+    ("pipeline_native_docx", pipeline_case("--native-docx")),
+]
+
+
+def run_case(case, corpus_dir, repeat):
+    """
+    Runs a case repeat times. Returns (best seconds, digest, stage seconds
+    of the best run or None), or raises if the digest is not the same on
+    every run.
+    """
+    best = None
+    digests = set()
+    for _ in range(repeat):
+        work = tempfile.mkdtemp(prefix="bench-")
+        times = []
+        try:
+            # The converters print a line per image and sheet
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = case(corpus_dir, work, timed(times))
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        digest, stages = result if isinstance(result, tuple) else (result, None)
+        digests.add(digest)
+        if best is None or times[0] < best[0]:
+            best = (times[0], digest, stages)
+    if len(digests) > 1:
+        raise RuntimeError("output differs between runs")
+    return best
+
+
+def pandoc_version():
+    try:
+        output = subprocess.run(["pandoc", "--version"], check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.splitlines()[0]
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a status per result name: ok, faster, REGRESSION, OUTPUT CHANGED
+    or new, and whether anything failed.
+    """
+    statuses, failed = {}, False
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            statuses[name] = "new"
+            continue
+        status = "ok"
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > NOISE_SECONDS:
+            status = "REGRESSION"
+        elif result["seconds"] < base["seconds"] / (1 + tolerance) and base["seconds"] - result["seconds"] > NOISE_SECONDS:
+            status = "faster"
+        if result.get("digest") and base.get("digest") and result["digest"] != base["digest"]:
+            status = "OUTPUT CHANGED" if status == "ok" else f"{status}, OUTPUT CHANGED"
+        failed = failed or "REGRESSION" in status or "OUTPUT CHANGED" in status
+        statuses[name] = status
+    return statuses, failed
+
+
+def main():
+    global SRC_DIR
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", help="Comma separated case names to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best time is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every corpus size by this")
+    parser.add_argument("--corpus", help="Keep the generated corpus in this directory and reuse it on later runs")
+    parser.add_argument("--save", help="Store the results as a baseline in this JSON file")
+    parser.add_argument("--compare", help="Compare the results with the baseline in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown over the baseline allowed before a regression is flagged (default: %(default)s)")
+    parser.add_argument("--src", default=SRC_DIR, help="src directory of the checkout to benchmark")
+    corpus.add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    SRC_DIR = os.path.abspath(args.src)
+    sys.path.insert(0, SRC_DIR)
+    logging.basicConfig(level=logging.WARNING)
+    settings = corpus.settings_from_arguments(args, args.scale)
+
+    baseline = read_json(args.compare) if args.compare else None
+    if baseline:
+        if baseline["settings"] != settings:
+            parser.error(f"{args.compare} was recorded with other corpus settings: {baseline['settings']}")
+
+    selected = args.only.split(",") if args.only else [name for name, _ in CASES]
+    unknown = set(selected) - {name for name, _ in CASES}
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    pandoc = pandoc_version()
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="bench-corpus-")
+    settings_file = os.path.join(corpus_dir, "settings.json")
+    try:
+        if not (args.corpus and os.path.exists(settings_file) and read_json(settings_file) == settings):
+            print(f"Generating corpus {settings}")
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            corpus.make_corpus(corpus_dir, settings)
+            with open(settings_file, "w", encoding="utf-8") as file:
+                json.dump(settings, file)
+
+        results, errors, skipped = {}, {}, {}
+        for name, case in CASES:
+            if name not in selected:
+                continue
+            if name.startswith("pipeline") and pandoc is None:
+                skipped[name] = "pandoc is not installed"
+                print(f"{name}: skipped, {skipped[name]}")
+                continue
+            try:
+                seconds, digest, stages = run_case(case, os.path.abspath(corpus_dir), args.repeat)
+            except Exception as e:
+                errors[name] = str(e) or type(e).__name__
+                print(f"{name}: FAILED ({errors[name]})")
+                continue
+            results[name] = {"seconds": seconds, "digest": digest}
+            for stage, stage_seconds in sorted((stages or {}).items()):
+                results[f"{name}/{stage}"] = {"seconds": stage_seconds}
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    statuses, failed = compare(results, baseline["results"], args.tolerance) if baseline else ({}, False)
+    print(f"{'case':<40} {'seconds':>9} {'baseline':>9} {'change':>8}  status")
+    for name, result in results.items():
+        base = baseline["results"].get(name) if baseline else None
+        base_seconds = f"{base['seconds']:.3f}" if base else ""
+        change = f"{(result['seconds'] / base['seconds'] - 1) * 100:+.1f}%" if base and base["seconds"] else ""
+        print(f"{name:<40} {result['seconds']:>9.3f} {base_seconds:>9} {change:>8}  {statuses.get(name, '')}")
+
+    for fast, reference in SAME_OUTPUT:
+        if fast in results and reference in results and results[fast]["digest"] != results[reference]["digest"]:
+            print(f"OUTPUT DIFFERS: {fast} does not write the same bytes as {reference}")
+            failed = True
+    # A skipped case's output check did not pass, it was not run
+    not_run = [(fast, reference) for fast, reference in SAME_OUTPUT if fast in skipped or reference in skipped]
+    for fast, reference in not_run:
+        print(f"NOT RUN: {fast} was not checked against {reference}, {skipped.get(fast) or skipped[reference]}")
+    failed = failed or bool(errors)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"settings": settings, "pandoc": pandoc, "python": platform.python_version(),
+                       "machine": platform.platform(), "results": results,
+                   "not_run": [f"{fast} = {reference}" for fast, reference in not_run]}, file, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if baseline and baseline.get("pandoc") != pandoc:
+        print(f"Note: the baseline used {baseline.get('pandoc')}, this run {pandoc}; pipeline digests may differ")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
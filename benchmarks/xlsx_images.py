@@ -0,0 +1,120 @@
+"""
+Time, peak memory and bytes read/written by extract_images_from_xlsx on a
+generated image-heavy workbook. Every image is shown by several drawings,
+as when a logo or diagram is repeated on each sheet.
+
+    python benchmarks/xlsx_images.py --images 20 --image-mb 4 --sheets 5
+
+Pass --src with the src directory of another checkout to compare against it.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DRAWING_REL = REL_NS + "/drawing"
+IMAGE_REL = REL_NS + "/image"
+
+
+def relationships(rels):
+    return (f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{PKG_REL_NS}">'
+            + "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in rels)
+            + "</Relationships>")
+
+
+def make_workbook(path, images, image_bytes, sheets):
+    """
+    Writes a workbook whose sheets each have a drawing showing every image.
+    Targets are relative, as Excel writes them.
+    """
+    with ZipFile(path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/><Default Extension="png" ContentType="image/png"/>'
+                         '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                         + "".join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                                   for n in range(1, sheets + 1))
+                         + "</Types>")
+        archive.writestr("_rels/.rels", relationships([("rId1", REL_NS + "/officeDocument", "xl/workbook.xml")]))
+        archive.writestr("xl/workbook.xml",
+                         f'<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+                         + "".join(f'<sheet name="Sheet {n}" sheetId="{n}" r:id="rId{n}"/>' for n in range(1, sheets + 1))
+                         + "</sheets></workbook>")
+        archive.writestr("xl/_rels/workbook.xml.rels", relationships(
+            [(f"rId{n}", REL_NS + "/worksheet", f"worksheets/sheet{n}.xml") for n in range(1, sheets + 1)]))
+
+        for n in range(1, sheets + 1):
+            archive.writestr(f"xl/worksheets/sheet{n}.xml",
+                             f'<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheetData>'
+                             f'<row r="1"><c r="A1" t="inlineStr"><is><t>Sheet {n}</t></is></c></row></sheetData>'
+                             '<drawing r:id="rId1"/></worksheet>')
+            archive.writestr(f"xl/worksheets/_rels/sheet{n}.xml.rels",
+                             relationships([("rId1", DRAWING_REL, f"../drawings/drawing{n}.xml")]))
+            pictures = "".join(
+                f'<xdr:twoCellAnchor><xdr:pic><xdr:blipFill><a:blip r:embed="rId{i}"/></xdr:blipFill></xdr:pic></xdr:twoCellAnchor>'
+                for i in range(1, images + 1))
+            archive.writestr(f"xl/drawings/drawing{n}.xml",
+                             '<?xml version="1.0" encoding="UTF-8"?><xdr:wsDr xmlns:xdr="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing" '
+                             f'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" xmlns:r="{REL_NS}">{pictures}</xdr:wsDr>')
+            archive.writestr(f"xl/drawings/_rels/drawing{n}.xml.rels", relationships(
+                [(f"rId{i}", IMAGE_REL, f"../media/image{i}.png") for i in range(1, images + 1)]))
+
+        for i in range(1, images + 1):
+            # Random bytes behind a png signature; only the size matters here
+            archive.writestr(f"xl/media/image{i}.png", b"\x89PNG\r\n\x1a\n" + os.urandom(image_bytes), ZIP_STORED)
+
+
+def io_counters():
+    try:
+        with open("/proc/self/io") as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--image-mb", type=float, default=4)
+    parser.add_argument("--sheets", type=int, default=5)
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.src))
+    import xlsxConverter
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        workbook = os.path.join(work_dir, "images.xlsx")
+        make_workbook(workbook, args.images, int(args.image_mb * 1024 * 1024), args.sheets)
+        output_dir = os.path.join(work_dir, "extracted_images")
+
+        before = io_counters()
+        tracemalloc.start()
+        start = time.perf_counter()
+        images = xlsxConverter.extract_images_from_xlsx(workbook, output_dir)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        after = io_counters()
+
+        print(f"{sum(len(names) for names in images.values())} image references, "
+              f"{len(os.listdir(output_dir))} files written in {seconds:.2f}s")
+        print(f"peak traced memory: {peak / 1024 ** 2:.1f} MB")
+        if before and after:
+            print(f"read: {(after[0] - before[0]) / 1024 ** 2:.1f} MB, written: {(after[1] - before[1]) / 1024 ** 2:.1f} MB")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Converts documents held in memory, for programs that embed the converter:
+#
+#     content, media = api.convert(request_body, name="spec.docx")
+#
+# Nothing is written to, or read from, the working directory, so any number
+# of conversions, even of documents with the same name, can run at once in
+# threads of one process.
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import converters
+import formatting
+import pandoc
+
+
+def convert(source, name="document", native_docx=False, image_jobs=None, streaming=None, output_dir=None):
+    """
+    Converts a .docx or .xlsx to AsciiDoc in memory. The result is the same
+    as main_no_gui.py writes for a file of that name, except that the image
+    links of a workbook point to extracted_images/ next to the AsciiDoc
+    rather than to <name>/extracted_images/.
+
+        Args:
+            source (bytes or file): The document, as bytes or a binary file.
+            name (str): Name of the document; its stem names the output
+                file, and pandoc's line wrapping depends on the image paths
+                built from it.
+            native_docx (bool): Try docxConverter before pandoc.
+            image_jobs (int): Threads converting docx images, defaults to the
+                CPU count.
+            streaming (bool): Read workbook sheets a chunk of rows at a time,
+                by default for workbooks over 50 MB.
+            output_dir (str): When given, the AsciiDoc is also written to
+                <output_dir>/<stem>.adoc, with the media next to it.
+        Returns:
+            tuple: (AsciiDoc, dict of media path relative to the AsciiDoc,
+                    as the links give it -> image bytes). emf and wmf
+                    images are converted to png.
+        Raises:
+            ValueError: The source is neither a docx nor an xlsx.
+    """
+    data = source if isinstance(source, (bytes, bytearray)) else source.read()
+    stem = os.path.splitext(os.path.basename(name))[0] or "document"
+
+    file_type = converters.detect_type(io.BytesIO(data))
+    if file_type == "docx":
+        content, media = convert_docx(data, stem, native_docx, image_jobs)
+    elif file_type == "xlsx":
+        import xlsxConverter
+        content, media = xlsxConverter.convert_xlsx_in_memory(io.BytesIO(data), streaming=streaming)
+    else:
+        raise ValueError(f"{name} is not a docx or xlsx file")
+
+    if output_dir is not None:
+        write_files(output_dir, stem, content, media)
+    return content, media
+
+
+def convert_docx(data, stem, native_docx=False, image_jobs=None):
+    """
+    Text and media of a docx, the images being converted while pandoc runs.
+    """
+    import imageConverter
+    # pandoc writes the links with the prefix the CLI's media folder has;
+    # formatting then makes them relative to the AsciiDoc, as for the CLI
+    media_folder = f"{stem}/extracted_media/"
+    with ThreadPoolExecutor(max_workers=1) as media_executor:
+        media_done = media_executor.submit(imageConverter.read_docx_media, io.BytesIO(data), image_jobs)
+        content = None
+        if native_docx:
+            import docxConverter
+            content = docxConverter.convert_docx_to_adoc(io.BytesIO(data), media_folder)
+        if content is None:
+            content = pandoc.read_pandoc_bytes(media_folder, data)
+        content = formatting.format_content(content, stem)
+        media = {f"extracted_media/media/{filename}": image for filename, image in media_done.result().items()}
+    return content, media
+
+
+def write_files(output_dir, stem, content, media):
+    logging.info(f"Writing {stem}.adoc and {len(media)} media files to {output_dir}")
+    for path, image in media.items():
+        image_path = os.path.join(output_dir, path)
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        with open(image_path, "wb") as file:
+            file.write(image)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, f"{stem}.adoc"), 'w', encoding="utf-8") as file:
+        file.write(content)
@@ -0,0 +1,111 @@
+import os
+import shutil
+import hashlib
+import threading
+
+# Directory of the shared asset store, None when every document keeps its
+# own copy of its media. Set with configure().
+STORE_DIR = None
+
+# Block size for copying assets from zip members
+COPY_BUFFER_BYTES = 1024 * 1024
+
+
+def configure(store_dir):
+    global STORE_DIR
+    STORE_DIR = store_dir
+
+
+def write_asset(data, target_path, render=None):
+    """
+    Writes a media file for a document. With a store configured, the file is
+    created once under the hash of its source data and target_path is linked
+    to it, so an image used by many documents is stored and converted once.
+
+        Args:
+            data (bytes): Source bytes of the image.
+            target_path (str): Where the document expects the file.
+            render (callable): Called as render(data, path) to write a
+                converted file instead of data itself, e.g. an emf as png.
+    """
+    if STORE_DIR is None:
+        write_file(data, target_path, render)
+        return
+
+    # The target's extension is part of the name, so a converted png and the
+    # raw bytes of the same source never share an entry
+    digest = hashlib.sha256(data).hexdigest()
+    extension = os.path.splitext(target_path)[1].lower()
+    store_path = os.path.join(STORE_DIR, digest[:2], digest + extension)
+
+    if not os.path.exists(store_path):
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        temp_path = f"{store_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            write_file(data, temp_path, render)
+            os.replace(temp_path, store_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    link_file(store_path, target_path)
+
+
+def copy_asset(source, target_path):
+    """
+    Same as write_asset for a file object, copied in blocks so an image is
+    never held in memory as a whole. With a store configured, the copy is
+    hashed on the way and renamed into the store.
+
+        Args:
+            source (file): Binary file positioned at the image's first byte.
+            target_path (str): Where the document expects the file.
+    """
+    if STORE_DIR is None:
+        with open(target_path, "wb") as output:
+            shutil.copyfileobj(source, output, COPY_BUFFER_BYTES)
+        return
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    temp_path = os.path.join(STORE_DIR, f"copy-{os.getpid()}-{threading.get_ident()}.tmp")
+    digest = hashlib.sha256()
+    try:
+        with open(temp_path, "wb") as output:
+            for block in iter(lambda: source.read(COPY_BUFFER_BYTES), b""):
+                digest.update(block)
+                output.write(block)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(target_path)[1].lower()
+        store_path = os.path.join(STORE_DIR, digest[:2], digest + extension)
+        if not os.path.exists(store_path):
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+            os.replace(temp_path, store_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    link_file(store_path, target_path)
+
+
+def write_file(data, path, render=None):
+    if render:
+        render(data, path)
+    else:
+        with open(path, "wb") as file:
+            file.write(data)
+
+
+def link_file(store_path, target_path):
+    """
+    Points target_path at a stored asset: a hardlink, else a symlink, else
+    a copy.
+    """
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(store_path, target_path)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(store_path), target_path)
+        except OSError:
+            shutil.copyfile(store_path, target_path)
@@ -0,0 +1,248 @@
+import os
+import sys
+import shutil
+import hashlib
+import logging
+import functools
+import importlib.util
+import contextlib
+import threading
+import assetStore
+
+# Where stage results are kept, None when caching is off. Set with configure().
+CACHE_DIR = None
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".docConvertion_cache")
+
+# Bump when the layout of cache entries changes
+CACHE_FORMAT_VERSION = "1"
+
+# Lookups in this process since the last take_stats()
+hits = 0
+misses = 0
+stats_lock = threading.Lock()
+
+# Per-thread [hits, misses] counted instead, see counting_to()
+local = threading.local()
+
+
+def configure(cache_dir, max_mb=None):
+    """
+    Turns the stage cache on, or off when cache_dir is None.
+
+        Args:
+            cache_dir (str): Directory holding the cache entries.
+            max_mb (int): Size the cache is trimmed to after each store, in MB.
+    """
+    global CACHE_DIR, MAX_CACHE_BYTES
+    CACHE_DIR = cache_dir
+    if max_mb is not None:
+        MAX_CACHE_BYTES = max_mb * 1024 * 1024
+
+
+def clear(cache_dir):
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+        logging.info(f"Cleared cache {cache_dir}")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def source_hash(module):
+    """
+    Hash of a module's source, used in stage keys so that changing the code
+    of a stage only invalidates that stage's results. module may be given by
+    name, which finds its source without importing it (and its heavy
+    dependencies) just to look up a cached result.
+    """
+    name = module if isinstance(module, str) else module.__name__
+    try:
+        if isinstance(module, str):
+            return file_hash(importlib.util.find_spec(module).origin)
+        return file_hash(module.__file__)
+    except (AttributeError, TypeError, OSError):
+        # Frozen executable: use the executable itself
+        stat = os.stat(sys.executable)
+        return f"{name}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def stage_key(input_hash, stage, *settings):
+    """
+    Key for one stage of one input: the input's content hash, the stage name
+    and every setting that changes the stage's result.
+    """
+    key = "\0".join(map(str, [CACHE_FORMAT_VERSION, input_hash, stage, *settings]))
+    return f"{stage}-{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def lookup(key):
+    """
+    Returns the path of the cache entry for key, or None on a miss.
+    """
+    if CACHE_DIR is None:
+        return None
+
+    entry = os.path.join(CACHE_DIR, key)
+    if not os.path.isdir(entry):
+        count_lookup(hit=False)
+        return None
+
+    count_lookup(hit=True)
+    try:
+        # The entry's mtime is its last use, for LRU eviction
+        os.utime(entry)
+    except OSError:
+        pass
+    return entry
+
+
+def count_lookup(hit):
+    global hits, misses
+    stats = getattr(local, "stats", None)
+    if stats is not None:
+        stats[0 if hit else 1] += 1
+        return
+    # Docx media is looked up in a background thread
+    with stats_lock:
+        if hit:
+            hits += 1
+        else:
+            misses += 1
+
+
+def read_text(entry):
+    with open(os.path.join(entry, "text"), "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def text_path(entry):
+    return os.path.join(entry, "text")
+
+
+def link_or_copy(source, target):
+    """
+    copytree() copy function keeping the asset store's sharing: with a
+    store configured, a file hardlinked from it is linked rather than
+    copied, so neither a cache entry nor a restored media folder holds
+    another copy of it. Other files, which may later be rewritten in
+    place, are copied. An existing target is removed first, so a linked
+    file is never written through.
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+    if assetStore.STORE_DIR is not None and os.stat(source).st_nlink > 1:
+        try:
+            os.link(source, target)
+            return target
+        except OSError:
+            pass
+    return shutil.copy2(source, target)
+
+
+def restore_files(entry, target_dir):
+    files = os.path.join(entry, "files")
+    if os.path.isdir(files):
+        shutil.copytree(files, target_dir, copy_function=link_or_copy, dirs_exist_ok=True)
+
+
+def store(key, text=None, text_file=None, files_dir=None):
+    """
+    Saves a stage result. The entry is built in a temporary directory and
+    renamed into place, so concurrent workers never see half an entry.
+
+        Args:
+            key (str): Key from stage_key().
+            text (str): Text result of the stage.
+            text_file (str): File holding the text result, instead of text.
+            files_dir (str): Directory whose files are part of the result.
+    """
+    if CACHE_DIR is None:
+        return
+
+    entry = os.path.join(CACHE_DIR, key)
+    temp_entry = os.path.join(CACHE_DIR, f"tmp-{os.getpid()}-{key}")
+    try:
+        shutil.rmtree(temp_entry, ignore_errors=True)
+        os.makedirs(temp_entry)
+        if text is not None:
+            with open(os.path.join(temp_entry, "text"), "w", encoding="utf-8") as file:
+                file.write(text)
+        elif text_file is not None:
+            shutil.copyfile(text_file, os.path.join(temp_entry, "text"))
+        if files_dir is not None and os.path.isdir(files_dir):
+            shutil.copytree(files_dir, os.path.join(temp_entry, "files"), copy_function=link_or_copy)
+        os.replace(temp_entry, entry)
+    except OSError as e:
+        # Another worker stored the same entry first, or the disk is full
+        logging.warning(f"Could not store {key} in the cache: {e}")
+        shutil.rmtree(temp_entry, ignore_errors=True)
+        return
+
+    evict()
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def evict():
+    """
+    Removes least recently used entries until the cache fits MAX_CACHE_BYTES.
+    """
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith("tmp-") or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), directory_size(path), path))
+        except OSError:
+            pass
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= MAX_CACHE_BYTES:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logging.info(f"Evicted {os.path.basename(path)} from the cache")
+
+
+def take_stats():
+    """
+    Returns (hits, misses) since the last call and resets the counts.
+    """
+    global hits, misses
+    with stats_lock:
+        stats = (hits, misses)
+        hits = misses = 0
+    return stats
+
+
+@contextlib.contextmanager
+def counting_to(stats):
+    """
+    Counts the lookups this thread makes in stats, a [hits, misses] list,
+    rather than in the process-wide counts.
+    """
+    previous = getattr(local, "stats", None)
+    local.stats = stats
+    try:
+        yield
+    finally:
+        local.stats = previous
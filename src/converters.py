@@ -0,0 +1,52 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+CONTENT_TYPES_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+# Content type of the main part of each kind of package we convert. The
+# type is read from the package, so a renamed or oddly named file is still
+# recognised, and a file that only has ".docx" in its name is not.
+MAIN_CONTENT_TYPES = {
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml": "docx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml": "xlsx",
+}
+
+# File type -> function converting a file of that type. Converters import
+# their backend (pandas and openpyxl for xlsx, PIL for images) when they
+# first run, so a run only loads what its files need.
+CONVERTERS = {}
+
+
+def register(file_type, convert):
+    CONVERTERS[file_type] = convert
+
+
+def detect_type(path):
+    """
+    Detects what a file is from the content types of its zip package.
+
+        Args:
+            path (str or file): Path to the file, or the file opened in
+                binary mode.
+        Returns:
+            str: "docx" or "xlsx", or None if the file is neither.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            content_types = ET.fromstring(archive.read("[Content_Types].xml"))
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return None
+    for override in content_types.iter(f"{{{CONTENT_TYPES_NS}}}Override"):
+        file_type = MAIN_CONTENT_TYPES.get(override.get("ContentType"))
+        if file_type:
+            return file_type
+    return None
+
+
+def converter_for(path):
+    """
+    Returns (file type, converter) for path, or (None, None) if no converter
+    is registered for it.
+    """
+    file_type = detect_type(path)
+    return file_type, CONVERTERS.get(file_type)
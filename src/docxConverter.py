@@ -0,0 +1,952 @@
+import re
+import math
+import operator
+import functools
+import logging
+import posixpath
+import unicodedata
+from fractions import Fraction
+from zipfile import ZipFile
+import xml.etree.ElementTree as ET
+
+# Native docx reader for the documents that are only headings, paragraphs,
+# bold/italic text, lists, simple tables and inline images. It writes the
+# same AsciiDoc pandoc would (pandoc 3's docx reader and asciidoc writer,
+# including its line wrapping), so formatting works unchanged. Anything it
+# has not been checked against pandoc for raises Unsupported and the caller
+# runs pandoc for that document instead.
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+WP_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+PIC_NS = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+OFFICE_DOCUMENT_REL = REL_NS + "/officeDocument"
+IMAGE_REL = REL_NS + "/image"
+
+# pandoc's --columns default
+LINE_WIDTH = 72
+# Twentieths of a point
+TABLE_WIDTH = 9360
+EMU_PER_INCH = 914400
+PIXELS_PER_INCH = 96
+
+# Paragraph styles read as plain paragraphs, besides headings. Others (Title,
+# Quote, Caption, code styles...) become something else in pandoc.
+PLAIN_STYLES = {"normal", "body text", "list paragraph"}
+LIST_STYLE_PATTERN = re.compile(r"list (bullet|number)( [2-9])?")
+HEADING_STYLE_PATTERN = re.compile(r"heading ([1-9])")
+
+LIST_STYLES = {
+    "decimal": "arabic",
+    "lowerLetter": "loweralpha",
+    "upperLetter": "upperalpha",
+    "lowerRoman": "lowerroman",
+    "upperRoman": "upperroman",
+}
+
+# Properties that do not change pandoc's output
+IGNORED_PARAGRAPH_PROPERTIES = {
+    "pStyle", "numPr", "ind", "rPr", "spacing", "jc", "keepNext", "keepLines", "widowControl",
+    "contextualSpacing", "pageBreakBefore", "tabs", "snapToGrid", "adjustRightInd", "autoSpaceDE",
+    "autoSpaceDN", "textAlignment", "suppressAutoHyphens", "kinsoku", "wordWrap", "overflowPunct",
+    "topLinePunct", "suppressLineNumbers",
+}
+IGNORED_RUN_PROPERTIES = {"b", "bCs", "i", "iCs", "rFonts", "sz", "szCs", "color", "lang", "noProof", "kern",
+                          "spacing", "w"}
+IGNORED_TABLE_PROPERTIES = {"tblStyle", "tblW", "tblLook", "tblLayout", "tblBorders", "tblCellMar", "jc",
+                            "tblInd", "tblCellSpacing"}
+IGNORED_ROW_PROPERTIES = {"trHeight", "cantSplit", "jc"}
+IGNORED_CELL_PROPERTIES = {"tcW", "vAlign", "shd", "tcBorders", "tcMar", "noWrap"}
+# Run properties that make a whole paragraph style something pandoc renders
+STYLE_RUN_PROPERTIES = {"b", "i", "u", "strike", "dstrike", "caps", "smallCaps", "vanish", "vertAlign",
+                        "highlight", "rStyle"}
+
+# Characters pandoc's asciidoc writer escapes, as ++run++; "+" becomes {plus}
+ESCAPE_PATTERN = re.compile(r"[*_`#\[\]{<>\\|]+|\+")
+TABLE_ESCAPE_PATTERN = re.compile(r"[*_`#\[\]{<>\\]+|\+|\|")
+SPACE_PATTERN = re.compile(r"[ \t]+")
+
+# Inline kinds, mirroring pandoc's
+STR, SPACE, LINE_BREAK, STRONG, EMPH, IMAGE = "Str", "Space", "LineBreak", "Strong", "Emph", "Image"
+SPACE_INLINE = (SPACE,)
+LINE_BREAK_INLINE = (LINE_BREAK,)
+
+# Layout tokens between rendered text: a space the line may break at, and a
+# forced line break
+BREAK = object()
+NEWLINE = object()
+
+
+class Unsupported(Exception):
+    """The document uses something the native reader does not handle."""
+
+
+def w(tag):
+    return f"{{{W_NS}}}{tag}"
+
+
+def local_name(element):
+    namespace, _, name = element.tag[1:].partition("}")
+    if namespace != W_NS:
+        raise Unsupported(f"element {element.tag}")
+    return name
+
+
+def on_off(element):
+    return element is not None and element.get(w("val"), "true") not in ("0", "false", "off")
+
+
+def read_relationships(archive, part):
+    """
+    Reads the relationships of a package part.
+
+        Returns:
+            dict: relationship id -> (type, target, target mode)
+    """
+    rels_part = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    if rels_part not in archive.NameToInfo:
+        return {}
+    root = ET.fromstring(archive.read(rels_part))
+    return {rel.get("Id"): (rel.get("Type"), rel.get("Target"), rel.get("TargetMode"))
+            for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship")}
+
+
+def document_part(archive):
+    for kind, target, _ in read_relationships(archive, "").values():
+        if kind == OFFICE_DOCUMENT_REL:
+            return target.lstrip("/")
+    raise Unsupported("no main document part")
+
+
+# --- styles and numbering ---
+
+def read_styles(archive):
+    """
+    Reads the paragraph styles the document uses.
+
+        Returns:
+            tuple: ({style id: style dict}, default paragraph style id)
+    """
+    styles, default = {}, None
+    if "word/styles.xml" not in archive.NameToInfo:
+        return styles, default
+    root = ET.fromstring(archive.read("word/styles.xml"))
+
+    defaults = root.find(f"{w('docDefaults')}/{w('rPrDefault')}/{w('rPr')}")
+    if defaults is not None and any(local_name(child) in STYLE_RUN_PROPERTIES for child in defaults):
+        raise Unsupported("formatted default run properties")
+
+    for style in root.iter(w("style")):
+        if style.get(w("type")) != "paragraph":
+            continue
+        style_id = style.get(w("styleId"))
+        name = style.find(w("name"))
+        based_on = style.find(w("basedOn"))
+        num_pr = style.find(f"{w('pPr')}/{w('numPr')}")
+        ind = style.find(f"{w('pPr')}/{w('ind')}")
+        run_pr = style.find(w("rPr"))
+        styles[style_id] = {
+            "name": (name.get(w("val")) if name is not None else style_id).lower(),
+            "based_on": based_on.get(w("val")) if based_on is not None else None,
+            "numbering": read_num_pr(num_pr) if num_pr is not None else None,
+            "indented": ind is not None and indented(ind),
+            "formatted": run_pr is not None and any(local_name(child) in STYLE_RUN_PROPERTIES
+                                                    for child in run_pr),
+        }
+        if style.get(w("default")) in ("1", "true"):
+            default = style_id
+    return styles, default
+
+
+def style_chain(styles, style_id):
+    seen = []
+    while style_id in styles and style_id not in seen:
+        seen.append(style_id)
+        style_id = styles[style_id]["based_on"]
+    return [styles[style_id] for style_id in seen]
+
+
+def read_num_pr(num_pr):
+    num_id = num_pr.find(w("numId"))
+    ilvl = num_pr.find(w("ilvl"))
+    return (num_id.get(w("val")) if num_id is not None else None,
+            int(ilvl.get(w("val"))) if ilvl is not None else None)
+
+
+def indented(ind):
+    return any(ind.get(w(side), "0") != "0" for side in ("left", "start", "right", "end", "hanging"))
+
+
+def read_numbering(archive):
+    """
+    Reads the list definitions.
+
+        Returns:
+            dict: numId -> {level: (list style or None for bullets, start)}
+    """
+    if "word/numbering.xml" not in archive.NameToInfo:
+        return {}
+    root = ET.fromstring(archive.read("word/numbering.xml"))
+
+    abstract = {}
+    for definition in root.iter(w("abstractNum")):
+        levels = {}
+        for level in definition.iter(w("lvl")):
+            num_fmt = level.find(w("numFmt"))
+            start = level.find(w("start"))
+            num_fmt = num_fmt.get(w("val")) if num_fmt is not None else "decimal"
+            if num_fmt != "bullet" and num_fmt not in LIST_STYLES:
+                # Formats pandoc maps to its default style, or drops
+                levels[int(level.get(w("ilvl")))] = None
+                continue
+            levels[int(level.get(w("ilvl")))] = (LIST_STYLES.get(num_fmt),
+                                                  int(start.get(w("val"))) if start is not None else 1)
+        abstract[definition.get(w("abstractNumId"))] = levels
+
+    numbering, used = {}, set()
+    for num in root.iter(w("num")):
+        abstract_id = num.find(w("abstractNumId")).get(w("val"))
+        if num.find(w("lvlOverride")) is not None or abstract_id in used:
+            # Restarted or shared definitions are counted differently by pandoc
+            numbering[num.get(w("numId"))] = None
+            continue
+        used.add(abstract_id)
+        numbering[num.get(w("numId"))] = abstract.get(abstract_id)
+    return numbering
+
+
+# --- pandoc's inline model ---
+
+def append_inline(inlines, inline):
+    """
+    Appends an inline, merging it with the last one as pandoc's builder
+    does.
+    """
+    if not inlines:
+        inlines.append(inline)
+        return
+    last = inlines[-1]
+    kinds = (last[0], inline[0])
+    if kinds in ((SPACE, SPACE), (LINE_BREAK, SPACE)):
+        return
+    if kinds == (SPACE, LINE_BREAK):
+        inlines[-1] = inline
+    elif kinds == (STR, STR):
+        inlines[-1] = (STR, last[1] + inline[1])
+    elif kinds in ((STRONG, STRONG), (EMPH, EMPH)):
+        inlines[-1] = (last[0], concat(last[1], inline[1]))
+    else:
+        inlines.append(inline)
+
+
+def concat(*parts):
+    inlines = []
+    for part in parts:
+        if part:
+            append_inline(inlines, part[0])
+            inlines.extend(part[1:])
+    return inlines
+
+
+def text_inlines(text):
+    """Splits text into words and spaces, as pandoc's text builder does."""
+    pieces = []
+    position = 0
+    for match in SPACE_PATTERN.finditer(text):
+        if match.start() > position:
+            pieces.append((STR, text[position:match.start()]))
+        pieces.append(SPACE_INLINE)
+        position = match.end()
+    if position < len(text):
+        pieces.append((STR, text[position:]))
+    return pieces
+
+
+def unstack(inlines):
+    modifiers = []
+    while len(inlines) == 1 and inlines[0][0] in (STRONG, EMPH):
+        modifiers.append(inlines[0][0])
+        inlines = inlines[0][1]
+    return modifiers, inlines
+
+
+def stack(modifiers, inlines):
+    if not inlines:
+        return []
+    for modifier in reversed(modifiers):
+        inlines = [(modifier, inlines)]
+    return inlines
+
+
+def trim_spaces(inlines):
+    start, end = 0, len(inlines)
+    while start < end and inlines[start][0] == SPACE:
+        start += 1
+    while end > start and inlines[end - 1][0] == SPACE:
+        end -= 1
+    return inlines[start:end]
+
+
+def space_out(inlines):
+    modifiers, inner = unstack(inlines)
+    left = [SPACE_INLINE] if inner and inner[0][0] == SPACE else []
+    right = [SPACE_INLINE] if inner and inner[-1][0] == SPACE else []
+    return left, stack(modifiers, trim_spaces(inner)), right
+
+
+def space_out_left(inlines):
+    left, middle, right = space_out(inlines)
+    modifiers, inner = unstack(middle)
+    return left, stack(modifiers, concat(inner, right))
+
+
+def space_out_right(inlines):
+    left, middle, right = space_out(inlines)
+    modifiers, inner = unstack(middle)
+    return stack(modifiers, concat(left, inner)), right
+
+
+def remove_shared(modifiers, shared):
+    remaining = list(modifiers)
+    for modifier in shared:
+        if modifier in remaining:
+            remaining.remove(modifier)
+    return remaining
+
+
+def combine(x, y):
+    """
+    Joins the inlines of two runs the way pandoc's docx reader does, so
+    that formatting they share is applied once around both.
+    """
+    return concat(x[:-1], combine_single(x[-1:], y[:1]), y[1:])
+
+
+def combine_single(x, y):
+    x_modifiers, x_inner = unstack(x)
+    y_modifiers, y_inner = unstack(y)
+    shared = [modifier for modifier in x_modifiers if modifier in y_modifiers]
+    if shared:
+        return stack(shared, combine(stack(remove_shared(x_modifiers, shared), x_inner),
+                                     stack(remove_shared(y_modifiers, shared), y_inner)))
+    if not x_inner and not y_inner:
+        return []
+    if not x_inner:
+        return concat(*space_out_left(y))
+    if not y_inner:
+        return concat(*space_out_right(x))
+    return concat(*space_out_right(x), *space_out_left(y))
+
+
+def paragraph_inlines(runs, trim=True):
+    """
+    pandoc's inlines for a paragraph, from the inlines of each of its runs:
+    runs combined, and line breaks and (unless trim is False, as for
+    headings) spaces at either end dropped.
+    """
+    inlines = []
+    for run in runs:
+        inlines = combine(inlines, run)
+    start, end = 0, len(inlines)
+    while start < end and (inlines[start][0] == LINE_BREAK or trim and inlines[start][0] == SPACE):
+        start += 1
+    while end > start and inlines[end - 1][0] in (LINE_BREAK, SPACE):
+        end -= 1
+    return inlines[start:end]
+
+
+def contains(inlines, kind):
+    return any(inline[0] == kind or inline[0] in (STRONG, EMPH) and contains(inline[1], kind)
+               for inline in inlines)
+
+
+# --- reading document.xml ---
+
+def check_children(element, allowed):
+    for child in element:
+        if local_name(child) not in allowed:
+            raise Unsupported(f"{local_name(element)} property {local_name(child)}")
+
+
+def check_text(text):
+    for character in text:
+        if (character in "\r\n" or unicodedata.combining(character)
+                or unicodedata.east_asian_width(character) in ("W", "F")
+                or unicodedata.category(character) in ("Cc", "Cf", "Cs", "Co", "Cn", "Zl", "Zp")):
+            # Line endings are soft breaks in pandoc, and the others do not
+            # take one column in its line wrapping
+            raise Unsupported(f"character {character!r}")
+
+
+def read_run(run, context):
+    """
+    The inlines of one w:r, with its bold and italic applied.
+    """
+    modifiers = []
+    inlines = []
+    for child in run:
+        name = local_name(child)
+        if name == "rPr":
+            check_children(child, IGNORED_RUN_PROPERTIES)
+            bold, italic = on_off(child.find(w("b"))), on_off(child.find(w("i")))
+            if on_off(child.find(w("bCs"))) and not bold or on_off(child.find(w("iCs"))) and not italic:
+                raise Unsupported("complex script formatting")
+            modifiers = ([STRONG] if bold else []) + ([EMPH] if italic else [])
+        elif name == "t":
+            text = child.text or ""
+            check_text(text)
+            inlines = concat(inlines, text_inlines(text))
+        elif name == "tab":
+            inlines = concat(inlines, [SPACE_INLINE])
+        elif name == "br":
+            if child.get(w("type"), "textWrapping") not in ("textWrapping", "page"):
+                raise Unsupported("column break")
+            inlines = concat(inlines, [LINE_BREAK_INLINE])
+        elif name == "drawing":
+            inlines = concat(inlines, [read_drawing(child, context)])
+        elif name != "lastRenderedPageBreak":
+            raise Unsupported(f"run content {name}")
+    # Unlike stack(), an empty run still gets its (empty) formatting
+    for modifier in reversed(modifiers):
+        inlines = [(modifier, inlines)]
+    return inlines
+
+
+def read_drawing(drawing, context):
+    inline = drawing.find(f"{{{WP_NS}}}inline")
+    if len(drawing) != 1 or inline is None:
+        raise Unsupported("floating drawing")
+    extent = inline.find(f"{{{WP_NS}}}extent")
+    properties = inline.find(f"{{{WP_NS}}}docPr")
+    graphic_data = inline.find(f"{{{A_NS}}}graphic/{{{A_NS}}}graphicData")
+    if extent is None or properties is None or graphic_data is None or graphic_data.get("uri") != PIC_NS:
+        raise Unsupported("drawing that is not a picture")
+    blip = graphic_data.find(f"{{{PIC_NS}}}pic/{{{PIC_NS}}}blipFill/{{{A_NS}}}blip")
+    if blip is None or blip.get(f"{{{REL_NS}}}link") or properties.get("title"):
+        raise Unsupported("linked or titled picture")
+    kind, target, mode = context["relationships"].get(blip.get(f"{{{REL_NS}}}embed"), (None, None, None))
+    if kind != IMAGE_REL or mode == "External" or not target.startswith("media/") or ".." in target:
+        raise Unsupported(f"picture target {target}")
+
+    source = context["media_folder"] + target
+    description = properties.get("descr")
+    if description:
+        check_text(description)
+        if description != description.strip(" \t") or "  " in description or "\t" in description:
+            raise Unsupported("picture description spacing")
+        alt = text_inlines(description)
+    else:
+        alt = [(STR, posixpath.splitext(source)[0])]
+
+    width, height = int(extent.get("cx")), int(extent.get("cy"))
+    if width <= 0 or height <= 0:
+        raise Unsupported("empty picture")
+    return (IMAGE, alt, source, pixels(width), pixels(height))
+
+
+def pixels(emu):
+    # pandoc keeps the size in inches as a double and floors it in pixels
+    value = math.floor(PIXELS_PER_INCH * (emu / EMU_PER_INCH))
+    if value != math.floor(Fraction(emu * PIXELS_PER_INCH, EMU_PER_INCH)):
+        raise Unsupported("picture size at a rounding edge")
+    return value
+
+
+def read_paragraph(paragraph, context):
+    """
+    Reads one w:p.
+
+        Returns:
+            tuple: (kind, inlines, heading level or list numbering)
+    """
+    styles = context["styles"]
+    style_id, numbering, direct_ind = context["default_style"], None, None
+    runs = []
+    for child in paragraph:
+        name = local_name(child)
+        if name == "pPr":
+            check_children(child, IGNORED_PARAGRAPH_PROPERTIES)
+            style = child.find(w("pStyle"))
+            if style is not None:
+                style_id = style.get(w("val"))
+            num_pr = child.find(w("numPr"))
+            if num_pr is not None:
+                numbering = read_num_pr(num_pr)
+            direct_ind = child.find(w("ind"))
+            mark = child.find(w("rPr"))
+            if mark is not None and any(local_name(prop) in ("ins", "del", "moveFrom", "moveTo") for prop in mark):
+                raise Unsupported("tracked paragraph mark")
+        elif name == "r":
+            runs.append(read_run(child, context))
+        elif name not in ("proofErr", "bookmarkStart", "bookmarkEnd"):
+            raise Unsupported(f"paragraph content {name}")
+
+    chain = style_chain(styles, style_id)
+    name = chain[0]["name"] if chain else "normal"
+    heading = HEADING_STYLE_PATTERN.fullmatch(name)
+    style_numbering = next((style["numbering"] for style in chain if style["numbering"]), None)
+    if numbering is None:
+        numbering = style_numbering
+    elif numbering[0] is None and style_numbering:
+        numbering = (style_numbering[0], numbering[1])
+    if numbering is not None and numbering[0] is not None:
+        numbering = (numbering[0], numbering[1] or 0)
+        if numbering[0] == "0":
+            numbering = None
+        elif numbering[0] not in context["numbering"]:
+            raise Unsupported("unknown list")
+    else:
+        numbering = None
+
+    if not heading and name not in PLAIN_STYLES and not LIST_STYLE_PATTERN.fullmatch(name):
+        raise Unsupported(f"paragraph style {name}")
+    if not heading and any(style["formatted"] for style in chain):
+        raise Unsupported(f"formatted paragraph style {name}")
+    if numbering is None and (direct_ind is not None and indented(direct_ind)
+                              or name != "list paragraph" and any(style["indented"] for style in chain)):
+        # Indented paragraphs are block quotes in pandoc
+        raise Unsupported("indented paragraph")
+
+    inlines = paragraph_inlines(runs, trim=not heading)
+    if heading:
+        if numbering or not trim_spaces(inlines) or contains(inlines, LINE_BREAK) or contains(inlines, IMAGE):
+            raise Unsupported("numbered, empty or multi-line heading")
+        return "heading", inlines, int(heading.group(1))
+    if numbering:
+        if not inlines:
+            raise Unsupported("empty list item")
+        return "item", inlines, numbering
+    return "paragraph", inlines, None
+
+
+def read_table(table, context):
+    grid, rows, header = [], [], None
+    for child in table:
+        name = local_name(child)
+        if name == "tblPr":
+            check_children(child, IGNORED_TABLE_PROPERTIES)
+            look = child.find(w("tblLook"))
+            if look is None:
+                raise Unsupported("table without tblLook")
+            first_row = look.get(w("firstRow"))
+            header = on_off_value(first_row) if first_row is not None else bool(int(look.get(w("val"), "0"), 16) & 0x20)
+        elif name == "tblGrid":
+            grid = [int(column.get(w("w"))) for column in child.iter(w("gridCol"))]
+        elif name == "tr":
+            rows.append(read_row(child, context))
+        else:
+            raise Unsupported(f"table content {name}")
+    if not grid or not rows or header is None or any(len(row) != len(grid) for row in rows):
+        raise Unsupported("irregular table")
+    if header and all(not cell for cell in rows[0]):
+        raise Unsupported("empty header row")
+    return "table", rows, (grid, header)
+
+
+def on_off_value(value):
+    return value not in ("0", "false", "off")
+
+
+def read_row(row, context):
+    cells = []
+    for child in row:
+        name = local_name(child)
+        if name == "trPr":
+            check_children(child, IGNORED_ROW_PROPERTIES)
+        elif name == "tc":
+            cells.append(read_cell(child, context))
+        else:
+            raise Unsupported(f"row content {name}")
+    return cells
+
+
+def read_cell(cell, context):
+    paragraphs = []
+    for child in cell:
+        name = local_name(child)
+        if name == "tcPr":
+            check_children(child, IGNORED_CELL_PROPERTIES)
+        elif name == "p":
+            paragraphs.append(read_paragraph(child, context))
+        else:
+            raise Unsupported(f"cell content {name}")
+    paragraphs = [paragraph for paragraph in paragraphs if paragraph[1]]
+    if len(paragraphs) > 1 or paragraphs and paragraphs[0][0] != "paragraph":
+        raise Unsupported("cell with several paragraphs, a list or a heading")
+    if paragraphs and (contains(paragraphs[0][1], LINE_BREAK) or contains(paragraphs[0][1], IMAGE)):
+        raise Unsupported("cell with a line break or picture")
+    return paragraphs[0][1] if paragraphs else []
+
+
+def read_blocks(archive, context):
+    """
+    Streams the document body, reading each top-level paragraph and table
+    as its end tag is parsed and then dropping it from the tree.
+
+        Returns:
+            list: blocks as (kind, content, heading level, list numbering or
+                  table layout)
+    """
+    blocks = []
+    depth, body = 0, None
+    with archive.open(context["part"]) as part:
+        for event, element in ET.iterparse(part, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2:
+                    if element.tag != w("body"):
+                        raise Unsupported(f"document content {element.tag}")
+                    body = element
+                continue
+            depth -= 1
+            if depth != 2:
+                continue
+            name = local_name(element)
+            if name == "p":
+                block = read_paragraph(element, context)
+                if block[1]:
+                    blocks.append(block)
+            elif name == "tbl":
+                blocks.append(read_table(element, context))
+            elif name not in ("sectPr", "bookmarkStart", "bookmarkEnd"):
+                raise Unsupported(f"body content {name}")
+            body.remove(element)
+    return blocks
+
+
+# --- writing AsciiDoc ---
+
+def escape(text, in_table=False):
+    def replace(match):
+        value = match.group(0)
+        if value == "+":
+            return "{plus}"
+        if value == "|" and in_table:
+            return "{vbar}"
+        return f"++{value}++"
+    return (TABLE_ESCAPE_PATTERN if in_table else ESCAPE_PATTERN).sub(replace, text)
+
+
+def is_spacy(inline, at_end):
+    if inline[0] in (SPACE, LINE_BREAK):
+        return True
+    if inline[0] == STR and inline[1]:
+        character = inline[1][-1 if at_end else 0]
+        return unicodedata.category(character).startswith("P") or character in " \t\n\r\f\v\xa0"
+    return False
+
+
+def render_inlines(inlines, in_table=False):
+    """
+    Renders inlines to layout tokens. Bold and italic use the doubled,
+    unconstrained markers when they touch a letter or digit, by the same
+    rule as pandoc.
+    """
+    tokens = []
+    position = 0
+    while position < len(inlines):
+        current = inlines[position]
+        following = inlines[position + 1] if position + 1 < len(inlines) else None
+        if following is None:
+            tokens += render_inline(current, False, in_table)
+            position += 1
+        elif not is_spacy(current, True):
+            tokens += render_inline(current, not is_spacy(following, False), in_table)
+            tokens += render_inline(following, True, in_table)
+            position += 2
+        elif not is_spacy(following, False):
+            tokens += render_inline(current, True, in_table)
+            position += 1
+        else:
+            tokens += render_inline(current, False, in_table)
+            position += 1
+    return tokens
+
+
+def render_inline(inline, intraword, in_table):
+    kind = inline[0]
+    if kind == STR:
+        return [escape(inline[1], in_table)]
+    if kind == SPACE:
+        return [BREAK]
+    if kind == LINE_BREAK:
+        return [" +", NEWLINE]
+    if kind == EMPH and len(inline[1]) == 1 and inline[1][0][0] == STRONG:
+        # pandoc writes emphasised bold as bold emphasis
+        inline = (STRONG, [(EMPH, inline[1][0][1])])
+        kind = STRONG
+    if kind in (STRONG, EMPH):
+        marker = ("*" if kind == STRONG else "_") * (2 if intraword else 1)
+        tokens = render_inlines(inline[1], in_table)
+        # Spaces at the edges go outside the markers
+        start, end = 0, len(tokens)
+        while start < end and tokens[start] is BREAK:
+            start += 1
+        while end > start and tokens[end - 1] is BREAK:
+            end -= 1
+        if start == end:
+            raise Unsupported("formatting around nothing but spaces")
+        return tokens[:start] + [marker] + tokens[start:end] + [marker] + tokens[end:]
+    _, alt, source, width, height = inline
+    return [f"image:{source}["] + render_inlines(alt, in_table) + [f",width={width},height={height}]"]
+
+
+def layout(tokens, wrap=True):
+    """
+    Lays tokens out in lines of at most LINE_WIDTH characters where
+    possible, breaking only at spaces.
+    """
+    lines, line, word, pending_space = [], "", "", False
+    for token in tokens + [NEWLINE]:
+        if isinstance(token, str):
+            word += token
+            continue
+        if word:
+            if pending_space and line:
+                if wrap and len(line) + 1 + len(word) > LINE_WIDTH:
+                    lines.append(line)
+                    line = word
+                else:
+                    line += " " + word
+            else:
+                line += word
+            word, pending_space = "", False
+        if token is BREAK:
+            pending_space = True
+        else:
+            lines.append(line)
+            line, pending_space = "", False
+    return "\n".join(lines)
+
+
+def unwrapped_width(tokens):
+    return max(len(line) for line in layout(tokens, wrap=False).split("\n"))
+
+
+ROMAN_PATTERN = "m*(?:cm)?d?(?:cd)?c*(?:xc)?l?(?:xl)?x*(?:ix)?v?(?:iv)?i*"
+MARKER_PATTERN = re.compile(
+    r"(?P<open>\()?(?:(?P<decimal>[0-9]{1,9})|(?P<example>@(?:[^\W_]|[_-][^\W_])*)"
+    r"|(?P<alpha>[a-zA-Z])|(?P<roman>" + ROMAN_PATTERN + "|" + ROMAN_PATTERN.upper() + r"))"
+    r"(?P<close>[.)])")
+
+
+def begins_with_list_marker(text):
+    """
+    pandoc's check for a paragraph that would read as an ordered list item,
+    on the first ten characters of the rendered text.
+    """
+    text = text[:10]
+    for match in MARKER_PATTERN.finditer(text):
+        if match.start() != 0:
+            break
+        body = match.group("decimal") or match.group("example") or match.group("alpha") or match.group("roman")
+        if not body:
+            continue
+        if match.group("open") and match.group("close") != ")":
+            continue
+        rest = text[match.end():]
+        upper_alpha = match.group("alpha") and body.isupper() and body not in "I"
+        if match.group("close") == "." and not match.group("open") and (upper_alpha or body in "IVXLCDM" and body.isupper()):
+            return rest[:2] in ("  ", " \t", "\t ", "\t\t")
+        return rest[:1] in (" ", "\t")
+    return False
+
+
+def render_paragraph(inlines):
+    tokens = render_inlines(inlines)
+    if begins_with_list_marker(layout(tokens, wrap=False)):
+        tokens = ["{empty}"] + tokens
+    return layout(tokens)
+
+
+def render_heading(inlines, level):
+    # Headings are not wrapped, and every space is kept as it is
+    tokens = render_inlines(inlines)
+    return "=" * (level + 1) + " " + "".join(" " if token is BREAK else token for token in tokens)
+
+
+def render_table(rows, grid, header):
+    # pandoc gives column widths as a share of a fixed 6.5in, less 10 twips
+    # between each pair of columns, scaled down when they add up to more.
+    # The floating point steps are the same as pandoc's, so the floors agree
+    if sum(grid) == 0:
+        raise Unsupported("table without column widths")
+    available = TABLE_WIDTH - 10 * (len(grid) - 1)
+    widths = [column / available for column in grid]
+    width_sum = functools.reduce(operator.add, widths, 0.0)
+    if width_sum > 1:
+        widths = [column / width_sum for column in widths]
+        width_sum = functools.reduce(operator.add, widths, 0.0)
+    width = math.floor(width_sum * 100)
+    columns = [math.floor(column / width_sum * 100) for column in widths]
+    if sum(columns) < 100:
+        columns[0] = 100 - sum(columns[1:])
+    options = 'options="header",' if header else ""
+    attributes = f'[width="{width}%",cols="{",".join(f"{column}%" if column else "" for column in columns)}",{options}]'
+
+    row_tokens = []
+    for row in rows:
+        tokens = []
+        for cell in row:
+            if tokens:
+                tokens.append(BREAK)
+            tokens += ["|"] + render_inlines(cell, in_table=True)
+        row_tokens.append(tokens)
+    separator = "\n\n" if max(unwrapped_width(tokens) for tokens in row_tokens) > LINE_WIDTH else "\n"
+    lines = [attributes, "|==="]
+    if header:
+        lines.append(layout(row_tokens[0]))
+        row_tokens = row_tokens[1:]
+    if row_tokens:
+        lines.append(separator.join(layout(tokens) for tokens in row_tokens))
+    lines.append("|===")
+    return "\n".join(lines)
+
+
+def number_items(items, numbering):
+    """
+    Numbers list paragraphs the way pandoc's docx reader does: a list level
+    picks up where it left off, and an item at a level restarts the deeper
+    levels of every list.
+
+        Returns:
+            list: (inlines, (list id, level), number) per item
+    """
+    last_numbers = {}
+    numbered = []
+    for inlines, (num_id, ilvl) in items:
+        definition = numbering[num_id]
+        if definition is None or ilvl not in definition or definition[ilvl] is None:
+            raise Unsupported("list level without a known format")
+        number = last_numbers[(num_id, ilvl)] + 1 if (num_id, ilvl) in last_numbers else definition[ilvl][1]
+        last_numbers = {key: value for key, value in last_numbers.items() if key[1] <= ilvl}
+        last_numbers[(num_id, ilvl)] = number
+        numbered.append((inlines, (num_id, ilvl), number))
+    return numbered
+
+
+def build_lists(items, numbering):
+    """
+    Nests a run of numbered list paragraphs the way pandoc's docx reader
+    does: an item deeper than the one before it starts a sub-list, and an
+    item at the same level with a different list id starts a new list.
+
+        Returns:
+            list: lists as (style or None for bullets, start, [(inlines, [sub-lists])])
+    """
+    lists = []
+    position = 0
+    while position < len(items):
+        _, (num_id, ilvl), first_number = items[position]
+        end = position + 1
+        while end < len(items) and (items[end][1][1] > ilvl
+                                    or items[end][1][1] == ilvl and items[end][1][0] == num_id):
+            end += 1
+        style = numbering[num_id][ilvl][0]
+
+        list_items = []
+        children = items[position:end]
+        index = 0
+        while index < len(children):
+            child_inlines, (_, child_level), _ = children[index]
+            if child_level == ilvl:
+                list_items.append((child_inlines, []))
+                index += 1
+                continue
+            nested_end = index
+            while nested_end < len(children) and children[nested_end][1][1] != ilvl:
+                nested_end += 1
+            if not list_items:
+                raise Unsupported("list starting below its first level")
+            list_items[-1][1].extend(build_lists(children[index:nested_end], numbering))
+            index = nested_end
+        lists.append((style, first_number, list_items))
+        position = end
+    return lists
+
+
+def render_list(rendered_list, bullet_depth=0, ordered_depth=0):
+    style, start, items = rendered_list
+    lines = []
+    if style:
+        lines.append(f"[{style}, start={start}]" if start != 1 else f"[{style}]")
+        marker = "." * (ordered_depth + 1)
+        ordered_depth += 1
+    else:
+        marker = "*" * (bullet_depth + 1)
+        bullet_depth += 1
+    for inlines, sub_lists in items:
+        tokens = render_inlines(inlines)
+        if begins_with_list_marker(layout(tokens, wrap=False)):
+            tokens = ["{empty}"] + tokens
+        lines.append(layout([marker + " "] + tokens))
+        for sub_list in sub_lists:
+            lines.append(render_list(sub_list, bullet_depth, ordered_depth))
+    return "\n".join(lines)
+
+
+def render_blocks(blocks, numbering):
+    rendered = []
+    numbers = iter(number_items([(block[1], block[2]) for block in blocks if block[0] == "item"], numbering))
+    position = 0
+    while position < len(blocks):
+        kind, content, extra = blocks[position]
+        if kind == "item":
+            end = position
+            while end < len(blocks) and blocks[end][0] == "item":
+                end += 1
+            items = [next(numbers) for _ in range(position, end)]
+            rendered += [render_list(rendered_list) for rendered_list in build_lists(items, numbering)]
+            position = end
+            continue
+        if kind == "paragraph":
+            rendered.append(render_paragraph(content))
+        elif kind == "heading":
+            rendered.append(render_heading(content, extra))
+        else:
+            rendered.append(render_table(content, *extra))
+        position += 1
+    return "\n\n".join(rendered) + "\n"
+
+
+def convert_docx_to_adoc(input_file, media_folder):
+    """
+    Converts a docx to AsciiDoc without pandoc, giving the same text pandoc
+    gives with the media folder filter.
+
+        Args:
+            input_file (str): Path to the docx file.
+            media_folder (str): Folder the image links point to.
+        Returns:
+            str: AsciiDoc, or None when the document uses something only
+                 pandoc handles.
+    """
+    try:
+        with ZipFile(input_file, "r") as archive:
+            part = document_part(archive)
+            if part != "word/document.xml":
+                raise Unsupported(f"main document part {part}")
+            styles, default_style = read_styles(archive)
+            numbering = read_numbering(archive)
+            context = {
+                "part": part,
+                "relationships": read_relationships(archive, part),
+                "styles": styles,
+                "default_style": default_style,
+                "numbering": numbering,
+                "media_folder": media_folder,
+            }
+            blocks = read_blocks(archive, context)
+        if not blocks:
+            raise Unsupported("empty document")
+        return render_blocks(blocks, numbering)
+    except Unsupported as e:
+        logging.info(f"Native docx reader does not handle {input_file} ({e}), using pandoc")
+        return None
+    except (KeyError, ValueError, TypeError, AttributeError, ET.ParseError) as e:
+        # Markup the reader did not expect, such as a missing optional
+        # attribute or a malformed part, is left to pandoc as well
+        logging.warning(f"Native docx reader failed on {input_file} ({type(e).__name__}: {e}), using pandoc")
+        return None
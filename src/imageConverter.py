@@ -1,26 +1,185 @@
 from PIL import Image
+import io
 import os
+import time
+import shutil
+import logging
+import posixpath
+from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+import assetStore
+import profiling
+import progress
 
-def convert_images_to_png(media_folder):
+# Leading bytes of the image formats found in docx/xlsx media folders
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"\xd7\xcd\xc6\x9a", "wmf"),  # placeable metafile
+    (b"\x01\x00\x09\x00", "wmf"),
+    (b"\x02\x00\x09\x00", "wmf"),
+]
+
+# Formats browsers can't show; their links are rewritten to .png by formatting
+CONVERT_FORMATS = {"emf", "wmf"}
+CONVERT_EXTENSIONS = {".emf", ".wmf"}
+
+
+def detect_header_format(header):
+    """
+    Detects an image's format from its first 64 bytes rather than its name.
+
+        Args:
+            header (bytes): Start of the image.
+        Returns:
+            str: Format name such as "png" or "emf", or None if unknown.
+    """
+    # EMF starts with an EMR_HEADER record that carries the " EMF" signature
+    if header[:4] == b"\x01\x00\x00\x00" and header[40:44] == b" EMF":
+        return "emf"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "webp"
+    if b"<svg" in header or header.lstrip().startswith(b"<?xml"):
+        return "svg"
+    return None
+
+
+def render_png(data, png_path):
+    with Image.open(io.BytesIO(data)) as img:
+        img.save(png_path, "PNG")
+
+
+def png_bytes(data):
+    output = io.BytesIO()
+    render_png(data, output)
+    return output.getvalue()
+
+
+def extract_media_file(archive, info, output_dir):
+    """
+    Writes one docx media part to output_dir. Parts that need converting are
+    converted in memory and only the png is written; others are streamed to
+    disk unchanged.
+
+        Returns:
+            str: "converted", "skipped" or "failed".
+    """
+    filename = os.path.basename(info.filename)
+    extension = os.path.splitext(filename)[1].lower()
+    file_path = os.path.join(output_dir, filename)
+    png_path = os.path.splitext(file_path)[0] + ".png"
+
+    with archive.open(info) as source:
+        header = source.read(64)
+        image_format = detect_header_format(header)
+        if image_format not in CONVERT_FORMATS and extension not in CONVERT_EXTENSIONS:
+            if assetStore.STORE_DIR is None:
+                with open(file_path, "wb") as output:
+                    output.write(header)
+                    shutil.copyfileobj(source, output)
+            else:
+                assetStore.write_asset(header + source.read(), file_path)
+            return "skipped"
+        data = header + source.read()
+
+    try:
+        # png data under an .emf/.wmf name only needs the .png name the link expects
+        assetStore.write_asset(data, png_path, None if image_format == "png" else render_png)
+        print(f"Converted: {filename} -> {os.path.basename(png_path)}")
+        return "converted"
+    except Exception as e:
+        print(f"Failed to convert {filename}: {e}")
+        # Keep the original, so the file the document names is still there
+        with open(file_path, "wb") as output:
+            output.write(data)
+        return "failed"
+
+
+def extract_docx_media(input_file, media_folder, workers=None):
     """
-    Converts all emf and wmf images in our media folder to png images
-    
+    Extracts the images of a docx straight from the zip into
+    <media_folder>/media, converting emf and wmf to png on the way. pandoc
+    no longer extracts the media, so this can run while pandoc converts
+    the text.
+
     Args:
+        input_file (str): Path to the docx file
         media_folder (str): Path to the folder
+        workers (int): Number of conversion threads, defaults to the CPU count
+    Returns:
+        dict: Number of converted, skipped and failed files and the seconds taken
     """
-    
-    if os.path.exists(f"{media_folder}/media") and os.listdir(f"{media_folder}/media"):
-        for filename in os.listdir(f"{media_folder}/media"):
-            if 'png' in filename.lower():
-                print('png file')
-            else:
-                file_path = os.path.join(f"{media_folder}/media", filename)
-                png_path = os.path.splitext(file_path)[0] + ".png"
-
-                try:
-                    with Image.open(file_path) as img:
-                        img.save(png_path, "PNG")
-                        print(f"Converted: {filename} -> {os.path.basename(png_path)}")
-                    os.remove(file_path)  # Remove the original EMF/WMF file
-                except Exception as e:
-                    print(f"Failed to convert {filename}: {e}")
\ No newline at end of file
+    start = time.perf_counter()
+    summary = {"converted": 0, "skipped": 0, "failed": 0}
+    output_dir = os.path.join(media_folder, "media")
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ZipFile(input_file, "r") as archive:
+        members = [info for info in archive.infolist()
+                   if info.filename.startswith("word/media/") and not info.is_dir()]
+        with profiling.stage("docx media", input_file, sum(info.file_size for info in members)) as record, \
+                ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            extract = progress.carry(lambda info: extract_media_file(archive, info, output_dir))
+            for done, result in enumerate(executor.map(extract, members), start=1):
+                summary[result] += 1
+                progress.report("docx media", input_file, done, len(members))
+            record["bytes_out"] = profiling.directory_size(output_dir)
+
+    summary["seconds"] = time.perf_counter() - start
+    logging.info(f"Images in {input_file}: {summary['converted']} converted, {summary['skipped']} skipped, "
+                 f"{summary['failed']} failed in {summary['seconds']:.2f}s")
+    return summary
+
+
+def read_media_file(archive, info):
+    """
+    In-memory version of extract_media_file.
+
+        Returns:
+            tuple: (name the document links to, its bytes), the png for
+                   an emf or wmf that converted.
+    """
+    filename = posixpath.basename(info.filename)
+    extension = os.path.splitext(filename)[1].lower()
+    data = archive.read(info)
+    image_format = detect_header_format(data[:64])
+    if image_format not in CONVERT_FORMATS and extension not in CONVERT_EXTENSIONS:
+        return filename, data
+
+    png_name = os.path.splitext(filename)[0] + ".png"
+    if image_format == "png":
+        return png_name, data
+    try:
+        return png_name, png_bytes(data)
+    except Exception as e:
+        print(f"Failed to convert {filename}: {e}")
+        return filename, data
+
+
+def read_docx_media(source, workers=None):
+    """
+    extract_docx_media without writing anything: converts the images of a
+    docx in memory.
+
+    Args:
+        source (str or file): Path to the docx, or the docx as a binary file
+        workers (int): Number of conversion threads, defaults to the CPU count
+    Returns:
+        dict: File name the AsciiDoc links to -> image bytes
+    """
+    with ZipFile(source, "r") as archive:
+        members = [info for info in archive.infolist()
+                   if info.filename.startswith("word/media/") and not info.is_dir()]
+        with profiling.stage("docx media", bytes_in=sum(info.file_size for info in members)) as record, \
+                ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            media = dict(executor.map(lambda info: read_media_file(archive, info), members))
+            record["bytes_out"] = sum(map(len, media.values()))
+    return media
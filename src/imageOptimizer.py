@@ -0,0 +1,245 @@
+from PIL import Image, ImageOps
+import io
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import assetStore
+import profiling
+import progress
+
+# Quality policy. Lossy encodings use QUALITY, and are only tried for
+# images with more than GRAPHIC_COLORS colours, such as photos and scans, so
+# drawings and charts stay exact; they replace the lossless png only when at
+# least LOSSY_MARGIN smaller than it. Images with at most PALETTE_COLORS
+# colours are written as palette pngs. Images are scaled down to
+# MAX_DIMENSION pixels on their longer side.
+QUALITY = 85
+MAX_DIMENSION = 2000
+LOSSY_FORMAT = "jpeg"
+LOSSY_MARGIN = 0.2
+GRAPHIC_COLORS = 128
+PALETTE_COLORS = 256
+
+# File extension of each format an image can be written as
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+# Formats that are re-encoded. svg, emf or wmf that failed to convert, and
+# anything else Pillow cannot open, are left as they are.
+SOURCE_FORMATS = {"PNG", "JPEG", "BMP", "TIFF", "GIF", "WEBP"}
+
+
+def encode(img, image_format, quality=QUALITY):
+    # Nothing from the source's info, such as EXIF, XMP or text chunks, is
+    # passed on, so the metadata is stripped
+    output = io.BytesIO()
+    if image_format == "png":
+        img.save(output, "PNG", optimize=True)
+    elif image_format == "jpeg":
+        img.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(output, "WEBP", quality=quality)
+    return output.getvalue()
+
+
+def prepare(img, max_dimension):
+    """
+    Turns an opened image into the one to encode: rotated as its EXIF
+    orientation says, since the tag is stripped, in a mode every format
+    takes, without an alpha channel that is opaque everywhere, and scaled
+    down to max_dimension.
+
+        Returns:
+            tuple: (image, whether it was scaled down)
+    """
+    size = img.size
+    if img.format == "JPEG" and max_dimension:
+        # Decodes big JPEGs at a fraction of their size, still above the cap
+        img.draft("RGB", (max_dimension, max_dimension))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+    elif img.mode not in ("1", "L", "P", "RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.mode else "RGB")
+    if img.mode == "RGBA" and img.getchannel("A").getextrema()[0] == 255:
+        img = img.convert("RGB")
+
+    if max_dimension and max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return img, max(img.size) < max(size)
+
+
+def lossless(img):
+    """
+    The image to write as png: a palette image, which is much smaller, when
+    the image has few enough colours to be one without any change.
+    """
+    if img.mode not in ("RGB", "RGBA") or img.getcolors(PALETTE_COLORS) is None:
+        return img
+    method = Image.Quantize.FASTOCTREE if img.mode == "RGBA" else Image.Quantize.MEDIANCUT
+    palette = img.quantize(PALETTE_COLORS, method)
+    return palette if palette.convert(img.mode).tobytes() == img.tobytes() else img
+
+
+def optimize_image(path, quality=QUALITY, max_dimension=MAX_DIMENSION, lossy_format=LOSSY_FORMAT):
+    """
+    Finds the smallest encoding of an image allowed by the quality policy.
+
+        Returns:
+            tuple: (format, bytes) to replace the file with, or None when
+                   the file is to be kept: it cannot be opened, is animated,
+                   or no encoding is smaller and it did not need scaling.
+    """
+    try:
+        with Image.open(path) as img:
+            if img.format not in SOURCE_FORMATS or getattr(img, "is_animated", False):
+                return None
+            img, scaled = prepare(img, max_dimension)
+            img.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logging.warning(f"Not optimizing {path}: {e}")
+        return None
+
+    best = ("png", encode(lossless(img), "png"))
+    photo = img.mode in ("RGB", "L") or (img.mode == "RGBA" and lossy_format == "webp")
+    if photo and img.getcolors(GRAPHIC_COLORS) is None:
+        lossy = encode(img, lossy_format, quality)
+        if len(lossy) <= len(best[1]) * (1 - LOSSY_MARGIN):
+            best = (lossy_format, lossy)
+
+    if not scaled and len(best[1]) >= os.path.getsize(path):
+        return None
+    return best
+
+
+def replace_file(data, path):
+    """
+    Writes a new file and renames it over path, so a file hardlinked from
+    the asset store is replaced rather than changed in place.
+    """
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def link_renamer(link_prefix, renames):
+    """
+    Returns a function pointing the image links in a text at the renamed
+    images, and the number of links it changed.
+
+        Args:
+            link_prefix (str): What the links put before an image's name.
+            renames (dict): New name of each renamed image.
+    """
+    names = "|".join(re.escape(name) for name in sorted(renames, key=len, reverse=True))
+    pattern = re.compile(f"{re.escape(link_prefix)}({names})\\[")
+
+    def rename(text):
+        return pattern.subn(lambda match: f"{link_prefix}{renames[match[1]]}[", text)
+    return rename
+
+
+def rewrite_references(adoc_files, link_prefix, renames):
+    """
+    Points the image links of the AsciiDoc files at the renamed images,
+    line by line. Files without such a link are left untouched.
+    """
+    if not renames:
+        return
+    rename = link_renamer(link_prefix, renames)
+    for path in adoc_files:
+        temp_path = f"{path}.tmp"
+        changed = 0
+        with open(path, "r", encoding="utf-8", newline="") as source, \
+                open(temp_path, "w", encoding="utf-8", newline="") as output:
+            for line in source:
+                line, count = rename(line)
+                changed += count
+                output.write(line)
+        if changed:
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+
+
+def optimize_images(image_dir, quality=QUALITY, max_dimension=MAX_DIMENSION, lossy_format=LOSSY_FORMAT,
+                    workers=None):
+    """
+    Shrinks the images of a converted document, several at a time since
+    Pillow releases the GIL while decoding and encoding. An image whose
+    format, and so extension, changed gets a new name, which the links to
+    it have to follow, see link_renamer() and rewrite_references().
+
+    Args:
+        image_dir (str): Folder of the document's images
+        quality (int): JPEG and WebP quality, 1 to 100
+        max_dimension (int): Longest side in pixels, 0 for no limit
+        lossy_format (str): "jpeg" or "webp"
+        workers (int): Number of threads, defaults to the CPU count
+    Returns:
+        dict: Number of images and of optimized ones, total bytes before
+              and after, the seconds taken and the new name of each
+              renamed image
+    """
+    start = time.perf_counter()
+    if not os.path.isdir(image_dir):
+        return {"images": 0, "optimized": 0, "bytes_before": 0, "bytes_after": 0, "seconds": 0.0, "renames": {}}
+    names = sorted(name for name in os.listdir(image_dir)
+                   if os.path.isfile(os.path.join(image_dir, name)) and not name.endswith(".tmp"))
+    taken = set(names)
+    taken_lock = threading.Lock()
+
+    def optimize(name):
+        path = os.path.join(image_dir, name)
+        size = os.path.getsize(path)
+        result = optimize_image(path, quality, max_dimension, lossy_format)
+        if result is None:
+            return name, name, size, size
+        image_format, data = result
+
+        new_name = name
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in ((".jpg", ".jpeg") if image_format == "jpeg" else (EXTENSIONS[image_format],)):
+            with taken_lock:
+                new_name = stem + EXTENSIONS[image_format]
+                if new_name in taken:
+                    new_name = f"{stem}-{image_format}{EXTENSIONS[image_format]}"
+                taken.add(new_name)
+        new_path = os.path.join(image_dir, new_name)
+        if assetStore.STORE_DIR is None:
+            replace_file(data, new_path)
+        else:
+            assetStore.write_asset(data, new_path)
+        if new_name != name:
+            os.remove(path)
+        return name, new_name, size, len(data)
+
+    summary = {"images": len(names), "optimized": 0, "bytes_before": 0, "bytes_after": 0}
+    renames = {}
+    with profiling.stage("image optimize", image_dir) as record, \
+            ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for done, (name, new_name, before, after) in enumerate(executor.map(progress.carry(optimize), names), start=1):
+            summary["optimized"] += after != before or new_name != name
+            summary["bytes_before"] += before
+            summary["bytes_after"] += after
+            if new_name != name:
+                renames[name] = new_name
+            progress.report("image optimize", image_dir, done, len(names))
+        record["bytes_in"], record["bytes_out"] = summary["bytes_before"], summary["bytes_after"]
+
+    summary["seconds"] = time.perf_counter() - start
+    summary["renames"] = renames
+    saved = summary["bytes_before"] - summary["bytes_after"]
+    logging.info(f"Optimized {summary['optimized']} of {summary['images']} images in {image_dir}: "
+                 f"{summary['bytes_before'] / 1024 ** 2:.2f} MB -> {summary['bytes_after'] / 1024 ** 2:.2f} MB, "
+                 f"saved {saved / 1024 ** 2:.2f} MB "
+                 f"({saved / summary['bytes_before'] * 100 if summary['bytes_before'] else 0:.0f}%) "
+                 f"in {summary['seconds']:.2f}s")
+    return summary
@@ -1,53 +1,24 @@
 import os
+import queue
 import logging
-import formatting
-import imageConverter
-import xlsxConverter
+import threading
+import progress
+import converters
+import main_no_gui
 import pandoc
-from tqdm import tqdm
+import pipeline
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import ttk, filedialog
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                    handlers=[logging.FileHandler("my_log_file.log", mode='w', encoding='utf-8'),
-                              logging.StreamHandler()])
-        
-def process_content(content, output_file):
-    logging.info("Removing certain patterns in asciidoc file")
-    content = formatting.remove_text_by_patterns(content)
+# pandoc runs at once. The other stages have a thread each; images are
+# converted by a pool of their own
+PANDOC_WORKERS = os.cpu_count() or 1
 
-    logging.info("changing all image links to .png")
-    content = formatting.replace_image_suffix_to_png(content)
+# How often the window takes in the events of the conversions
+POLL_MS = 100
 
-    logging.info("Escaping double angle brackets")
-    content = formatting.escape_double_angle_brackets(content)
-
-    logging.info("Styling note boxes")
-    content = formatting.recolor_notes(content)
-
-    logging.info("Adding anchors to bibliography")
-    keys, content = formatting.add_anchors_to_bibliography(content)
-
-    logging.info("Connecting in-document references to bibliography")
-    content = formatting.add_links_to_bibliography(content, keys)
-
-    logging.info("Fixing image captions")
-    content = formatting.use_block_tag_for_img_and_move_caption_ahead(content)
-
-    logging.info("Escaping square brackets")
-    content = formatting.escape_source_square_brackets(content)
-
-    logging.info("Removing bad ++ patters")
-    content = formatting.remove_bad_plus_syntax(content)
-    
-    logging.info("fixing image file paths")
-    content = formatting.fix_image_file_path(content, output_file)
-    
-    logging.info("Adding Marks for review")
-    content = formatting.add_review_marker_for_images(content)
-
-    return content
+# Steps whose detail, a sheet name, is worth showing next to them
+SHEET_STEPS = {"xlsx sheets", "xlsx parse", "xlsx render"}
 
 
 def write_output(output_file, content):
@@ -56,77 +27,230 @@ def write_output(output_file, content):
         file.write(content)
 
 
-def fix_asciidoc(input_file, output_file):
-    #directory = pathlib.Path(input_file).parent
-
-    logging.info("Read the initial asciidoc file...")
-    with open(input_file, 'r', encoding="utf-8") as file:
-        content = file.read()
-
-    content = process_content(content, output_file)
-    write_output(f"{output_file}/{output_file}.adoc", content)
-    os.remove(input_file) 
-
-
+def configure_logging():
+    # Done in main() rather than at import, so importing this module does
+    # not create or truncate the log file
+    logging.basicConfig(level=logging.INFO,
+                        handlers=[logging.FileHandler("my_log_file.log", mode='w', encoding='utf-8'),
+                                  logging.StreamHandler()])
 
 
 def main():
     '''
     Main fuction will take two arguments (input_file and output_file) and run a docx to asciidoc conversion of the file, put all media in to its own folder "/media/media", edit the asciidoc file to change all .emf strings to .png strings and convert all emf images to png images"
-    
+
+    The window stays responsive while files convert: each selection is
+    converted by a pipeline of worker threads in the background, whose
+    progress events and results reach the window through a queue it polls.
     '''
+    configure_logging()
     root = tk.Tk()
-    root.withdraw()  # Hide the root window
+    root.title("Convert to AsciiDoc")
+    state = {
+        "events": queue.Queue(),
+        "rows": {},          # input -> its row in the file list
+        "active": set(),     # inputs queued or converting
+        "cancelled": set(),  # inputs to stop, read by the worker threads
+        "batches": 0,
+        "total": 0,
+        "finished": 0,
+        "closing": False,
+    }
+
+    buttons = ttk.Frame(root, padding=4)
+    buttons.pack(fill="x")
+    files = ttk.Treeview(root, columns=("status", "time"), height=15)
+    files.heading("#0", text="File")
+    files.heading("status", text="Status")
+    files.heading("time", text="Time")
+    files.column("#0", width=320)
+    files.column("status", width=260)
+    files.column("time", width=70, anchor="e")
+    files.pack(fill="both", expand=True, padx=4)
+    bar = ttk.Progressbar(root, mode="determinate")
+    bar.pack(fill="x", padx=4, pady=(4, 0))
+    summary = ttk.Label(root, text="No files selected", padding=4)
+    summary.pack(fill="x")
+
+    ttk.Button(buttons, text="Add Files...", command=lambda: add_files(root, state, files, bar)).pack(side="left")
+    ttk.Button(buttons, text="Cancel Selected",
+               command=lambda: cancel(state, files, [files.item(row, "text") for row in files.selection()])
+               ).pack(side="left", padx=4)
+    ttk.Button(buttons, text="Cancel All",
+               command=lambda: cancel(state, files, list(state["active"]))).pack(side="left")
+
+    def close():
+        if state["batches"]:
+            # Running pandoc processes are killed; the window closes once
+            # every conversion has stopped
+            state["closing"] = True
+            cancel(state, files, list(state["active"]))
+        else:
+            root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close)
+    root.after(0, lambda: add_files(root, state, files, bar))
+    root.after(POLL_MS, lambda: poll(root, state, files, bar, summary))
+    root.mainloop()
 
-    messagebox.showinfo("Select Input Files", "Please select the input files you would like to convert (e.g., .docx).")
+
+def add_files(root, state, files, bar):
     input_files = filedialog.askopenfilenames(
+        parent=root,
         title="Select Input Files",
         filetypes=[("Word Documents", "*.docx"), ("Excel Spreedsheets", "*.xlsx"), ("All Files", "*.*")]
     )
-    if not input_files:
+    # A file still converting is not queued again, as both would write to
+    # the same folder
+    inputs = [input for input in dict.fromkeys(input_files) if input not in state["active"]]
+    if not inputs:
         print("No input file selected.")
         return
-    
-    for input in input_files:
-        file_dir = os.path.dirname(input)
-        file_name = os.path.basename(input)
-        file_stem = os.path.splitext(file_name)[0]
-
-
-
-        docx_steps = ["Determine if docx or xlsx", "Extract Images", "Initail Convertion", "Formatting", "Convert Images to PNG"]
-        xlsx_steps = ["Determine if docx or xlsx", "Converting xlsx"]
-
-        if ".docx" in input:
-            for step in tqdm(docx_steps, desc="Overall Progress", unit="step"):
-                if step == "Determine if docx or xlsx":
-                    print("Detected docx file")
-                if step == "Extract Images":
-                    print("Extract Images")
-                    media_folder = f"{file_stem}/extracted_media/"
-                if step == "Initail Convertion":
-                    print("Doing Initail Convertion")
-                    pandoc.run_pandoc(media_folder, input, f"{file_stem}")
-                if step == "Formatting":
-                    print("Formatting as best we can")
-                    fix_asciidoc(f"{file_stem}/{file_stem}_no_format.adoc", f"{file_stem}")
-                if step == "Convert Images to PNG":
-                    print("Converting images to png")
-                    imageConverter.convert_images_to_png(media_folder)
-        elif ".xlsx" in input:
-            for step in tqdm(xlsx_steps, desc="Overall Progress", unit="step"):
-                if step == "Determine if docx or xlsx":
-                    print("Detected xlsx file")
-                if step == "Extract Images":
-                    print("Extract Images")
-                    image_output_dir = f"{file_stem}/extracted_images/"
-                if step == "Converting xlsx":
-                    print("Doing Initail Convertion")
-                    print("Formatting as best we can")
-                    print("Converting images to png")
-                    xlsxConverter.convert_xlsx_to_adoc_with_images(input, f"{file_stem}", image_output_dir)
+
+    for input in inputs:
+        state["cancelled"].discard(input)
+        state["active"].add(input)
+        if input in state["rows"]:
+            files.item(state["rows"][input], values=("Queued", ""))
         else:
-            print("File not supported: Expected a docx or xlsx file")
+            state["rows"][input] = files.insert("", "end", text=input, values=("Queued", ""))
+    state["total"] += len(inputs)
+    state["batches"] += 1
+    bar.configure(maximum=state["total"])
+    threading.Thread(target=run_batch, args=(inputs, state["events"], state["cancelled"]),
+                     name="gui-batch", daemon=True).start()
+
+
+def cancel(state, files, inputs):
+    for input in inputs:
+        if input in state["active"]:
+            state["cancelled"].add(input)
+            files.item(state["rows"][input], values=("Cancelling", ""))
+
+
+def run_batch(inputs, events, cancelled):
+    """
+    Converts inputs in a worker thread, putting ("progress", input, step,
+    detail, done, total) and ("done", input, status, seconds) events on
+    events, then ("batch done",).
+    """
+    # While pandoc converts one document, the ones before it are formatted
+    # and their images converted
+    stages = [
+        ("pandoc", read_stage, PANDOC_WORKERS),
+        ("images", images_stage, 1),
+        ("format", format_stage, 1),
+        ("write", write_stage, 1),
+    ]
+
+    def finish(job):
+        if job["error"]:
+            status = job["error"] if job["error"] == progress.CANCELLED else f"Failed: {job['error']}"
+        elif job["value"] is None:
+            status = "Not supported"
+        else:
+            status = "Done"
+        events.put(("done", job["item"], status, job["seconds"]))
+
+    def report(*event):
+        events.put(("progress",) + event)
+
+    try:
+        pipeline.run_pipeline(inputs, stages, on_done=finish, on_progress=report, cancelled=cancelled.__contains__)
+    finally:
+        events.put(("batch done",))
+
+
+def poll(root, state, files, bar, summary):
+    """
+    Shows the events the conversions put on the queue since the last poll.
+    Only this, in the tkinter thread, touches the window.
+    """
+    latest = {}
+    try:
+        while True:
+            event = state["events"].get_nowait()
+            if event[0] == "progress":
+                # Only the latest step of each file is worth drawing
+                latest[event[1]] = event[2:]
+            elif event[0] == "done":
+                _, input, status, seconds = event
+                latest.pop(input, None)
+                state["active"].discard(input)
+                state["cancelled"].discard(input)
+                state["finished"] += 1
+                files.item(state["rows"][input], values=(status, f"{seconds:.1f}s"))
+            else:
+                state["batches"] -= 1
+    except queue.Empty:
+        pass
+
+    for input, (step, detail, done, total) in latest.items():
+        if input in state["cancelled"]:
+            continue
+        text = step
+        if detail and step in SHEET_STEPS:
+            text += f" {detail}"
+        if total:
+            text += f" {done}/{total}"
+        files.item(state["rows"][input], values=(text, ""))
+
+    bar.configure(value=state["finished"])
+    if state["total"]:
+        summary.configure(text=f"{state['finished']} of {state['total']} files finished, "
+                               f"{len(state['active'])} converting or queued")
+    if state["closing"] and not state["batches"]:
+        root.destroy()
+        return
+    root.after(POLL_MS, lambda: poll(root, state, files, bar, summary))
+
+
+def read_stage(input):
+    file_name = os.path.basename(input)
+    file_stem = os.path.splitext(file_name)[0]
+    file_type = converters.detect_type(input)
+
+    if file_type == "docx":
+        print(f"Detected docx file: {input}")
+        print("Doing Initail Convertion")
+        return input, file_type, file_stem, pandoc.read_pandoc(f"{file_stem}/extracted_media/", input)
+    if file_type == "xlsx":
+        print(f"Detected xlsx file: {input}")
+        return input, file_type, file_stem, None
+    print(f"File not supported: Expected a docx or xlsx file: {input}")
+    return None
+
+
+def images_stage(value):
+    if value and value[1] == "docx":
+        # PIL, like pandas for xlsx, is only loaded once a file needs it
+        import imageConverter
+        input, _, file_stem, _ = value
+        print("Extract Images")
+        imageConverter.extract_docx_media(input, f"{file_stem}/extracted_media/")
+    return value
+
+
+def format_stage(value):
+    if value is None:
+        return None
+    input, file_type, file_stem, content = value
+    if file_type == "docx":
+        print("Formatting as best we can")
+        return input, file_type, file_stem, main_no_gui.process_content(content, f"{file_stem}")
+
+    import xlsxConverter
+    print("Converting xlsx")
+    xlsxConverter.convert_xlsx_to_adoc_with_images(input, f"{file_stem}", f"{file_stem}/extracted_images/")
+    return input, file_type, file_stem, None
+
+
+def write_stage(value):
+    if value is not None and value[3] is not None:
+        input, _, file_stem, content = value
+        write_output(f"{file_stem}/{file_stem}.adoc", content)
+    return value
+
 
 if __name__ == "__main__":
     main()
@@ -1,69 +1,171 @@
 import os
+import sys
+import json
+import time
 import argparse
 import logging
+import logging.handlers
+import shutil
+import functools
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cache
+import assetStore
+import converters
 import formatting
-import imageConverter
-import xlsxConverter
 import pandoc
+import profiling
+import pipeline
+import sections
+import shards
+import watcher
+
+def configure_logging():
+    # Done in main() rather than at import, so worker processes that import
+    # this module do not reopen and truncate the log file
+    logging.basicConfig(level=logging.INFO,
+                        handlers=[logging.FileHandler("my_log_file.log", mode='w', encoding='utf-8'),
+                                  logging.StreamHandler()])
+
+
+def init_worker(log_queue, pandoc_slots):
+    """
+    Sets up a batch worker process: log records go to the parent through
+    log_queue, so only the parent writes the log file, and pandoc runs are
+    limited by the shared pandoc_slots semaphore.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    pandoc.PANDOC_SLOTS = pandoc_slots
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                    handlers=[logging.FileHandler("my_log_file.log", mode='w', encoding='utf-8'),
-                              logging.StreamHandler()])
         
-def process_content(content, output_file):
+def process_content(content, output_file, legacy=False):
+    if legacy:
+        return process_content_legacy(content, output_file)
+    return formatting.format_content(content, output_file)
+
+
+def process_content_legacy(content, output_file):
+    # Each rule is profiled as its own stage, like the passes of format_content
+    def run_pass(name, function, content):
+        return formatting.run_pass(f"legacy {name}", function, content)
+
     logging.info("Removing certain patterns in asciidoc file")
-    content = formatting.remove_text_by_patterns(content)
+    content = run_pass("patterns", formatting.remove_text_by_patterns, content)
 
     logging.info("changing all image links to .png")
-    content = formatting.replace_image_suffix_to_png(content)
+    content = run_pass("image links", formatting.replace_image_suffix_to_png, content)
 
     logging.info("Escaping double angle brackets")
-    content = formatting.escape_double_angle_brackets(content)
+    content = run_pass("angle brackets", formatting.escape_double_angle_brackets, content)
 
     logging.info("Styling note boxes")
-    content = formatting.recolor_notes(content)
+    content = run_pass("notes", formatting.recolor_notes, content)
 
     logging.info("Adding anchors to bibliography")
-    keys, content = formatting.add_anchors_to_bibliography(content)
+    with profiling.stage("format: legacy bibliography anchors", bytes_in=profiling.text_size(content)) as record:
+        keys, content = formatting.add_anchors_to_bibliography(content)
+        record["bytes_out"] = profiling.text_size(content)
 
     logging.info("Connecting in-document references to bibliography")
-    content = formatting.add_links_to_bibliography(content, keys)
+    content = run_pass("bibliography links", lambda text: formatting.add_links_to_bibliography(text, keys), content)
 
     logging.info("Fixing image captions")
-    content = formatting.use_block_tag_for_img_and_move_caption_ahead(content)
+    content = run_pass("figure captions", formatting.use_block_tag_for_img_and_move_caption_ahead, content)
 
     logging.info("Escaping square brackets")
-    content = formatting.escape_source_square_brackets(content)
+    content = run_pass("source brackets", formatting.escape_source_square_brackets, content)
 
     logging.info("Removing bad ++ patters")
-    content = formatting.remove_bad_plus_syntax(content)
+    content = run_pass("plus signs", formatting.remove_bad_plus_syntax, content)
     
     logging.info("fixing image file paths")
-    content = formatting.fix_image_file_path(content, output_file)
+    content = run_pass("image paths", lambda text: formatting.fix_image_file_path(text, output_file), content)
 
     logging.info("Adding Marks for review")
-    content = formatting.add_review_marker_for_images(content)
+    content = run_pass("review marks", formatting.add_review_marker_for_images, content)
 
     return content
 
 
-def write_output(output_file, content):
+def write_output(output_file, content, split_level=None):
+    if split_level:
+        write_sections(output_file, content, split_level)
+        return
     logging.info(f"Writing fixed content to the output file: {output_file}")
-    with open(output_file, 'w', encoding="utf-8") as file:
+    # A single file replaces the sections of an earlier split run
+    shutil.rmtree(os.path.join(os.path.dirname(output_file), sections.SECTIONS_DIR), ignore_errors=True)
+    with profiling.stage("write", output_file, profiling.text_size(content)) as record, \
+            open(output_file, 'w', encoding="utf-8") as file:
         file.write(content)
+        record["bytes_out"] = profiling.file_position(file)
 
 
-def fix_asciidoc(input_file, output_file):
+def write_sections(output_file, content, split_level):
+    logging.info(f"Writing fixed content as sections of level {split_level} and above, included by: {output_file}")
+    with profiling.stage("write: sections", output_file, profiling.text_size(content)) as record:
+        sections.write_sections(output_file, content, split_level)
+        record["bytes_out"] = profiling.text_size(content)
+
+
+def fix_asciidoc(input_file, output_file, legacy=False, streaming=False, keep_intermediate=False, split_level=None,
+                 renames=None):
     #directory = pathlib.Path(input_file).parent
 
-    logging.info("Read the initial asciidoc file...")
-    with open(input_file, 'r', encoding="utf-8") as file:
-        content = file.read()
+    if streaming:
+        fix_asciidoc_streaming(input_file, output_file, split_level, renames)
+    else:
+        logging.info("Read the initial asciidoc file...")
+        with open(input_file, 'r', encoding="utf-8") as file:
+            content = file.read()
+
+        content = image_link_renamer(renames)(process_content(content, output_file, legacy))
+        write_output(f"{output_file}/{output_file}.adoc", content, split_level)
+    if not keep_intermediate:
+        os.remove(input_file) 
+
+
+def log_peak_memory():
+    peak_memory = profiling.peak_memory_mb()
+    if peak_memory is not None:
+        logging.info(f"Peak memory so far: {peak_memory:.0f} MB")
+
 
-    content = process_content(content, output_file)
-    write_output(f"{output_file}/{output_file}.adoc", content)
-    os.remove(input_file) 
+def fix_asciidoc_streaming(input_file, output_file, split_level=None, renames=None):
+    """
+    Formats the pandoc output line by line and writes the result as it goes,
+    so memory stays flat however large the document is. With split_level,
+    only one section at a time is held, as it is written to its own file.
+    Links to the images in renames are pointed at their new names.
+    """
+    logging.info("Indexing bibliography in the initial asciidoc file...")
+    with profiling.stage("format: index", input_file, profiling.file_size(input_file)), \
+            open(input_file, 'r', encoding="utf-8") as file:
+        bibliography = formatting.index_bibliography(file)
+
+    if split_level:
+        logging.info(f"Streaming fixed content as sections of level {split_level} and above, "
+                     f"included by: {output_file}/{output_file}.adoc")
+        with profiling.stage("format: streaming", input_file, profiling.file_size(input_file)) as record, \
+                open(input_file, 'r', encoding="utf-8") as file:
+            chunks = formatting.format_lines(file, output_file, bibliography)
+            chunks = map(image_link_renamer(renames), chunks)
+            sections.write_sections(f"{output_file}/{output_file}.adoc", chunks, split_level)
+        return
+
+    logging.info(f"Streaming fixed content to the output file: {output_file}/{output_file}.adoc")
+    shutil.rmtree(os.path.join(output_file, sections.SECTIONS_DIR), ignore_errors=True)
+    with profiling.stage("format: streaming", input_file, profiling.file_size(input_file)) as record, \
+            open(input_file, 'r', encoding="utf-8") as file, \
+            open(f"{output_file}/{output_file}.adoc", 'w', encoding="utf-8") as output:
+        rename = image_link_renamer(renames)
+        for chunk in formatting.format_lines(file, output_file, bibliography):
+            output.write(rename(chunk))
+        record["bytes_out"] = profiling.file_position(output)
 
 
 
@@ -75,29 +177,551 @@ def main():
     '''
     ### TODO Remove parser and add a gui file selection ###
     parser = argparse.ArgumentParser(description="convert docx to adoc, including image support")
-    parser.add_argument("-i", "--input", required=True, nargs="+", help="Docx to convert")
+    parser.add_argument("-i", "--input", nargs="+", help="Docx/xlsx files to convert; directories and glob patterns are expanded")
+    parser.add_argument("--watch", metavar="DIR", help="Keep running and convert the .docx/.xlsx files in DIR whenever they are created or saved")
+    parser.add_argument("--debounce", type=float, default=watcher.DEBOUNCE_SECONDS,
+                        help="With --watch, seconds a file must stay unchanged before it is converted (default: %(default)s)")
+    parser.add_argument("--streaming", action="store_true", help="Format the document line by line to keep memory flat on very large files")
+    parser.add_argument("--keep-intermediate", action="store_true", help="Keep pandoc's raw output as <name>/<name>_no_format.adoc for debugging")
+    parser.add_argument("--legacy-formatting", action="store_true", help="Run the formatting rules one pass at a time, for comparing output")
+    parser.add_argument("--split-sections", type=int, metavar="LEVEL",
+                        help="Write each docx section of this title level and above (1 for ==, 2 for ===, ...) to its own file "
+                             "under <name>/sections/, with <name>/<name>.adoc including them; unchanged sections are not rewritten")
+    parser.add_argument("--native-docx", action="store_true", help="Read simple docx files without pandoc, falling back to pandoc for anything else")
+    parser.add_argument("--xlsx-streaming-mb", type=float,
+                        help="Read workbooks larger than this many MB a chunk of rows at a time (default: 50)")
+
+    parser.add_argument("--optimize-images", action="store_true",
+                        help="Shrink the extracted images: scale them down, strip their metadata and keep the smaller of png "
+                             "and a lossy format per image, rewriting the image links to match")
+    parser.add_argument("--image-quality", type=int, help="JPEG/WebP quality for --optimize-images, 1 to 100 (default: 85)")
+    parser.add_argument("--max-image-size", type=int,
+                        help="Longest image side in pixels for --optimize-images, 0 for no limit (default: 2000)")
+    parser.add_argument("--lossy-format", choices=["jpeg", "webp"],
+                        help="Lossy format --optimize-images tries for photos and scans (default: jpeg)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of files to convert in parallel")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap pandoc, image extraction, formatting and writing of different files in one process")
+    parser.add_argument("--pandoc-jobs", type=int, help="Maximum number of pandoc processes running at once (default: --jobs)")
+    parser.add_argument("--image-jobs", type=int, help="Number of threads converting images per document (default: CPU count)")
+    parser.add_argument("--sheet-jobs", type=int, default=1, help="Number of processes rendering the sheets of each xlsx")
+
+    parser.add_argument("--asset-store", help="Shared directory storing each distinct image once; media folders link into it")
+    parser.add_argument("--cache-dir", default=cache.DEFAULT_CACHE_DIR, help="Directory of the stage cache")
+    parser.add_argument("--cache-size", type=int, default=2048, help="Maximum size of the stage cache in MB")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the stage cache")
+    parser.add_argument("--clear-cache", action="store_true", help="Empty the stage cache before converting")
+
+    parser.add_argument("--shard", help="Convert only shard i/N of the inputs, e.g. 2/4; every shard must be given the same inputs")
+    parser.add_argument("--manifest", help="Record the outputs, checksums, timings and failures of every file in this JSON lines file "
+                                           "(default with --shard: manifest-<i>-of-<N>.jsonl; with --merge: manifest.jsonl)")
+    parser.add_argument("--merge", nargs="+", metavar="MANIFEST", help="Combine shard manifests into --manifest and report failed and missing files, instead of converting")
+    parser.add_argument("--rerun", metavar="MANIFEST", help="Convert only the files of this manifest that failed or were never converted")
+
+    parser.add_argument("--profile", action="store_true", help="Measure every stage and log a summary of time, bytes and memory per stage")
+    parser.add_argument("--report", help="Write the stage measurements per file and for the whole batch to this JSON file (implies --profile)")
 
     args = parser.parse_args()
-    
-    for input in args.input:
+    if not (args.input or args.watch or args.merge or args.rerun):
+        parser.error("one of --input, --watch, --merge or --rerun is required")
+    try:
+        shard = shards.parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    if args.split_sections is not None and not 1 <= args.split_sections <= 5:
+        parser.error("--split-sections takes a title level from 1 (==) to 5 (======)")
+    if args.image_quality is not None and not 1 <= args.image_quality <= 100:
+        parser.error("--image-quality must be from 1 to 100")
+    if args.pipeline and args.jobs > 1:
+        parser.error("--pipeline runs in one process; use --pandoc-jobs rather than --jobs with it")
+    configure_logging()
+    if args.clear_cache:
+        cache.clear(args.cache_dir)
+
+    if args.watch:
+        watch(args.watch, args)
+        return
+    if args.merge:
+        sys.exit(merge(args.merge, args.manifest or "manifest.jsonl", shards.expand_inputs(args.input or [])))
+
+    inputs = shards.unfinished_inputs(args.rerun) if args.rerun else shards.expand_inputs(args.input)
+    if shard:
+        all_inputs = inputs
+        inputs = shards.assign_shards(all_inputs, shard[1])[shard[0] - 1]
+        logging.info(f"Shard {args.shard}: {len(inputs)} of {len(all_inputs)} files, "
+                     f"{sum(map(os.path.getsize, filter(os.path.exists, inputs))) / 1024 ** 2:.1f} of "
+                     f"{sum(map(os.path.getsize, filter(os.path.exists, all_inputs))) / 1024 ** 2:.1f} MB")
+    manifest = args.manifest or (f"manifest-{shard[0]}-of-{shard[1]}.jsonl" if shard else None)
+    on_result = None
+    if manifest:
+        shards.start_manifest(manifest, inputs, args.shard)
+        on_result = functools.partial(shards.add_to_manifest, manifest, shard=args.shard)
+
+    start = time.perf_counter()
+    if args.pipeline:
+        results = run_pipelined_batch(inputs, args, on_result)
+    else:
+        results = run_batch(inputs, args, on_result)
+    wall_time = time.perf_counter() - start
+    print_summary(results, wall_time)
+    if args.profile or args.report:
+        profiling.log_summary(profiling.summarize([record for *_, records in results for record in records]))
+    if args.report:
+        write_report(args.report, results, wall_time)
+    if manifest:
+        logging.info(f"Wrote manifest {manifest}")
+
+
+def merge(manifests, output, expected_inputs):
+    """
+    Combines manifests into one, logs what failed or is missing and returns
+    the exit status: 1 when any file failed or was never converted, or a
+    shard left no manifest.
+    """
+    inputs, latest, failed, missing, missing_shards = shards.merge_manifests(manifests, expected_inputs)
+    shards.write_merged_manifest(output, inputs, latest)
+
+    logging.info(f"Merged {len(manifests)} manifests into {output}: {len(inputs)} files, "
+                 f"{len(inputs) - len(failed) - len(missing)} converted, {len(failed)} failed, {len(missing)} missing")
+    for input in failed:
+        logging.info(f"  FAILED  {input}: {latest[input]['error']}")
+    for input in missing:
+        logging.info(f"  MISSING {input}")
+    if missing_shards and not expected_inputs:
+        logging.warning(f"No manifest for shard {', '.join(missing_shards)}; pass the inputs with --input "
+                        f"to have their files listed as missing")
+    return 1 if failed or missing or missing_shards else 0
+
+
+def watch(directory, options):
+    """
+    Converts the documents of directory as they change, until interrupted.
+    The converters stay imported between changes, and the stage cache
+    means a save that leaves a document's content as it was does not rerun
+    pandoc. Documents whose output is missing or older than the document
+    are converted when watching starts.
+    """
+    try:
+        watcher.watch(directory, functools.partial(convert_watched, options), is_current=output_is_current,
+                      debounce_seconds=options.debounce)
+    except KeyboardInterrupt:
+        logging.info(f"Stopped watching {directory}")
+
+
+def convert_watched(options, input):
+    _, error, _, _, records = convert_file(input, options)
+    if records:
+        profiling.log_summary(profiling.summarize(records))
+    return error
+
+
+def output_is_current(input):
+    file_stem = os.path.splitext(os.path.basename(input))[0]
+    output_file = f"{file_stem}/{file_stem}.adoc"
+    return os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(input)
+
+
+UNSUPPORTED_FILE = "File not supported: Expected a docx or xlsx file"
+
+
+def convert_file(input, options):
+    """
+    Converts one docx or xlsx file. Errors are caught and returned so one bad
+    file does not stop the rest of the batch.
+        Args:
+            input (str): Path to the docx or xlsx file.
+            options (argparse.Namespace): Parsed command line options.
+        Returns:
+            tuple: (input, error message or None, wall time in seconds,
+                    (cache hits, cache misses), profiling records)
+    """
+    start = time.perf_counter()
+    error = None
+    cache.configure(None if options.no_cache else options.cache_dir, options.cache_size)
+    profiling.configure(options.profile or options.report is not None)
+    assetStore.configure(options.asset_store)
+    try:
         file_dir = os.path.dirname(input)
         file_name = os.path.basename(input)
         file_stem = os.path.splitext(file_name)[0]
 
         print(f"Processing: {input}")
 
-
-        if ".docx" in input:
-            media_folder = f"{file_stem}/extracted_media/"
-            pandoc.run_pandoc(media_folder, input, f"{file_stem}")
-            fix_asciidoc(f"{file_stem}/{file_stem}_no_format.adoc", f"{file_stem}")
-            imageConverter.convert_images_to_png(media_folder)
-        elif ".xlsx" in input:
-            image_output_dir = f"{file_stem}/extracted_images/"
-            xlsxConverter.convert_xlsx_to_adoc_with_images(input, f"{file_stem}", image_output_dir)
+        _, convert = converters.converter_for(input)
+        if convert:
+            convert(input, file_stem, options)
         else:
-            print("File not supported: Expected a docx or xlsx file")
+            error = UNSUPPORTED_FILE
+            print(error)
+        log_peak_memory()
         print(f"Completed: {input}\n")
+    except Exception as e:
+        logging.exception(f"Failed to convert {input}")
+        error = str(e) or type(e).__name__
+    return input, error, time.perf_counter() - start, cache.take_stats(), profiling.take_records()
+
+
+def convert_docx(input, file_stem, options):
+    """
+    pandoc, formatting and image extraction for one docx. The images are
+    extracted from the zip in the background while pandoc and formatting
+    run. pandoc's raw output and the converted media are cached by the
+    input's content, so an unchanged document skips pandoc and only the
+    formatting is redone. With options.native_docx, docxConverter stands in
+    for pandoc on the documents it handles. With options.optimize_images,
+    formatting waits for the images, whose new names the links need.
+    """
+    with ThreadPoolExecutor(max_workers=1) as media_executor:
+        media_done = media_executor.submit(extract_media, input, file_stem, options)
+        content = read_docx(input, file_stem, options)
+        renames = media_done.result() if options.optimize_images else None
+        content = format_docx(content, file_stem, options, renames)
+        if content is not None:
+            write_output(f"{file_stem}/{file_stem}.adoc", content, options.split_sections)
+        media_done.result()
+
+
+def docx_settings(file_stem, options):
+    media_folder = f"{file_stem}/extracted_media/"
+    # pandoc's output also changes with the pandoc release and the Lua filter
+    pandoc_settings = [media_folder, cache.source_hash(pandoc), pandoc.pandoc_version(),
+                       cache.file_hash(pandoc.MEDIA_FOLDER_FILTER)]
+    if options.native_docx:
+        pandoc_settings += ["native", cache.source_hash("docxConverter")]
+    return media_folder, pandoc_settings
+
+
+def use_intermediate_file(options):
+    # Streaming reads pandoc's output twice, so it goes through the file
+    return options.streaming or options.keep_intermediate
+
+
+def extract_media(input, file_stem, options):
+    """
+    Extracts and converts the images of a docx, or restores them from the
+    cache, and optimizes them with options.optimize_images.
+
+        Returns:
+            dict: New name of each image the optimization renamed.
+    """
+    media_folder, _ = docx_settings(file_stem, options)
+    input_hash = cache.file_hash(input) if cache.CACHE_DIR else None
+    media_key = cache.stage_key(input_hash, "media", media_folder, cache.source_hash("imageConverter"))
+
+    # Images of an earlier run, such as those --optimize-images renamed,
+    # would otherwise be left next to the new ones, and cached with them
+    shutil.rmtree(media_folder, ignore_errors=True)
+    media_entry = cache.lookup(media_key)
+    if media_entry:
+        logging.info(f"Using cached images for {input}")
+        cache.restore_files(media_entry, media_folder)
+    else:
+        import imageConverter
+        imageConverter.extract_docx_media(input, media_folder, options.image_jobs)
+        cache.store(media_key, files_dir=media_folder)
+    return optimize_images(f"{media_folder}media", media_key, options)
+
+
+def read_docx(input, file_stem, options):
+    """
+    Turns a docx into unformatted AsciiDoc, from the cache, the native reader
+    or pandoc.
+
+        Returns:
+            str: The AsciiDoc, or None when it was written to the
+                 intermediate file instead.
+    """
+    media_folder, pandoc_settings = docx_settings(file_stem, options)
+    intermediate_file = f"{file_stem}/{file_stem}_no_format.adoc"
+    input_hash = cache.file_hash(input) if cache.CACHE_DIR else None
+    pandoc_key = cache.stage_key(input_hash, "pandoc", *pandoc_settings)
+
+    pandoc_entry = cache.lookup(pandoc_key)
+    if pandoc_entry:
+        logging.info(f"Using cached pandoc output for {input}")
+        if not use_intermediate_file(options):
+            return cache.read_text(pandoc_entry)
+        os.makedirs(file_stem, exist_ok=True)
+        shutil.copyfile(cache.text_path(pandoc_entry), intermediate_file)
+        return None
+
+    content = None
+    if options.native_docx:
+        import docxConverter
+        with profiling.stage("docx native", input, profiling.file_size(input)) as record:
+            content = docxConverter.convert_docx_to_adoc(input, media_folder)
+            record["bytes_out"] = profiling.text_size(content)
+    if not use_intermediate_file(options):
+        if content is None:
+            content = pandoc.read_pandoc(media_folder, input)
+        cache.store(pandoc_key, text=content)
+        return content
+
+    if content is None:
+        pandoc.run_pandoc(media_folder, input, f"{file_stem}")
+    else:
+        os.makedirs(file_stem, exist_ok=True)
+        with open(intermediate_file, 'w', encoding="utf-8") as file:
+            file.write(content)
+    cache.store(pandoc_key, text_file=intermediate_file)
+    return None
+
+
+def format_docx(content, file_stem, options, renames=None):
+    """
+    Formats what read_docx returned, with the links to the images in
+    renames pointed at their new names. The intermediate file is formatted
+    straight into the output file.
+
+        Returns:
+            str: The formatted AsciiDoc to write, or None when it was
+                 already written.
+    """
+    if content is None:
+        fix_asciidoc(f"{file_stem}/{file_stem}_no_format.adoc", f"{file_stem}", options.legacy_formatting,
+                     options.streaming, options.keep_intermediate, options.split_sections, renames)
+        return None
+    return image_link_renamer(renames)(process_content(content, f"{file_stem}", options.legacy_formatting))
+
+
+def convert_xlsx(input, file_stem, options):
+    """
+    Sheet rendering and image extraction for one xlsx, cached as a whole by
+    the input's content and the converter's code.
+    """
+    image_output_dir = f"{file_stem}/extracted_images/"
+    input_hash = cache.file_hash(input) if cache.CACHE_DIR else None
+    xlsx_key = cache.stage_key(input_hash, "xlsx", file_stem, cache.source_hash("xlsxConverter"))
+
+    shutil.rmtree(image_output_dir, ignore_errors=True)
+    xlsx_entry = cache.lookup(xlsx_key)
+    if xlsx_entry:
+        logging.info(f"Using cached conversion for {input}")
+        cache.restore_files(xlsx_entry, file_stem)
+    else:
+        import xlsxConverter
+        streaming = None
+        if options.xlsx_streaming_mb is not None:
+            streaming = os.path.getsize(input) > options.xlsx_streaming_mb * 1024 * 1024
+        xlsxConverter.convert_xlsx_to_adoc_with_images(input, f"{file_stem}", image_output_dir, streaming,
+                                                       options.sheet_jobs)
+        cache.store(xlsx_key, files_dir=file_stem)
+
+    renames = optimize_images(image_output_dir, xlsx_key, options)
+    if renames:
+        import imageOptimizer
+        imageOptimizer.rewrite_references([f"{file_stem}/{file_stem}.adoc"], image_output_dir, renames)
+
+
+# What the links in a docx's AsciiDoc put before an image's name
+DOCX_LINK_PREFIX = "extracted_media/media/"
+
+
+def optimize_images(image_dir, images_key, options):
+    """
+    Runs imageOptimizer over a document's images when
+    options.optimize_images is set. The optimized images and their new
+    names are cached under the key of the stage that made the images and
+    the quality policy, so an unchanged document's images are restored
+    rather than optimized again.
+
+        Returns:
+            dict: New name of each renamed image.
+    """
+    if not options.optimize_images:
+        return {}
+    # Options left out take the policy's defaults
+    policy = {name: value for name, value in [("quality", options.image_quality),
+                                              ("max_dimension", options.max_image_size),
+                                              ("lossy_format", options.lossy_format)] if value is not None}
+    optimize_key = cache.stage_key(images_key, "optimize", sorted(policy.items()),
+                                   cache.source_hash("imageOptimizer"))
+    optimize_entry = cache.lookup(optimize_key)
+    if optimize_entry:
+        logging.info(f"Using cached optimized images for {image_dir}")
+        shutil.rmtree(image_dir, ignore_errors=True)
+        cache.restore_files(optimize_entry, image_dir)
+        return json.loads(cache.read_text(optimize_entry))
+
+    import imageOptimizer
+    renames = imageOptimizer.optimize_images(image_dir, workers=options.image_jobs, **policy)["renames"]
+    cache.store(optimize_key, text=json.dumps(renames), files_dir=image_dir)
+    return renames
+
+
+def image_link_renamer(renames):
+    """
+    Returns a function pointing the links in a docx's AsciiDoc, or a chunk
+    of it, at the images optimize_images() renamed.
+    """
+    if not renames:
+        return lambda text: text
+    import imageOptimizer
+    rename = imageOptimizer.link_renamer(DOCX_LINK_PREFIX, renames)
+    return lambda text: rename(text)[0]
+
+
+converters.register("docx", convert_docx)
+converters.register("xlsx", convert_xlsx)
+
+
+def run_batch(inputs, options, on_result=None):
+    """
+    Converts every input, in a pool of options.jobs worker processes when
+    that is more than one. Returns the convert_file results in input order;
+    on_result, if given, is called with each one as soon as it is known.
+    """
+    on_result = on_result or (lambda result: None)
+    if options.jobs <= 1:
+        results = []
+        for input in inputs:
+            results.append(convert_file(input, options))
+            on_result(results[-1])
+        return results
+
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+    pandoc_slots = multiprocessing.Semaphore(options.pandoc_jobs or options.jobs)
+    listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=options.jobs, initializer=init_worker,
+                                 initargs=(log_queue, pandoc_slots)) as executor:
+            futures = [executor.submit(convert_file, input, options) for input in inputs]
+            results = []
+            for input, future in zip(inputs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # The worker process itself died
+                    logging.error(f"Failed to convert {input}: {e}")
+                    results.append((input, str(e) or type(e).__name__, 0.0, (0, 0), []))
+                on_result(results[-1])
+    finally:
+        listener.stop()
+    return results
+
+
+def run_pipelined_batch(inputs, options, on_result=None):
+    """
+    Converts every input in this process, with pandoc (or the native
+    reader), docx image extraction, formatting and writing as pipeline
+    stages: while pandoc converts one document, the documents before it are
+    formatted and their images converted. Up to options.pandoc_jobs pandoc
+    runs overlap; xlsx files are converted whole in the format stage.
+    Returns the convert_file results in input order, each file's time
+    running from its first stage starting to its last one ending, and calls
+    on_result, if given, with each as it finishes.
+    """
+    cache.configure(None if options.no_cache else options.cache_dir, options.cache_size)
+    profiling.configure(options.profile or options.report is not None)
+    assetStore.configure(options.asset_store)
+
+    results = {}
+    supported = []
+    for input in inputs:
+        if converters.detect_type(input):
+            supported.append(input)
+        else:
+            print(f"Processing: {input}\n{UNSUPPORTED_FILE}")
+            results[input] = (input, UNSUPPORTED_FILE, 0.0, (0, 0), [])
+            if on_result:
+                on_result(results[input])
+
+    stages = [
+        ("pandoc", functools.partial(read_stage, options), options.pandoc_jobs or 1),
+        ("images", functools.partial(images_stage, options), 1),
+        ("format", functools.partial(format_stage, options), 1),
+        ("write", functools.partial(write_stage, options), 1),
+    ]
+    def finish(job):
+        results[job["item"]] = (job["item"], job["error"], job["seconds"], tuple(job["stats"]), job["records"])
+        if on_result:
+            on_result(results[job["item"]])
+
+    pipeline.run_pipeline(supported, stages, context=job_context, on_done=finish)
+    return [results[input] for input in inputs]
+
+
+def job_context(job):
+    # Cache lookups and stage records count for the job whose stage runs
+    stack = contextlib.ExitStack()
+    stack.enter_context(cache.counting_to(job["stats"]))
+    stack.enter_context(profiling.recording_to(job["records"]))
+    return stack
+
+
+def read_stage(options, input):
+    file_type = converters.detect_type(input)
+    file_stem = os.path.splitext(os.path.basename(input))[0]
+    print(f"Processing: {input}")
+    content = read_docx(input, file_stem, options) if file_type == "docx" else None
+    return input, file_type, file_stem, content
+
+
+def images_stage(options, value):
+    input, file_type, file_stem, content = value
+    renames = extract_media(input, file_stem, options) if file_type == "docx" else None
+    return input, file_type, file_stem, content, renames
+
+
+def format_stage(options, value):
+    input, file_type, file_stem, content, renames = value
+    if file_type == "docx":
+        return input, file_type, file_stem, format_docx(content, file_stem, options, renames)
+    convert_xlsx(input, file_stem, options)
+    return input, file_type, file_stem, None
+
+
+def write_stage(options, value):
+    input, file_type, file_stem, content = value
+    if content is not None:
+        write_output(f"{file_stem}/{file_stem}.adoc", content, options.split_sections)
+    log_peak_memory()
+    print(f"Completed: {input}\n")
+
+
+def print_summary(results, wall_time):
+    failed = [result for result in results if result[1]]
+    total_mb = sum(os.path.getsize(input) for input, *_ in results if os.path.exists(input)) / (1024 * 1024)
+    cache_hits = sum(stats[0] for _, _, _, stats, _ in results)
+    cache_misses = sum(stats[1] for _, _, _, stats, _ in results)
+
+    logging.info("Run summary:")
+    for input, error, seconds, *_ in results:
+        status = f"FAILED ({error})" if error else "ok"
+        logging.info(f"  {seconds:8.2f}s  {input}: {status}")
+    logging.info(f"{len(results)} files, {len(failed)} failed, in {wall_time:.2f}s "
+                 f"({len(results) / wall_time:.2f} files/s, {total_mb / wall_time:.2f} MB/s)")
+    logging.info(f"Cache: {cache_hits} hits, {cache_misses} misses")
+
+
+def write_report(report_file, results, wall_time):
+    """
+    Writes the profiling records of a batch as JSON: every stage of every
+    file, totals per stage for each file and totals for the whole batch.
+    """
+    files = []
+    for input, error, seconds, (hits, misses), records in results:
+        files.append({
+            "input": input,
+            "error": error,
+            "wall_s": seconds,
+            "bytes_in": os.path.getsize(input) if os.path.exists(input) else None,
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "stages": records,
+            "totals": profiling.summarize(records),
+        })
+    report = {
+        "wall_s": wall_time,
+        "files": files,
+        "totals": profiling.summarize([record for *_, records in results for record in records]),
+        "peak_rss_mb": profiling.peak_memory_mb(),
+    }
+    with open(report_file, 'w', encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    logging.info(f"Wrote profiling report to {report_file}")
+
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
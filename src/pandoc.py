@@ -1,5 +1,16 @@
 import os
 import subprocess 
+import functools
+import contextlib
+import profiling
+import progress
+
+# Semaphore limiting how many pandoc processes run at once, set by batch
+# workers. None means no limit.
+PANDOC_SLOTS = None
+
+# How often a cancellable pandoc run checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.1
 
 def run_pandoc(media_folder, input_file, output_file): 
     """ 
@@ -15,20 +26,130 @@ def run_pandoc(media_folder, input_file, output_file):
 #        print("Pandoc executable not found. Ensure Pandoc is installed and available in the system PATH.")
 #        return
     
+    os.makedirs(media_folder, exist_ok=True)
+    output_path = f"{output_file}/{output_file}_no_format.adoc"
+    command = pandoc_command(media_folder, input_file) + ["-o", output_path]
+    run_command(command, input_file, output_path)
+    print(f"Command executed successfully. Output saved to {output_file}") 
+
+
+def read_pandoc(media_folder, input_file):
+    """
+    Runs pandoc and returns its AsciiDoc output from stdout, without writing
+    an intermediate file.
+
+        Args:
+            media_folder (str): Folder the image links point to.
+            input_file (str): Path to the docx file.
+        Returns:
+            str: AsciiDoc produced by pandoc.
+    """
+    os.makedirs(media_folder, exist_ok=True)
+    result = run_command(pandoc_command(media_folder, input_file), input_file)
+    print(f"Command executed successfully for {input_file}")
+    return result.stdout
+
+
+def read_pandoc_bytes(media_folder, data):
+    """
+    read_pandoc for a docx held in memory, which is given to pandoc on its
+    stdin.
+
+        Args:
+            media_folder (str): Folder the image links point to.
+            data (bytes): The docx file.
+        Returns:
+            str: AsciiDoc produced by pandoc.
+    """
+    return run_command(pandoc_command(media_folder, "-"), input_data=data).stdout
+
+
+# Lua filter giving image links the media folder prefix --extract-media would
+MEDIA_FOLDER_FILTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pandoc_media_folder.lua")
+
+
+@functools.lru_cache(maxsize=None)
+def pandoc_version():
+    """
+    First line of "pandoc --version", such as "pandoc 3.1.9", for the stage
+    cache keys of pandoc's output. None when pandoc cannot be run.
+    """
     try:
-        if not os.path.exists(media_folder): 
-            os.makedirs(media_folder)
-        command = [
-            "pandoc",  # Use the found Pandoc executable
-            "-f", "docx",
-            "-t", "asciidoc",
-            "--default-image-extension", ".png",
-            "--extract-media", media_folder,
-            "-o", f"{output_file}/{output_file}_no_format.adoc",
-            input_file
-        ]
-        subprocess.run(command, check=True) 
-        print(f"Command executed successfully. Output saved to {output_file}") 
+        result = subprocess.run(["pandoc", "--version"], check=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, encoding="utf-8")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.split("\n", 1)[0].strip()
+
+
+def pandoc_command(media_folder, input_file):
+    # The media is extracted separately by imageConverter.extract_docx_media,
+    # so pandoc only rewrites the image links
+    return [
+        "pandoc",  # Use the found Pandoc executable
+        "-f", "docx",
+        "-t", "asciidoc",
+        "--default-image-extension", ".png",
+        "--lua-filter", MEDIA_FOLDER_FILTER,
+        "--metadata", f"media_folder={media_folder}",
+        input_file
+    ]
+
 
+def run_command(command, input_file=None, output_file=None, input_data=None):
+    """
+    Runs pandoc, capturing stdout as text. A failed run is printed and raised
+    so the caller can report the file as failed. The run is profiled as the
+    "pandoc" stage, not counting the wait for a pandoc slot. input_data is
+    written to pandoc's stdin. A run for a conversion that can be cancelled
+    is killed once it is, see run_cancellable.
+    """
+    bytes_in = profiling.file_size(input_file) if input_data is None else len(input_data)
+    try:
+        with PANDOC_SLOTS or contextlib.nullcontext(), \
+                profiling.stage("pandoc", bytes_in=bytes_in) as record:
+            if input_data is None and not progress.cancellable():
+                result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        text=True, encoding="utf-8")
+            else:
+                # stdin, and so the output, is binary; the output is decoded
+                # here, with the newline translation text mode would do
+                if progress.cancellable():
+                    result = run_cancellable(command, input_data)
+                else:
+                    result = subprocess.run(command, check=True, input=input_data,
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                result.stdout = result.stdout.decode("utf-8").replace("\r\n", "\n")
+                result.stderr = result.stderr.decode("utf-8", errors="replace")
+            record["bytes_out"] = profiling.file_size(output_file) if output_file else profiling.text_size(result.stdout)
+            return result
     except subprocess.CalledProcessError as e: 
-        print(f"Failed to execute command: {e}") 
\ No newline at end of file
+        stderr = e.stderr.decode("utf-8", errors="replace") if isinstance(e.stderr, bytes) else e.stderr
+        print(f"Failed to execute command: {e}\n{stderr}")
+        raise
+
+
+def run_cancellable(command, input_data=None):
+    """
+    subprocess.run(command, check=True) with stdout and stderr captured as
+    bytes, polling every CANCEL_POLL_SECONDS for the conversion to be
+    cancelled. A cancelled run's process is killed.
+
+        Raises:
+            progress.Cancelled: The conversion was cancelled.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with process:
+        while True:
+            try:
+                stdout, stderr = process.communicate(input_data, timeout=CANCEL_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                if progress.is_cancelled():
+                    process.kill()
+                    process.wait()
+                    progress.check_cancelled()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
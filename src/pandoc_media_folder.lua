@@ -0,0 +1,21 @@
+-- Prefixes image links with the media_folder metadata value, giving the
+-- same links as pandoc's --extract-media without writing the media.
+-- The media itself is extracted by imageConverter.extract_docx_media.
+local media_folder = nil
+
+local function read_media_folder(meta)
+  if meta.media_folder then
+    media_folder = pandoc.utils.stringify(meta.media_folder)
+    meta.media_folder = nil
+  end
+  return meta
+end
+
+local function prefix_image(image)
+  if media_folder then
+    image.src = media_folder .. image.src
+  end
+  return image
+end
+
+return {{Meta = read_media_folder}, {Image = prefix_image}}
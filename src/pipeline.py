@@ -0,0 +1,121 @@
+import time
+import queue
+import logging
+import threading
+import functools
+import contextlib
+import progress
+
+# Jobs waiting between two stages. A stage whose next queue is full waits,
+# so a fast stage cannot run far ahead of a slow one and pile up documents
+# in memory.
+QUEUE_SIZE = 2
+
+# Put in a queue once per worker of the stage reading it, to stop the worker
+DONE = object()
+
+
+def new_job(item):
+    """
+    A job carries one item through the pipeline: the value the stages pass
+    on, its error once a stage failed, its wall time and the cache counts
+    and profiling records of its stages.
+    """
+    return {"item": item, "value": item, "error": None, "start": None, "seconds": 0.0,
+            "stats": [0, 0], "records": []}
+
+
+def run_stage(name, function, inbox, outbox, context, on_progress, cancelled):
+    while True:
+        job = inbox.get()
+        if job is DONE:
+            return
+        if job["start"] is None:
+            job["start"] = time.perf_counter()
+        if job["error"] is None:
+            listener = functools.partial(on_progress, job["item"]) if on_progress else None
+            is_cancelled = functools.partial(cancelled, job["item"]) if cancelled else None
+            try:
+                with progress.reporting_to(listener, is_cancelled), context(job):
+                    progress.report(name)
+                    job["value"] = function(job["value"])
+            except progress.Cancelled:
+                logging.info(f"Cancelled {job['item']} in stage {name}")
+                job["error"] = progress.CANCELLED
+            except Exception as e:
+                logging.exception(f"Failed to convert {job['item']} in stage {name}")
+                job["error"] = str(e) or type(e).__name__
+        outbox.put(job)
+
+
+def run_pipeline(items, stages, context=None, on_done=None, queue_size=QUEUE_SIZE, on_progress=None,
+                 cancelled=None):
+    """
+    Passes every item through a chain of stages. Each stage has its own
+    threads reading jobs from a bounded queue and handing them on to the
+    next stage's queue, so while one document waits for pandoc the next
+    stages work on the documents before it, and a batch takes about as long
+    as its slowest stage rather than the sum of all of them.
+
+    A stage that raises fails only that job: the error is logged and the
+    job skips the remaining stages. So does a cancelled job, at its next
+    progress event; a job cancelled before it starts runs no stage at all.
+
+        Args:
+            items (list): Items to process, such as input paths.
+            stages (list): (name, function, workers) tuples. function takes
+                the value the previous stage returned (the item, for the
+                first stage) and returns the value for the next one.
+            context (callable): Takes a job and returns a context manager
+                entered around each of its stages, e.g. to collect the job's
+                profiling records.
+            on_done (callable): Called with each job as it leaves the last
+                stage, in the order they finish, one at a time.
+            queue_size (int): Jobs each queue between two stages holds.
+            on_progress (callable): Called with (item, step, detail, done,
+                total) for every progress event of an item's stages, from
+                the thread running the stage.
+            cancelled (callable): Takes an item and returns True once its
+                job is to stop; its error is then progress.CANCELLED.
+        Returns:
+            list: The jobs, in the order of items.
+    """
+    jobs = [new_job(item) for item in items]
+    context = context or (lambda job: contextlib.nullcontext())
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    finished = queue.Queue()
+    outboxes = queues[1:] + [finished]
+
+    threads = []
+    for (name, function, workers), inbox, outbox in zip(stages, queues, outboxes):
+        stage_args = (name, function, inbox, outbox, context, on_progress, cancelled)
+        stage_threads = [threading.Thread(target=run_stage, args=stage_args, name=f"{name}-{index}", daemon=True)
+                         for index in range(max(1, workers))]
+        for thread in stage_threads:
+            thread.start()
+        threads.append(stage_threads)
+
+    def feed():
+        for job in jobs:
+            queues[0].put(job)
+        # Each stage is told to stop once every worker of the stage before it has
+        for (_, _, workers), stage_threads, inbox in zip(stages, [[]] + threads, queues):
+            for thread in stage_threads:
+                thread.join()
+            for _ in range(max(1, workers)):
+                inbox.put(DONE)
+        for thread in threads[-1]:
+            thread.join()
+        finished.put(DONE)
+
+    feeder = threading.Thread(target=feed, name="pipeline-feed", daemon=True)
+    feeder.start()
+    while True:
+        job = finished.get()
+        if job is DONE:
+            break
+        job["seconds"] = time.perf_counter() - job["start"]
+        if on_done:
+            on_done(job)
+    feeder.join()
+    return jobs
@@ -0,0 +1,198 @@
+import os
+import sys
+import time
+import logging
+import threading
+import contextlib
+import tracemalloc
+import progress
+
+# Stage records of this process since the last take_records(), None when
+# profiling is off. Set with configure().
+RECORDS = None
+
+# Records of the stages running right now, in any thread. Each is told the
+# traced memory peak before it is reset for a stage that starts later.
+open_records = []
+open_records_lock = threading.Lock()
+
+# Per-thread list the records go to instead of RECORDS, see recording_to()
+local = threading.local()
+
+
+def configure(enabled):
+    """
+    Turns stage profiling on, or off. Memory is traced with tracemalloc while
+    profiling is on, which slows Python code down somewhat.
+    """
+    global RECORDS
+    if enabled:
+        RECORDS = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    else:
+        RECORDS = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def cpu_seconds():
+    # Includes pandoc and other child processes once they have been waited for
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def note_peak():
+    # Called with open_records_lock held
+    peak = tracemalloc.get_traced_memory()[1]
+    for record in open_records:
+        record["peak_mb"] = max(record["peak_mb"], peak / (1024 * 1024))
+    tracemalloc.reset_peak()
+
+
+@contextlib.contextmanager
+def stage(name, detail=None, bytes_in=0):
+    """
+    Measures one stage of a conversion: wall time, CPU time, bytes in and out
+    and peak memory. Yields the stage's record, whose "bytes_out" the caller
+    fills in; when profiling is off the record is thrown away. The stage's
+    start is reported to progress.
+
+    CPU time and memory are those of the whole process while the stage ran,
+    so stages running at the same time in other threads are counted too.
+
+        Args:
+            name (str): Stage name; records are totalled by name.
+            detail (str): What the stage worked on, such as a sheet name.
+            bytes_in (int): Size of the stage's input.
+    """
+    # The start of every stage is also a progress event, and the point
+    # where a cancelled conversion stops
+    progress.report(name, detail)
+    if RECORDS is None:
+        yield {}
+        return
+
+    record = {"stage": name, "detail": detail, "wall_s": 0.0, "cpu_s": 0.0,
+              "bytes_in": bytes_in, "bytes_out": 0, "peak_mb": 0.0, "peak_rss_mb": None}
+    with open_records_lock:
+        note_peak()
+        open_records.append(record)
+        record["peak_mb"] = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    start, start_cpu = time.perf_counter(), cpu_seconds()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - start
+        record["cpu_s"] = cpu_seconds() - start_cpu
+        with open_records_lock:
+            note_peak()
+            open_records.remove(record)
+        record["peak_rss_mb"] = peak_memory_mb()
+        records = getattr(local, "records", None)
+        (RECORDS if records is None else records).append(record)
+
+
+@contextlib.contextmanager
+def recording_to(records):
+    """
+    Sends the records of the stages this thread runs to records rather than
+    RECORDS, so the files of a pipelined batch, whose stages run at the same
+    time in different threads, each keep their own records.
+    """
+    previous = getattr(local, "records", None)
+    local.records = records
+    try:
+        yield
+    finally:
+        local.records = previous
+
+
+def text_size(text):
+    """Size of text in UTF-8, or 0 without counting when profiling is off."""
+    if RECORDS is None or text is None:
+        return 0
+    return len(text.encode("utf-8"))
+
+
+def file_size(path):
+    if RECORDS is None:
+        return 0
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def directory_size(path):
+    if RECORDS is None:
+        return 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += file_size(os.path.join(dirpath, filename))
+    return total
+
+
+def file_position(file):
+    """Position of an open file, for the bytes a stage wrote to it."""
+    if RECORDS is None:
+        return 0
+    file.flush()
+    return file.buffer.tell() if hasattr(file, "buffer") else file.tell()
+
+
+def take_records():
+    """
+    Returns the stage records since the last call and starts a new list.
+    """
+    global RECORDS
+    if RECORDS is None:
+        return []
+    records, RECORDS = RECORDS, []
+    return records
+
+
+def add_records(records):
+    """Adds records measured in a worker process to this process's list."""
+    if RECORDS is not None:
+        RECORDS.extend(records)
+
+
+def summarize(records):
+    """
+    Totals records by stage name.
+
+        Returns:
+            dict: stage name -> {"count", "wall_s", "cpu_s", "bytes_in",
+                  "bytes_out", "peak_mb"}, the peak being the largest seen.
+    """
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                                    "bytes_in": 0, "bytes_out": 0, "peak_mb": 0.0})
+        total["count"] += 1
+        for field in ("wall_s", "cpu_s", "bytes_in", "bytes_out"):
+            total[field] += record[field]
+        total["peak_mb"] = max(total["peak_mb"], record["peak_mb"])
+    return totals
+
+
+def log_summary(totals):
+    logging.info("Stage profile:")
+    logging.info(f"  {'stage':<36} {'count':>6} {'wall s':>9} {'cpu s':>9} {'MB in':>9} {'MB out':>9} {'peak MB':>9}")
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]["wall_s"]):
+        logging.info(f"  {name:<36} {total['count']:>6} {total['wall_s']:>9.2f} {total['cpu_s']:>9.2f} "
+                     f"{total['bytes_in'] / 1024 ** 2:>9.2f} {total['bytes_out'] / 1024 ** 2:>9.2f} "
+                     f"{total['peak_mb']:>9.1f}")
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,78 @@
+import threading
+import contextlib
+
+# Error recorded for a file whose conversion was cancelled
+CANCELLED = "Cancelled"
+
+# Per-thread listener of the conversion the thread works on, and the
+# function telling whether that conversion was cancelled, see reporting_to()
+local = threading.local()
+
+
+class Cancelled(Exception):
+    """Raised at the next progress event of a conversion that was cancelled."""
+
+
+@contextlib.contextmanager
+def reporting_to(listener=None, is_cancelled=None):
+    """
+    Sends the progress events of the conversion this thread runs to
+    listener, and makes it stop at its next event once is_cancelled()
+    returns True.
+
+        Args:
+            listener (callable): Called with (step, detail, done, total) for
+                every event, from the thread that reports it.
+            is_cancelled (callable): Returns True once the conversion is to
+                stop.
+    """
+    previous = getattr(local, "listener", None), getattr(local, "is_cancelled", None)
+    local.listener, local.is_cancelled = listener, is_cancelled
+    try:
+        yield
+    finally:
+        local.listener, local.is_cancelled = previous
+
+
+def report(step, detail=None, done=None, total=None):
+    """
+    Reports that a step of the current conversion started, or for a step
+    made of parts such as the images of a document, that done of its total
+    parts are finished. Every profiling stage reports its start.
+
+        Raises:
+            Cancelled: The conversion was cancelled.
+    """
+    check_cancelled()
+    listener = getattr(local, "listener", None)
+    if listener:
+        listener(step, detail, done, total)
+
+
+def cancellable():
+    return getattr(local, "is_cancelled", None) is not None
+
+
+def is_cancelled():
+    check = getattr(local, "is_cancelled", None)
+    return bool(check and check())
+
+
+def check_cancelled():
+    if is_cancelled():
+        raise Cancelled(CANCELLED)
+
+
+def carry(function):
+    """
+    Wraps function to run with this thread's listener and cancellation in
+    another thread, such as a ThreadPoolExecutor worker. A cancelled
+    conversion's remaining calls raise Cancelled without running.
+    """
+    listener, cancelled = getattr(local, "listener", None), getattr(local, "is_cancelled", None)
+
+    def run(*args):
+        with reporting_to(listener, cancelled):
+            check_cancelled()
+            return function(*args)
+    return run
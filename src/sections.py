@@ -0,0 +1,153 @@
+import os
+import re
+import logging
+
+# Section titles: "== Title" is level 1, "=== Title" level 2 and so on
+HEADING_PATTERN = re.compile(r"(={2,6}) \S")
+
+# Lines opening and closing delimited blocks, inside which a line starting
+# with "==" is content rather than a section title
+DELIMITER_PATTERN = re.compile(r"(-{4,}|\.{4,}|\+{4,}|/{4,}|={4,}|\*{4,}|_{4,})\n?")
+
+# Block anchors and attributes directly above a title, e.g. [[_Toc12]] or
+# [appendix], belong to the section that title starts
+ATTRIBUTE_LINE_PATTERN = re.compile(r"\[.*\]\n?")
+
+REVIEW_MARKER = "PLEASE REVIEW HERE"
+
+SECTIONS_DIR = "sections"
+
+
+def lines_of(chunks):
+    """Splits chunks of text, such as format_lines() yields, into lines."""
+    partial = ""
+    for chunk in chunks:
+        lines = (partial + chunk).splitlines(keepends=True)
+        partial = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+    if partial:
+        yield partial
+
+
+def split_sections(lines, level):
+    """
+    Splits a document at its section titles of the given level and above.
+
+        Args:
+            lines (iterable): Lines of the formatted AsciiDoc.
+            level (int): Deepest title level to split at, 1 for "==".
+        Yields:
+            tuple: (title or None, text) for the text before the first
+                   title, then for each section. Joined in order the texts
+                   are the document.
+    """
+    title = None
+    section = []
+    delimiter = None
+    for line in lines:
+        if delimiter:
+            if line.rstrip("\n") == delimiter:
+                delimiter = None
+            section.append(line)
+            continue
+        match = HEADING_PATTERN.match(line)
+        if match and len(match[1]) - 1 <= level:
+            # Anchors and attributes right above the title move with it
+            start = len(section)
+            while start and ATTRIBUTE_LINE_PATTERN.fullmatch(section[start - 1]):
+                start -= 1
+            if title is not None or section[:start]:
+                yield title, "".join(section[:start])
+            title = line[len(match[1]) + 1:].strip()
+            section = section[start:] + [line]
+            continue
+        if DELIMITER_PATTERN.fullmatch(line):
+            delimiter = line.rstrip("\n")
+        section.append(line)
+    if title is not None or section:
+        yield title, "".join(section)
+
+
+def slug(title):
+    name = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")[:60].rstrip("-")
+    return name or "section"
+
+
+def write_if_changed(path, text):
+    """
+    Writes text to path unless the file already holds exactly that, so an
+    unchanged file keeps its mtime. The new file is renamed into place, so
+    readers never see half of it.
+
+        Returns:
+            bool: Whether the file was written.
+    """
+    data = text.encode("utf-8")
+    try:
+        with open(path, "rb") as file:
+            if file.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+    return True
+
+
+def write_sections(output_file, chunks, level):
+    """
+    Writes a formatted document as one file per section under sections/
+    next to output_file, and output_file as a master that includes them in
+    order. Files whose text did not change are left untouched, and section
+    files of sections that no longer exist are removed.
+
+    Includes are expanded before anything else is read, so bibliography
+    anchors, citation links and cross references between sections work as
+    they did in the single file, and image paths still resolve against the
+    master's folder.
+
+        Args:
+            output_file (str): Path of the master, e.g. <stem>/<stem>.adoc.
+            chunks (iterable): The formatted AsciiDoc, as one string or in
+                chunks.
+            level (int): Deepest title level to split at, 1 for "==".
+        Returns:
+            dict: Number of "sections", "written" and "removed" files.
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    sections_dir = os.path.join(os.path.dirname(output_file), SECTIONS_DIR)
+    os.makedirs(sections_dir, exist_ok=True)
+
+    master = []
+    names = set()
+    written = 0
+    for title, text in split_sections(lines_of(chunks), level):
+        if title is None:
+            master.append(text)
+            continue
+        name = slug(title)
+        number = 1
+        while name in names:
+            number += 1
+            name = f"{slug(title)}-{number}"
+        names.add(name)
+
+        reviews = text.count(REVIEW_MARKER)
+        if reviews:
+            master.append(f"// {name}: {reviews} image{'s' if reviews > 1 else ''} to review\n")
+        master.append(f"include::{SECTIONS_DIR}/{name}.adoc[]\n")
+        written += write_if_changed(os.path.join(sections_dir, f"{name}.adoc"), text)
+
+    removed = 0
+    for filename in os.listdir(sections_dir):
+        if filename.endswith(".adoc") and filename[:-len(".adoc")] not in names:
+            os.remove(os.path.join(sections_dir, filename))
+            removed += 1
+    written += write_if_changed(output_file, "".join(master))
+
+    logging.info(f"Split {output_file} into {len(names)} sections: {written} files written, "
+                 f"{len(names) + 1 - written} unchanged, {removed} removed")
+    return {"sections": len(names), "written": written, "removed": removed}
@@ -0,0 +1,220 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import logging
+import cache
+import watcher
+
+# Manifests are JSON lines: a header naming the shard and every input it was
+# given, then one line per converted file, appended as each one finishes so
+# a shard that dies part way still leaves a usable manifest
+MANIFEST_VERSION = 1
+
+# A file goes to the shard its path hashes to unless that would put the
+# shard more than this much over an even share of the work
+BALANCE_SLACK = 0.1
+
+# Work of a file, on top of its size, for the fixed cost of converting any
+# file (mostly starting pandoc), so many small files count for something
+FILE_COST_BYTES = 256 * 1024
+
+
+def expand_inputs(patterns):
+    """
+    Expands the --input arguments: a directory stands for every .docx and
+    .xlsx file under it, a glob (for shells that do not expand them) for the
+    files it matches, and anything else is taken as a file name.
+
+        Returns:
+            list: Paths, sorted within each argument, without duplicates.
+    """
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(dirpath, filename)
+                       for dirpath, _, filenames in os.walk(pattern)
+                       for filename in filenames if watcher.is_source(filename)]
+        elif glob.has_magic(pattern) and not os.path.exists(pattern):
+            matches = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        else:
+            matches = [pattern]
+        inputs.extend(sorted(matches))
+
+    seen = set()
+    unique = [input for input in inputs if not (input in seen or seen.add(input))]
+    stems = {}
+    for input in unique:
+        stems.setdefault(output_dir(input), []).append(input)
+    for stem, clashing in stems.items():
+        if len(clashing) > 1:
+            logging.warning(f"{', '.join(clashing)} all write to {stem}/; only the last one converted is kept")
+    return unique
+
+
+def output_dir(input):
+    return os.path.splitext(os.path.basename(input))[0]
+
+
+def parse_shard(text):
+    """
+    Parses "i/N", the i-th of N shards counting from 1, into (i, N).
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"expected a shard such as 2/4, not {text!r}")
+    if not 1 <= index <= count:
+        raise ValueError(f"shard {text} does not exist, shards are numbered 1 to {count}")
+    return index, count
+
+
+def path_hash(path):
+    # Stable across machines and Python runs, unlike hash()
+    return int(hashlib.sha256(path.replace(os.sep, "/").encode("utf-8")).hexdigest(), 16)
+
+
+def assign_shards(inputs, count):
+    """
+    Splits inputs into count shards so that every process given the same
+    inputs computes the same split, without talking to the others.
+
+    A file's work is its size plus FILE_COST_BYTES. Files are placed
+    largest first. Each goes to the shard its path hashes to, so most files
+    keep their shard when others are added or removed, unless that shard
+    would end up more than BALANCE_SLACK over an even share of the work;
+    then it goes to the shard with the least work.
+
+        Returns:
+            list: count lists of inputs, each in input order.
+    """
+    sizes = {input: (os.path.getsize(input) if os.path.exists(input) else 0) + FILE_COST_BYTES for input in inputs}
+    capacity = sum(sizes.values()) / count * (1 + BALANCE_SLACK)
+    loads = [0] * count
+    shard_of = {}
+    for input in sorted(inputs, key=lambda input: (-sizes[input], path_hash(input))):
+        shard = path_hash(input) % count
+        if loads[shard] + sizes[input] > capacity:
+            shard = min(range(count), key=lambda index: (loads[index], index))
+        loads[shard] += sizes[input]
+        shard_of[input] = shard
+    return [[input for input in inputs if shard_of[input] == shard] for shard in range(count)]
+
+
+def file_checksum(path):
+    return {"path": path.replace(os.sep, "/"), "sha256": cache.file_hash(path), "bytes": os.path.getsize(path)}
+
+
+def output_checksums(input):
+    """Checksums of every file a conversion wrote, under <stem>/."""
+    checksums = []
+    for dirpath, dirnames, filenames in os.walk(output_dir(input)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            checksums.append(file_checksum(os.path.join(dirpath, filename)))
+    return checksums
+
+
+def start_manifest(path, inputs, shard=None):
+    """
+    Writes a manifest's header line: the shard ("i/N", or None) and every
+    input it is to convert.
+    """
+    with open(path, 'w', encoding="utf-8") as file:
+        file.write(json.dumps({"manifest": MANIFEST_VERSION, "shard": shard, "inputs": inputs,
+                               "started": time.time()}) + "\n")
+
+
+def add_to_manifest(path, result, shard=None):
+    """
+    Appends a convert_file result to a manifest, with the checksums of the
+    input and of everything the conversion wrote.
+    """
+    input, error, seconds, (hits, misses), _ = result
+    record = {
+        "input": input,
+        "shard": shard,
+        "error": error,
+        "seconds": seconds,
+        "bytes": os.path.getsize(input) if os.path.exists(input) else None,
+        "sha256": cache.file_hash(input) if os.path.exists(input) else None,
+        "outputs": [] if error else output_checksums(input),
+        "cache_hits": hits,
+        "cache_misses": misses,
+        "finished": time.time(),
+    }
+    with open(path, 'a', encoding="utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+
+
+def read_manifest(path):
+    """
+    Returns (header, records) of a manifest. A last line cut short by a
+    crash is ignored.
+    """
+    with open(path, 'r', encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    header = json.loads(lines[0])
+    records = []
+    for number, line in enumerate(lines[1:], start=2):
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring line {number} of {path}, it is incomplete")
+    return header, records
+
+
+def merge_manifests(paths, expected_inputs=()):
+    """
+    Combines manifests, keeping the latest record of each input, so the
+    manifest of a rerun overrides the failures it fixed.
+
+        Args:
+            paths (list): Manifest files, in any order.
+            expected_inputs (list): Inputs that should be covered even if no
+                manifest names them, e.g. those of a shard that never ran.
+        Returns:
+            tuple: (inputs, latest record per input, failed inputs, missing
+                    inputs, shard numbers that are missing as "i/N").
+    """
+    inputs = list(expected_inputs)
+    latest = {}
+    shards_seen = set()
+    shard_counts = set()
+    for path in paths:
+        header, records = read_manifest(path)
+        inputs.extend(header["inputs"])
+        if header.get("shard"):
+            index, count = parse_shard(header["shard"])
+            shards_seen.add(index)
+            shard_counts.add(count)
+        for record in records:
+            if record["input"] not in latest or record["finished"] >= latest[record["input"]]["finished"]:
+                latest[record["input"]] = record
+
+    seen = set()
+    inputs = [input for input in inputs if not (input in seen or seen.add(input))]
+    failed = [input for input in inputs if input in latest and latest[input]["error"]]
+    missing = [input for input in inputs if input not in latest]
+    missing_shards = [f"{index}/{count}" for count in sorted(shard_counts)
+                      for index in range(1, count + 1) if index not in shards_seen]
+    return inputs, latest, failed, missing, missing_shards
+
+
+def write_merged_manifest(path, inputs, latest):
+    start_manifest(path, inputs)
+    with open(path, 'a', encoding="utf-8") as file:
+        for input in inputs:
+            if input in latest:
+                file.write(json.dumps(latest[input]) + "\n")
+
+
+def unfinished_inputs(path):
+    """
+    The inputs of a manifest that failed or have no record, for a rerun.
+    """
+    inputs, _, failed, missing, _ = merge_manifests([path])
+    retry = set(failed) | set(missing)
+    return [input for input in inputs if input in retry]
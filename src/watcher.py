@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+
+# How often the folder is scanned, and how long a file must stay unchanged
+# before it is converted, so a save written in several steps (or several
+# saves in a row) is converted once
+POLL_SECONDS = 1.0
+DEBOUNCE_SECONDS = 2.0
+
+SOURCE_EXTENSIONS = {".docx", ".xlsx"}
+
+
+def is_source(name):
+    # Word and Excel keep "~$name.docx" lock files next to open documents
+    return os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS and not name.startswith(("~$", "."))
+
+
+def scan(directory):
+    """
+    Returns {path: (mtime_ns, size)} for the documents directly in directory.
+    """
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not is_source(entry.name):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass  # Removed or replaced between listing and stat
+    return files
+
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch(directory, convert, is_current=None, poll_seconds=POLL_SECONDS, debounce_seconds=DEBOUNCE_SECONDS,
+          should_stop=None):
+    """
+    Watches a folder and converts each created or modified document once
+    its size and modification time have stopped changing for
+    debounce_seconds. The folder is polled with os.scandir, which only
+    reads directory entries, so a poll of even a large folder is cheap.
+
+        Args:
+            directory (str): Folder holding the .docx and .xlsx files.
+            convert (callable): Converts one path; returns an error message
+                or None.
+            is_current (callable): Tells whether a path's output is already
+                up to date when watching starts; the others are converted
+                first. All files are converted when None.
+            poll_seconds (float): Time between two scans.
+            debounce_seconds (float): Quiet time before a change is converted.
+            should_stop (callable): Checked after every scan; watching ends
+                when it returns True.
+    """
+    converted = {}
+    for path, stat in scan(directory).items():
+        if is_current and is_current(path):
+            converted[path] = stat
+    # path -> (stat, time the file last changed, time it first changed)
+    pending = {}
+    logging.info(f"Watching {directory} for .docx and .xlsx changes (Ctrl+C to stop)")
+
+    while True:
+        now = time.perf_counter()
+        current = scan(directory)
+
+        for path in list(converted):
+            if path not in current:
+                logging.info(f"Removed: {path}")
+                del converted[path]
+        for path in list(pending):
+            if path not in current:
+                del pending[path]
+
+        for path, stat in sorted(current.items()):
+            if converted.get(path) == stat:
+                continue
+            if path not in pending:
+                pending[path] = (stat, now, now)
+            elif pending[path][0] != stat:
+                pending[path] = (stat, now, pending[path][2])
+            elif now - pending[path][1] >= debounce_seconds:
+                if file_stat(path) != stat:
+                    # Changed or removed while an earlier file was converted
+                    continue
+                first_change = pending.pop(path)[2]
+                start = time.perf_counter()
+                error = convert(path)
+                end = time.perf_counter()
+                # Converted or not, wait for the next save before trying again
+                converted[path] = stat
+                status = f"FAILED ({error})" if error else "converted"
+                logging.info(f"{path}: {status} in {end - start:.2f}s, "
+                             f"{end - first_change:.2f}s after the change was seen")
+
+        if should_stop and should_stop():
+            return
+        time.sleep(poll_seconds)
@@ -1,87 +1,148 @@
 import pandas as pd 
+from pandas.io.parsers import TextParser
 from openpyxl import load_workbook 
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+import io
 import os  
+import re
+import posixpath
+import math
+import time
+import shutil
+import pickle
+import logging
+import tempfile
+import datetime
+import functools
 from xml.etree import ElementTree as ET
 from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
 import argparse
+import assetStore
+import profiling
+import progress
 
-def extract_images_from_xlsx(input_file, image_output_dir):
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+
+def part_target(source_part, target):
+    """
+    Resolves a relationship target to a part name in the zip. Excel writes
+    targets relative to the source part ("../media/image1.png"), other
+    writers absolute ones ("/xl/media/image1.png").
+    """
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def rels_part(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def read_relationships(archive, parts, part):
+    """
+    Returns the relationships of a part as {id: (type, target part)}, empty
+    when the part has none.
+    """
+    path = rels_part(part)
+    if path not in parts:
+        return {}
+    tree = ET.fromstring(archive.read(parts[path]))
+    return {rel.attrib["Id"]: (rel.attrib.get("Type", ""), part_target(part, rel.attrib["Target"]))
+            for rel in tree.iter(f"{RELATIONSHIPS_NS}Relationship")
+            if rel.attrib.get("TargetMode") != "External"}
+
+
+def extract_images_from_xlsx(input_file, image_output_dir, archive=None): 
     """ 
     Extracts images from an Excel file and saves them to a directory. 
         Args: 
             input_file (str): Path to the Excel file. 
             image_output_dir (str): Directory to save the extracted images. 
+            archive (ZipFile): The workbook, when the caller already opened it.
         Returns: 
             dict: A dictionary mapping sheet names to lists of image filenames. 
     """ 
-    
+    if archive is None:
+        with ZipFile(input_file, 'r') as archive:
+            return extract_images_from_xlsx(input_file, image_output_dir, archive)
+
     if not os.path.exists(image_output_dir): 
         os.makedirs(image_output_dir) 
+
+    def write_image(media_file, source):
+        assetStore.copy_asset(source, os.path.join(image_output_dir, posixpath.basename(media_file)))
+
+    return find_images_in_xlsx(archive, write_image)
+
+
+def find_images_in_xlsx(archive, handle_image):
+    """
+    Finds the images shown on each sheet of an open workbook.
+
+        Args:
+            archive (ZipFile): The workbook.
+            handle_image (callable): Called once per image part, however
+                many drawings show it, with the part name and the part
+                opened for reading.
+        Returns:
+            dict: A dictionary mapping sheet names to lists of image filenames.
+    """
     sheet_images = {} 
 
-    with ZipFile(input_file, 'r') as archive:
-        media_files = [f for f in archive.namelist() if f.startswith("xl/media/")]
-        drawing_files = [f for f in archive.namelist() if f.startswith("xl/drawings/")]
-        drawing_rels_files = [f for f in archive.namelist() if f.startswith("xl/drawings/_rels/")]
-        worksheet_rels = [f for f in archive.namelist() if f.startswith("xl/worksheets/_rels/")]
-        workbook_xml = archive.read("xl/workbook.xml")
-        workbook_tree = ET.fromstring(workbook_xml)
-        sheet_map = {}
-        drawing_to_sheets = {}
-
-        for sheet in workbook_tree.findall(".//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}sheet"):
-            sheet_id = sheet.attrib["sheetId"]
-            sheet_name = sheet.attrib["name"]
-            sheet_map[f"sheet{sheet_id}.xml"] = sheet_name
-
-        print(f"Sheet Mapping: {sheet_map}")
-
-        for rel_path in worksheet_rels:
-            internal_sheet_name = rel_path.replace("xl/worksheets/_rels/", "").replace(".xml.rels", ".xml")
-            display_sheet_name = sheet_map.get(internal_sheet_name, f"Unknown_Sheet_{internal_sheet_name}")
-            rels_xml = archive.read(rel_path)
-            rels_tree = ET.fromstring(rels_xml)
-
-            for rel in rels_tree.findall(".//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"):
-                if "drawing" in rel.attrib["Type"]:
-                    drawing_file = rel.attrib["Target"].replace("../", "xl/")
-                    drawing_to_sheets.setdefault(drawing_file, []).append(display_sheet_name)
-        print(f"Drawing to Sheet Mapping: {drawing_to_sheets}")
-
-        for drawing_path in drawing_files:
-            #print(drawing_path)
-            try:
-                drawing_xml = archive.read(drawing_path)
-                #print(drawing_xml)
-                tree = ET.fromstring(drawing_xml)
-                associated_sheets = drawing_to_sheets.get(drawing_path, [f"Unknown_Sheet_{drawing_path}"])
-                print(f"Processing Drawing: {drawing_path}, Associated Sheet: {associated_sheets}")
-
-                drawing_rels_path = drawing_path.replace("xl/drawings/", "xl/drawings/_rels/") + ".rels"
-                drawing_rels_xml = archive.read(drawing_rels_path)
-                drawing_rels_tree = ET.fromstring(drawing_rels_xml)
-                rId_to_media = {
-                    rel.attrib["Id"]: rel.attrib["Target"].replace("../", "xl/")
-                    for rel in drawing_rels_tree.findall(".//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship")
-                    if "media" in rel.attrib["Target"]
-                    }
-                for tag in tree.findall(".//{http://schemas.openxmlformats.org/drawingml/2006/main}blip"):
-                    img_rId = tag.attrib["{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed"]
-                    media_file = rId_to_media.get(img_rId)
-#                    for idx, media_file in enumerate(media_files):
-                    if media_file:
-                        img_name = os.path.basename(media_file)
-                        img_output_path = os.path.join(image_output_dir, img_name)
-
-                        with open(img_output_path, "wb") as img_file:
-                            img_file.write(archive.read(media_file))
-                            for sheet_name in associated_sheets:
-                                sheet_images.setdefault(sheet_name, []).append(img_name)
-#                        if f"{sheet_name}_{idx +1}" not in sheet_images:
-#                            sheet_images[f"{sheet_name}_{idx +1}"] =[]
-#                            sheet_images[f"{sheet_name}_{idx +1}"].append(img_name)
-            except Exception as e:
-                print(f"Error processing drawing file {drawing_path}: {e}")
+    # One pass over the central directory; every lookup below uses it
+    parts = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+    workbook_tree = ET.fromstring(archive.read(parts["xl/workbook.xml"]))
+    workbook_rels = read_relationships(archive, parts, "xl/workbook.xml")
+    sheet_map = {}
+    drawing_to_sheets = {}
+
+    for sheet in workbook_tree.iter(f"{SPREADSHEET_NS}sheet"):
+        sheet_name = sheet.attrib["name"]
+        rel = workbook_rels.get(sheet.attrib.get(f"{OFFICE_RELATIONSHIPS_NS}id"))
+        sheet_part = rel[1] if rel else f"xl/worksheets/sheet{sheet.attrib['sheetId']}.xml"
+        sheet_map[sheet_part] = sheet_name
+
+    print(f"Sheet Mapping: {sheet_map}")
+
+    for sheet_part in sorted(name for name in parts if name.startswith("xl/worksheets/") and name.endswith(".xml")):
+        display_sheet_name = sheet_map.get(sheet_part, f"Unknown_Sheet_{posixpath.basename(sheet_part)}")
+        for rel_type, target in read_relationships(archive, parts, sheet_part).values():
+            if rel_type.endswith("/drawing"):
+                drawing_to_sheets.setdefault(target, []).append(display_sheet_name)
+    print(f"Drawing to Sheet Mapping: {drawing_to_sheets}")
+
+    written = set()
+    for drawing_path in [name for name in parts if name.startswith("xl/drawings/") and name.endswith(".xml")]:
+        try:
+            tree = ET.fromstring(archive.read(parts[drawing_path]))
+            associated_sheets = drawing_to_sheets.get(drawing_path, [f"Unknown_Sheet_{drawing_path}"])
+            print(f"Processing Drawing: {drawing_path}, Associated Sheet: {associated_sheets}")
+
+            rId_to_media = {
+                rId: target
+                for rId, (_, target) in read_relationships(archive, parts, drawing_path).items()
+                if target.startswith("xl/media/") and target in parts
+            }
+            for tag in tree.iter(f"{DRAWING_NS}blip"):
+                media_file = rId_to_media.get(tag.attrib.get(f"{OFFICE_RELATIONSHIPS_NS}embed"))
+                if media_file:
+                    img_name = posixpath.basename(media_file)
+                    if media_file not in written:
+                        # Streamed in blocks, and written once however many
+                        # drawings show it
+                        with archive.open(parts[media_file]) as source:
+                            handle_image(media_file, source)
+                        written.add(media_file)
+                    for sheet_name in associated_sheets:
+                        sheet_images.setdefault(sheet_name, []).append(img_name)
+        except Exception as e:
+            print(f"Error processing drawing file {drawing_path}: {e}")
     print(f"Final Sheet Images Mapping: {sheet_images}")
     return sheet_images
 
@@ -90,6 +151,7 @@ def extract_images_from_xlsx(input_file, image_output_dir):
 
 
 
+
 #        wb = load_workbook(input_file, data_only=True, keep_links=True) 
 #       print("Workbook Attributes:")
 #       print(dir(wb))
@@ -140,42 +202,514 @@ def extract_images_from_xlsx(input_file, image_output_dir):
 #        sheet_images[sheet_name] = images
 #    return sheet_images 
 
-def convert_xlsx_to_adoc_with_images(input_file, output_file, image_output_dir): 
+# Rows rendered and written per write() call
+TABLE_CHUNK_ROWS = 10000
+
+
+def escape_cell(text):
+    """
+    Escapes a table cell: a | would end the cell and a line break would end
+    the row, so they become \\| and an AsciiDoc hard line break.
+    """
+    return text.replace("|", "\\|").replace("\r\n", "\n").replace("\n", " +\n")
+
+
+def escape_cells(values):
+    """
+    Formats and escapes a whole column at once. The cells are joined into one
+    string so escaping is a few str.replace calls instead of one per cell;
+    NUL can't occur in xlsx text, so it safely separates them.
+
+        Returns:
+            list: The column's cell texts, as str(value) would give them.
+    """
+    text = "\x00".join(map(str, values.tolist()))
+    if "|" in text or "\n" in text:
+        text = escape_cell(text)
+    return text.split("\x00")
+
+
+# Values that make a row read by iterrows() a datetime or timedelta Series
+# when the row's other cells are missing
+DATETIME_TYPES = (datetime.datetime, datetime.timedelta)
+
+
+def datetime_rows(chunk):
+    """
+    Texts of the rows iterrows() printed differently from their columns. A
+    row whose cells are all dates (or durations) or missing became a
+    datetime Series, so its missing cells read NaT rather than nan; those
+    rows are formatted through a Series as iterrows() did.
+
+        Args:
+            chunk (DataFrame): Rows of a sheet.
+        Returns:
+            dict: Escaped cell texts of such rows, by row position in chunk.
+    """
+    missing = chunk.isna().to_numpy()
+    candidates = missing.any(axis=1).nonzero()[0]
+    for position, dtype in enumerate(chunk.dtypes):
+        if not len(candidates):
+            return {}
+        cells = missing[candidates, position]
+        if dtype == object:
+            values = chunk.iloc[candidates, position].tolist()
+            cells |= [isinstance(value, DATETIME_TYPES) for value in values]
+        elif dtype.kind in "Mm":
+            continue
+        candidates = candidates[cells]
+    rows = chunk.iloc[candidates].to_numpy()
+    return {row: [escape_cell(str(value)) for value in pd.Series(values)] for row, values in zip(candidates, rows)}
+
+
+def render_table_rows(df, chunk_rows=TABLE_CHUNK_ROWS):
+    """
+    Renders the rows of a sheet as AsciiDoc table rows. Each column is
+    formatted and escaped once per chunk of rows, and the rows of a chunk
+    are joined into one string. Cells read as they did when rows came from
+    iterrows(): when all columns are numeric, every value is first cast to
+    their common dtype, so beside a float column an int 1 reads 1.0, and
+    missing cells of a row of dates read NaT (see datetime_rows).
+
+        Args:
+            df (DataFrame): The sheet.
+            chunk_rows (int): Number of rows per yielded string.
+        Yields:
+            str: Table rows, each ending with a newline.
+    """
+    # Otherwise the common dtype is object, or the one all columns share, which
+    # leaves each value as it is
+    numeric = len(df.columns) > 0 and all(dtype.kind in "biuf" for dtype in df.dtypes)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        if numeric:
+            values = chunk.to_numpy()
+            columns = [escape_cells(values[:, position]) for position in range(values.shape[1])]
+            dated = {}
+        else:
+            columns = [escape_cells(chunk.iloc[:, position]) for position in range(chunk.shape[1])]
+            dated = datetime_rows(chunk)
+        rows = zip(*columns)
+        if dated:
+            rows = [dated.get(row, cells) for row, cells in enumerate(rows)]
+        yield "".join(["| " + " | ".join(cells) + "\n" for cells in rows])
+
+
+# Workbooks larger than this, in MB, are read a chunk of rows at a time with
+# read_sheet_streaming instead of one DataFrame per sheet
+STREAMING_THRESHOLD_MB = 50
+
+# Strings pandas may read as missing, bool or special floats; each one is
+# sampled separately when inferring column types
+SPECIAL_STRINGS = {"", "#n/a", "#n/a n/a", "#na", "-1.#ind", "-1.#qnan", "-nan", "1.#ind", "1.#qnan",
+                   "<na>", "n/a", "na", "null", "nan", "none", "true", "false", "inf", "+inf", "-inf",
+                   "infinity", "+infinity", "-infinity", "+nan"}
+NUMBER_LIKE_PATTERN = re.compile(r"[\s\d+\-.eE]{1,40}")
+
+# Distinct kinds of value sampled per column. Kinds past it are not
+# sampled, and a warning says the column may be typed differently
+MAX_COLUMN_SAMPLES = 1000
+
+
+def cell_value(cell):
+    """
+    Value of an openpyxl cell as pandas' openpyxl reader returns it.
+    """
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return math.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def sheet_rows(worksheet):
+    """
+    Yields the rows of a read only worksheet with trailing empty cells
+    removed, as pandas reads them.
+    """
+    worksheet.reset_dimensions()
+    for row in worksheet.rows:
+        values = [cell_value(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        yield values
+
+
+def value_kind(value):
+    """
+    Groups cell values that pandas' type inference treats alike, so a few
+    samples per column decide a column's type as all of its values would.
+    """
+    if isinstance(value, str):
+        if value.strip().lower() in SPECIAL_STRINGS:
+            return ("str", value)
+        if NUMBER_LIKE_PATTERN.fullmatch(value):
+            # Digit runs long enough to overflow int64 are kept apart
+            return ("number", re.sub(r"\d+", lambda m: "9" if len(m.group()) < 16 else "9" * len(m.group()), value))
+        return ("str",)
+    if isinstance(value, bool):
+        return ("bool",)
+    if isinstance(value, int):
+        # Values beyond int64 and uint64 are parsed differently
+        return ("int", value < 0, -2 ** 63 <= value < 2 ** 63, value < 2 ** 64)
+    if isinstance(value, float):
+        return ("float", math.isnan(value), math.isinf(value))
+    return (type(value).__name__, getattr(value, "tzinfo", None) is not None)
+
+
+def equal_value_key(value):
+    """
+    pandas keeps one of the values of a column that compare and hash equal
+    across types, the first it sees, and shows it for all of them: in a
+    mixed column, 1 after True reads as True. Cells only give such values
+    as bools and the ints 0 and 1, since integral numbers are ints. Returns
+    the key of the value's group, or None for any other value.
+    """
+    if type(value) in (bool, int) and value in (0, 1):
+        return ("equal", int(value))
+    return None
+
+
+def scan_sheet(worksheet, spill, chunk_rows=TABLE_CHUNK_ROWS):
+    """
+    First pass of read_sheet_streaming: reads the header row and samples
+    every kind of value in each column, keeping the order in which they
+    first appear. The first of the values pandas treats as equal, see
+    equal_value_key(), is sampled too, so it comes first when the samples
+    are parsed in front of the rows. The data rows are pickled to spill in
+    chunks, so the second pass doesn't have to parse the sheet's XML again.
+
+        Args:
+            worksheet: Sheet of a workbook opened with read_only=True.
+            spill (file): Binary file receiving lists of data rows.
+            chunk_rows (int): Number of rows per pickled list.
+        Returns:
+            tuple: (header row, samples per column, number of data rows)
+    """
+    header = None
+    samples = []
+    capped = set()
+    chunk = []
+    rows = 0
+    data_rows = 0
+    first_length = None
+    # Shortest row so far, and since the last row with data; pandas pads
+    # short rows with empty cells but drops empty rows at the end
+    kept_length = pending_length = math.inf
+    for values in sheet_rows(worksheet):
+        if header is None:
+            header = values
+            continue
+        rows += 1
+        chunk.append(values)
+        if len(chunk) == chunk_rows:
+            pickle.dump(chunk, spill, pickle.HIGHEST_PROTOCOL)
+            chunk = []
+        if first_length is None:
+            first_length = len(values)
+        pending_length = min(pending_length, len(values))
+        if not values:
+            continue
+        data_rows = rows
+        kept_length = min(kept_length, pending_length)
+        pending_length = math.inf
+        for position, value in enumerate(values):
+            if position == len(samples):
+                samples.append({})
+            column = samples[position]
+            equal_key = equal_value_key(value)
+            if equal_key is not None:
+                column.setdefault(equal_key, value)
+            kind = value_kind(value)
+            if kind in column:
+                continue
+            if len(column) < MAX_COLUMN_SAMPLES:
+                column[kind] = value
+            elif position not in capped:
+                capped.add(position)
+                logging.warning(f"Column {position + 1} of sheet {worksheet.title} has more than "
+                                f"{MAX_COLUMN_SAMPLES} kinds of value; its type may differ from a "
+                                "non-streaming read")
+    if chunk:
+        pickle.dump(chunk, spill, pickle.HIGHEST_PROTOCOL)
+
+    header = header or []
+    width = max(len(header), len(samples))
+    columns = []
+    for position in range(width):
+        column = list(samples[position].values()) if position < len(samples) else []
+        if data_rows and position >= first_length:
+            column.insert(0, "")
+        elif position >= kept_length:
+            column.append("")
+        columns.append(column)
+    return header, columns, data_rows
+
+
+def sample_rows(samples):
+    """
+    Rows holding the samples of each column, short columns padded with
+    their first sample, which adds no new kind of value.
+    """
+    length = max([len(column) for column in samples] + [0])
+    return [[column[row] if row < len(column) else column[0] for column in samples]
+            for row in range(length)]
+
+
+def parse_rows(rows, samples):
+    """
+    Parses a chunk of rows as pandas would parse them as part of the whole
+    sheet. How pandas converts a value depends on the other values in its
+    column, so the sample rows, which hold every kind of value of each
+    column, are parsed along with the chunk and then dropped.
+    """
+    df = TextParser(samples + rows, header=None, skip_blank_lines=False).read()
+    return df.iloc[len(samples):]
+
+
+def read_sheet_streaming(worksheet, chunk_rows=TABLE_CHUNK_ROWS):
+    """
+    Reads a sheet without holding all of its rows, producing the same
+    columns and table rows as DataFrame parsing. A first pass samples the
+    values of each column and spills the rows to a temporary file, which
+    is then parsed and rendered a chunk of rows at a time.
+
+        Args:
+            worksheet: Sheet of a workbook opened with read_only=True.
+            chunk_rows (int): Number of rows parsed and rendered at once.
+        Returns:
+            tuple: (column names, generator of rendered table rows)
+    """
+    spill = tempfile.TemporaryFile()
+    try:
+        header, samples, data_rows = scan_sheet(worksheet, spill, chunk_rows)
+    except BaseException:
+        spill.close()
+        raise
+    width = len(samples)
+    if width == 0:
+        spill.close()
+        return [], iter([])
+    samples = sample_rows(samples)
+    header = header + [""] * (width - len(header))
+    columns = TextParser([header] + samples, header=0, skip_blank_lines=False).read().columns
+
+    def render():
+        with spill:
+            spill.seek(0)
+            remaining = data_rows
+            while remaining > 0:
+                # Empty rows after the last row with data are dropped
+                chunk = pickle.load(spill)[:remaining]
+                remaining -= len(chunk)
+                rows = [values + [""] * (width - len(values)) for values in chunk]
+                yield from render_table_rows(parse_rows(rows, samples), chunk_rows)
+
+    return columns, render()
+
+
+def open_workbook(input_file, streaming):
+    """
+    Opens a workbook for read_sheet: with openpyxl in read only mode when
+    streaming, else as a pd.ExcelFile. input_file is a path or an open
+    binary file.
+    """
+    if streaming:
+        return load_workbook(input_file, read_only=True, data_only=True, keep_links=False)
+    return pd.ExcelFile(input_file)
+
+
+def workbook_sheet_names(workbook):
+    if isinstance(workbook, pd.ExcelFile):
+        return workbook.sheet_names
+    return [worksheet.title for worksheet in workbook.worksheets]
+
+
+def read_sheet(workbook, sheet_name):
+    """
+    Returns (column names, generator of rendered table rows) for one sheet
+    of a workbook from open_workbook. When streaming, most of the parsing
+    happens as the rows are rendered, so it is profiled as rendering.
+    """
+    with profiling.stage("xlsx parse", sheet_name):
+        if isinstance(workbook, pd.ExcelFile):
+            df = workbook.parse(sheet_name)
+            return df.columns, render_table_rows(df)
+        return read_sheet_streaming(workbook[sheet_name])
+
+
+def read_workbook(input_file, streaming):
+    """
+    Yields (sheet name, column names, rendered table rows) for each sheet.
+    input_file is a path or an open binary file.
+    """
+    workbook = open_workbook(input_file, streaming)
+    try:
+        sheet_names = workbook_sheet_names(workbook)
+        for index, sheet_name in enumerate(sheet_names):
+            progress.report("xlsx sheets", sheet_name, index, len(sheet_names))
+            columns, rows = read_sheet(workbook, sheet_name)
+            yield sheet_name, columns, rows
+    finally:
+        workbook.close()
+
+
+def write_sheet(adoc_file, sheet_name, columns, rows, sheet_images, image_output_dir):
+    """
+    Writes one sheet: its title, its images and its table.
+    """
+    adoc_file.write(f"# {sheet_name}\n\n")
+
+    for img_name in sheet_images:
+        img_path = os.path.join(image_output_dir, f"{img_name}") 
+        adoc_file.write(f"image::{img_path}[{img_name}]\n\n") 
+    num_cols = len(columns)
+    col_widths = ["3"] + ["1"] * (num_cols -1)
+    col_widths_str = ",".join(col_widths)
+
+    adoc_file.write(f"[cols=\"{col_widths_str}\", options=\"header\"]\n|===\n")
+    adoc_file.write("| " + " | ".join(escape_cell(str(column)) for column in columns) + "\n")
+    for chunk in rows:
+        adoc_file.write(chunk)
+    adoc_file.write("|===\n\n")
+
+
+@functools.lru_cache(maxsize=1)
+def worker_workbook(input_file, streaming):
+    """
+    The workbook a sheet worker process reads from, opened once per process
+    rather than once per sheet.
+    """
+    return open_workbook(input_file, streaming)
+
+
+def write_sheet_profiled(adoc_file, sheet_name, columns, rows, sheet_images, image_output_dir):
+    with profiling.stage("xlsx render", sheet_name) as record:
+        start = profiling.file_position(adoc_file)
+        write_sheet(adoc_file, sheet_name, columns, rows, sheet_images, image_output_dir)
+        record["bytes_out"] = profiling.file_position(adoc_file) - start
+
+
+def render_sheet_part(input_file, streaming, sheet_name, sheet_images, image_output_dir, part_path, profile=False):
+    """
+    Renders one sheet into its own file, in a sheet worker process.
+
+        Returns:
+            tuple: (seconds taken, profiling records of the sheet)
+    """
+    profiling.configure(profile)
+    start = time.perf_counter()
+    columns, rows = read_sheet(worker_workbook(input_file, streaming), sheet_name)
+    with open(part_path, 'w', encoding='utf-8') as part:
+        write_sheet_profiled(part, sheet_name, columns, rows, sheet_images, image_output_dir)
+    return time.perf_counter() - start, profiling.take_records()
+
+
+def write_sheets_parallel(adoc_file, input_file, workbook_file, streaming, images, image_output_dir, workers):
+    """
+    Renders the sheets in a pool of worker processes, each into a temporary
+    part, then appends the parts to adoc_file in sheet order, so the result
+    is the same as writing them one after another.
+    """
+    workbook = open_workbook(workbook_file, streaming)
+    try:
+        sheet_names = workbook_sheet_names(workbook)
+    finally:
+        workbook.close()
+
+    with tempfile.TemporaryDirectory() as part_dir, \
+            ProcessPoolExecutor(max_workers=min(workers, len(sheet_names) or 1)) as executor:
+        parts = []
+        for index, sheet_name in enumerate(sheet_names):
+            part_path = os.path.join(part_dir, f"{index}.adoc")
+            parts.append((sheet_name, part_path, executor.submit(
+                render_sheet_part, os.path.abspath(input_file), streaming, sheet_name,
+                images.get(sheet_name, []), image_output_dir, part_path, profiling.RECORDS is not None)))
+
+        for index, (sheet_name, part_path, result) in enumerate(parts):
+            progress.report("xlsx sheets", sheet_name, index, len(parts))
+            seconds, records = result.result()
+            profiling.add_records(records)
+            logging.info(f"Sheet {sheet_name} of {input_file} rendered in {seconds:.2f}s")
+            with open(part_path, 'r', encoding='utf-8') as part:
+                shutil.copyfileobj(part, adoc_file)
+
+
+def convert_xlsx_to_adoc_with_images(input_file, output_file, image_output_dir, streaming=None, sheet_workers=1): 
     """ 
     Converts an Excel file to a Markdown file with data and images. 
         Args: 
             input_file (str): Path to the input .xlsx file. 
             output_file (str): Path to save the output .md file. 
             image_output_dir (str): Directory to save extracted images. 
+            streaming (bool): Read sheets a chunk of rows at a time, by default
+                when the file is larger than STREAMING_THRESHOLD_MB.
+            sheet_workers (int): Number of processes rendering sheets; 1
+                renders them one after another in this process.
     """ 
+    if streaming is None:
+        streaming = os.path.getsize(input_file) > STREAMING_THRESHOLD_MB * 1024 * 1024
     try: # Extract images 
-        images = extract_images_from_xlsx(input_file, image_output_dir) 
-        # Load the Excel data 
-        excel_data = pd.ExcelFile(input_file) 
-        with open(f"{output_file}/{output_file}.adoc", 'w', encoding='utf-8') as adoc_file: 
-            for sheet_name in excel_data.sheet_names: # Write the sheet name 
-                adoc_file.write(f"# {sheet_name}\n\n")
-
-                if sheet_name in images:
-                    for img_name in images[sheet_name]:
-                        img_path = os.path.join(image_output_dir, f"{img_name}") 
-                        adoc_file.write(f"image::{img_path}[{img_name}]\n\n") 
-                df = excel_data.parse(sheet_name) 
-                num_cols = len(df.columns)
-                col_widths = ["3"] + ["1"] * (num_cols -1)
-                col_widths_str = ",".join(col_widths)
-
-                adoc_file.write(f"[cols=\"{col_widths_str}\", options=\"header\"]\n|===\n")
-                adoc_file.write("| " + " | ".join(df.columns) + "\n")
-                for _, row in df.iterrows():
-                    adoc_file.write("| " + " | ".join(map(str, row)) + "\n") 
-                adoc_file.write("|===\n\n")
+        # The file is opened once; image extraction and sheet parsing share it
+        with open(input_file, "rb") as workbook_file, ZipFile(workbook_file) as archive:
+            with profiling.stage("xlsx images", input_file) as record:
+                images = extract_images_from_xlsx(input_file, image_output_dir, archive)
+                record["bytes_out"] = profiling.directory_size(image_output_dir)
+            with open(f"{output_file}/{output_file}.adoc", 'w', encoding='utf-8') as adoc_file: 
+                if sheet_workers > 1:
+                    write_sheets_parallel(adoc_file, input_file, workbook_file, streaming, images,
+                                          image_output_dir, sheet_workers)
+                else:
+                    start = time.perf_counter()
+                    for sheet_name, columns, rows in read_workbook(workbook_file, streaming):
+                        write_sheet_profiled(adoc_file, sheet_name, columns, rows, images.get(sheet_name, []),
+                                             image_output_dir)
+                        logging.info(f"Sheet {sheet_name} of {input_file} rendered in {time.perf_counter() - start:.2f}s")
+                        start = time.perf_counter()
 
         print(f"Successfully converted {input_file} to {output_file}.adoc with images in {image_output_dir}") 
     except Exception as e: 
         print(f"Error occurred: {e}") 
+        raise
         
 
+def convert_xlsx_in_memory(source, image_dir="extracted_images/", streaming=None):
+    """
+    convert_xlsx_to_adoc_with_images without writing anything.
+
+        Args:
+            source (file): The workbook as a seekable binary file.
+            image_dir (str): Folder the image links point to.
+            streaming (bool): As for convert_xlsx_to_adoc_with_images.
+        Returns:
+            tuple: (AsciiDoc, dict of image path as linked -> image bytes)
+    """
+    if streaming is None:
+        source.seek(0, os.SEEK_END)
+        streaming = source.tell() > STREAMING_THRESHOLD_MB * 1024 * 1024
+        source.seek(0)
+    images = {}
+
+    def read_image(media_file, image_source):
+        images[os.path.join(image_dir, posixpath.basename(media_file))] = image_source.read()
+
+    with ZipFile(source) as archive:
+        with profiling.stage("xlsx images") as record:
+            sheet_images = find_images_in_xlsx(archive, read_image)
+            record["bytes_out"] = sum(map(len, images.values()))
+
+    adoc_file = io.StringIO()
+    source.seek(0)
+    for sheet_name, columns, rows in read_workbook(source, streaming):
+        write_sheet_profiled(adoc_file, sheet_name, columns, rows, sheet_images.get(sheet_name, []), image_dir)
+    return adoc_file.getvalue(), images
+
+
 def main():
     '''
     Main fuction will take two arguments (input_file) and run a docx to asciidoc conversion of the file, put all media in to its own folder "/media/media", edit the asciidoc file to change all .emf strings to .png strings and convert all emf images to png images"
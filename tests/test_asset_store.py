@@ -0,0 +1,84 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import assetStore
+
+
+class AssetStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.directory.name, "store")
+        assetStore.configure(self.store)
+        self.renders = 0
+
+    def tearDown(self):
+        assetStore.configure(None)
+        self.directory.cleanup()
+
+    def target(self, document, name):
+        folder = os.path.join(self.directory.name, document, "media")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name)
+
+    def stored_files(self):
+        return sorted(name for _, _, names in os.walk(self.store) for name in names)
+
+    def render(self, data, path):
+        self.renders += 1
+        with open(path, "wb") as file:
+            file.write(b"png of " + data)
+
+    def read(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+    def test_same_image_is_stored_once_and_linked(self):
+        first, second = self.target("one", "image1.png"), self.target("two", "image7.png")
+        assetStore.write_asset(b"image", first)
+        assetStore.write_asset(b"image", second)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        self.assertEqual(self.read(second), b"image")
+
+    def test_converted_image_is_rendered_once(self):
+        first, second = self.target("one", "image1.png"), self.target("two", "image1.png")
+        assetStore.write_asset(b"emf", first, self.render)
+        assetStore.write_asset(b"emf", second, self.render)
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(self.read(second), b"png of emf")
+
+    def test_extension_is_part_of_the_entry(self):
+        assetStore.write_asset(b"image", self.target("one", "image1.png"))
+        assetStore.write_asset(b"image", self.target("one", "image1.emf"))
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_copied_and_written_images_share_an_entry(self):
+        written, copied = self.target("one", "image1.png"), self.target("two", "image1.png")
+        assetStore.write_asset(b"image", written)
+        assetStore.copy_asset(io.BytesIO(b"image"), copied)
+        self.assertEqual(os.stat(written).st_ino, os.stat(copied).st_ino)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_replacing_a_target_leaves_the_store_alone(self):
+        target = self.target("one", "image1.png")
+        assetStore.write_asset(b"old", target)
+        assetStore.write_asset(b"new", target)
+        self.assertEqual(self.read(target), b"new")
+        stored = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(self.store) for name in names]
+        self.assertEqual(sorted(map(self.read, stored)), [b"new", b"old"])
+
+    def test_without_store_each_document_has_its_own_file(self):
+        assetStore.configure(None)
+        first, second = self.target("one", "image1.png"), self.target("two", "image1.png")
+        assetStore.write_asset(b"image", first)
+        assetStore.copy_asset(io.BytesIO(b"image"), second)
+        self.assertNotEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        self.assertFalse(os.path.exists(self.store))
+
+
+if __name__ == "__main__":
+    unittest.main()
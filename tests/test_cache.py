@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import assetStore
+import cache
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.max_bytes = cache.MAX_CACHE_BYTES
+        cache.configure(os.path.join(self.root, "cache"), 2048)
+        assetStore.configure(None)
+        cache.take_stats()
+
+    def tearDown(self):
+        cache.configure(None)
+        cache.MAX_CACHE_BYTES = self.max_bytes
+        assetStore.configure(None)
+        self.directory.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+
+class StageKeyTest(unittest.TestCase):
+    def test_same_inputs_give_same_key(self):
+        self.assertEqual(cache.stage_key("abc", "pandoc", "doc/", 1), cache.stage_key("abc", "pandoc", "doc/", 1))
+
+    def test_every_part_changes_the_key(self):
+        key = cache.stage_key("abc", "pandoc", "doc/", 1)
+        self.assertNotEqual(cache.stage_key("abd", "pandoc", "doc/", 1), key)
+        self.assertNotEqual(cache.stage_key("abc", "media", "doc/", 1), key)
+        self.assertNotEqual(cache.stage_key("abc", "pandoc", "doc2/", 1), key)
+        self.assertNotEqual(cache.stage_key("abc", "pandoc", "doc/", 2), key)
+        self.assertNotEqual(cache.stage_key("abc", "pandoc", "doc/"), key)
+
+    def test_settings_are_not_concatenated(self):
+        self.assertNotEqual(cache.stage_key("abc", "pandoc", "ab", "c"), cache.stage_key("abc", "pandoc", "a", "bc"))
+
+    def test_key_names_its_stage(self):
+        self.assertTrue(cache.stage_key("abc", "pandoc").startswith("pandoc-"))
+
+
+class StoreTest(CacheTest):
+    def test_lookup_after_store(self):
+        self.assertIsNone(cache.lookup("text-1"))
+        cache.store("text-1", text="formatted")
+        entry = cache.lookup("text-1")
+        self.assertEqual(cache.read_text(entry), "formatted")
+        self.assertEqual(cache.take_stats(), (1, 1))
+
+    def test_files_are_restored(self):
+        media = self.path("doc", "media")
+        self.write(os.path.join(media, "a.png"), b"image")
+        cache.store("media-1", files_dir=media)
+        cache.restore_files(cache.lookup("media-1"), self.path("again"))
+        with open(self.path("again", "a.png"), "rb") as file:
+            self.assertEqual(file.read(), b"image")
+
+    def test_nothing_is_kept_when_off(self):
+        cache.configure(None)
+        cache.store("text-1", text="formatted")
+        self.assertIsNone(cache.lookup("text-1"))
+        self.assertFalse(os.path.exists(self.path("cache")))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        # Room for two entries of 600 bytes
+        cache.MAX_CACHE_BYTES = 1300
+        cache.store("a", text="a" * 600)
+        cache.store("b", text="b" * 600)
+        os.utime(self.path("cache", "a"), (1000, 1000))
+        os.utime(self.path("cache", "b"), (2000, 2000))
+        # Looking an entry up makes it the most recently used
+        cache.lookup("a")
+        cache.store("c", text="c" * 600)
+        self.assertEqual(sorted(os.listdir(self.path("cache"))), ["a", "c"])
+
+    def test_entry_larger_than_the_cache_is_not_kept(self):
+        cache.MAX_CACHE_BYTES = 100
+        cache.store("a", text="a" * 600)
+        self.assertIsNone(cache.lookup("a"))
+
+
+class AssetStoreCacheTest(CacheTest):
+    def test_stored_media_stay_linked_to_the_store(self):
+        assetStore.configure(self.path("store"))
+        media = self.path("doc", "media")
+        os.makedirs(media)
+        assetStore.write_asset(b"image", os.path.join(media, "a.png"))
+        self.write(os.path.join(media, "notes.txt"), b"own file")
+        stored = os.stat(os.path.join(media, "a.png")).st_ino
+
+        cache.store("media-1", files_dir=media)
+        entry = cache.lookup("media-1")
+        self.assertEqual(os.stat(os.path.join(entry, "files", "a.png")).st_ino, stored)
+
+        restored = self.path("again", "media")
+        cache.restore_files(entry, restored)
+        self.assertEqual(os.stat(os.path.join(restored, "a.png")).st_ino, stored)
+        # Files not from the store are copied, so writing them leaves the entry as it was
+        self.assertNotEqual(os.stat(os.path.join(restored, "notes.txt")).st_ino,
+                            os.stat(os.path.join(media, "notes.txt")).st_ino)
+
+    def test_restore_replaces_rather_than_writes_through_a_link(self):
+        assetStore.configure(self.path("store"))
+        media = self.path("doc", "media")
+        os.makedirs(media)
+        assetStore.write_asset(b"old", os.path.join(media, "a.png"))
+        cache.store("media-1", files_dir=media)
+
+        other = self.path("other", "media")
+        os.makedirs(other)
+        assetStore.write_asset(b"new", os.path.join(other, "a.png"))
+        cache.restore_files(cache.lookup("media-1"), other)
+        with open(os.path.join(other, "a.png"), "rb") as file:
+            self.assertEqual(file.read(), b"old")
+        # The store's copy of the image that was replaced is untouched
+        store_files = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(self.path("store")) for name in names]
+        contents = sorted(open(path, "rb").read() for path in store_files)
+        self.assertEqual(contents, [b"new", b"old"])
+
+    def test_without_store_files_are_copied(self):
+        media = self.path("doc", "media")
+        os.makedirs(media)
+        self.write(self.path("elsewhere.png"), b"image")
+        os.link(self.path("elsewhere.png"), os.path.join(media, "a.png"))
+        cache.store("media-1", files_dir=media)
+        entry = cache.lookup("media-1")
+        self.assertNotEqual(os.stat(os.path.join(entry, "files", "a.png")).st_ino,
+                            os.stat(os.path.join(media, "a.png")).st_ino)
+
+
+if __name__ == "__main__":
+    unittest.main()
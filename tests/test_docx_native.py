@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+from zipfile import ZipFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import docxConverter
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+NAMESPACES = (f'xmlns:w="{W_NS}" xmlns:r="{REL_NS}" '
+              'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+              'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+              'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"')
+
+PARAGRAPH = '<w:p><w:r><w:t>Some text</w:t></w:r></w:p>'
+
+TABLE = ('<w:tbl><w:tblPr><w:tblLook w:val="04A0" w:firstRow="1"/></w:tblPr>'
+         '<w:tblGrid><w:gridCol{width}/></w:tblGrid>'
+         '<w:tr><w:tc><w:p><w:r><w:t>Head</w:t></w:r></w:p></w:tc></w:tr>'
+         '<w:tr><w:tc><w:p><w:r><w:t>Cell</w:t></w:r></w:p></w:tc></w:tr></w:tbl>')
+
+LIST_ITEM = ('<w:p><w:pPr><w:numPr><w:ilvl w:val="{level}"/><w:numId w:val="1"/></w:numPr></w:pPr>'
+             '<w:r><w:t>Item</w:t></w:r></w:p>')
+
+NUMBERING = (f'<w:numbering xmlns:w="{W_NS}"><w:abstractNum w:abstractNumId="1">'
+             '<w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="decimal"/></w:lvl></w:abstractNum>'
+             '<w:num w:numId="1">{abstract}</w:num></w:numbering>')
+
+PICTURE = ('<w:p><w:r><w:drawing><wp:inline><wp:extent {extent}/><wp:docPr id="1" name="Picture 1"/>'
+           '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+           '<pic:pic><pic:blipFill><a:blip r:embed="rIdImage1"/></pic:blipFill></pic:pic>'
+           '</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>')
+
+
+def relationships(rels):
+    return (f'<Relationships xmlns="{PKG_REL_NS}">'
+            + "".join(f'<Relationship Id="{rid}" Type="{REL_NS}/{kind}" Target="{target}"/>'
+                      for rid, kind, target in rels)
+            + "</Relationships>")
+
+
+def write_docx(path, body, numbering=None, document=None):
+    """Writes a docx holding body, or the given document.xml, with an image part and optional numbering."""
+    if document is None:
+        document = f'<w:document {NAMESPACES}><w:body>{body}</w:body></w:document>'
+    rels = [("rIdImage1", "image", "media/image1.png")]
+    if numbering is not None:
+        rels.append(("rIdNumbering", "numbering", "numbering.xml"))
+    with ZipFile(path, "w") as archive:
+        archive.writestr("_rels/.rels", relationships([("rId1", "officeDocument", "word/document.xml")]))
+        archive.writestr("word/_rels/document.xml.rels", relationships(rels))
+        archive.writestr("word/document.xml", document)
+        archive.writestr("word/media/image1.png", b"")
+        if numbering is not None:
+            archive.writestr("word/numbering.xml", numbering)
+
+
+class FallbackTest(unittest.TestCase):
+    """Documents the native reader cannot parse are left to pandoc rather than failing."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "doc.docx")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def convert(self, body="", **parts):
+        write_docx(self.path, body, **parts)
+        return docxConverter.convert_docx_to_adoc(self.path, "doc/extracted_media/")
+
+    def assert_falls_back(self, body="", **parts):
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(self.convert(body, **parts))
+
+    def test_well_formed_documents_convert(self):
+        # The documents below differ from these only in the broken markup
+        self.assertIsNotNone(self.convert(PARAGRAPH + TABLE.format(width=' w:w="9360"')))
+        self.assertIsNotNone(self.convert(LIST_ITEM.format(level="0"),
+                                          numbering=NUMBERING.format(abstract='<w:abstractNumId w:val="1"/>')))
+        self.assertIsNotNone(self.convert(PICTURE.format(extent='cx="952500" cy="952500"')))
+
+    def test_grid_column_without_width(self):
+        self.assert_falls_back(PARAGRAPH + TABLE.format(width=""))
+
+    def test_non_numeric_list_level(self):
+        self.assert_falls_back(LIST_ITEM.format(level="x"),
+                               numbering=NUMBERING.format(abstract='<w:abstractNumId w:val="1"/>'))
+
+    def test_list_without_abstract_numbering(self):
+        self.assert_falls_back(LIST_ITEM.format(level="0"), numbering=NUMBERING.format(abstract=""))
+
+    def test_picture_without_size(self):
+        self.assert_falls_back(PICTURE.format(extent='cy="952500"'))
+
+    def test_malformed_document_xml(self):
+        self.assert_falls_back(document=f'<w:document {NAMESPACES}><w:body>{PARAGRAPH}</w:document>')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import formatting
+import main_no_gui
+
+# Cases where a line-by-line formatter could go wrong: table of contents,
+# captions separated from their image by blank lines or on the same line,
+# a bibliography heading inside a line, repeated and quoted entries
+EDGE_DOCUMENT = """Intro [3] text ++bad++ and <<x>> see [SOURCE: foo]
+
+Table of Contents
+
+link:#_Toc1[Intro]
+
+== Intro [#_Toc12 .anchor]####Heading {empty}
+
+image:doc/extracted_media/media/a.emf[a] image:doc/extracted_media/media/b.wmf[b]
+
+Figure 1: caption of two [SOURCE: s] ++
+
+image:doc/extracted_media/media/c.png[c] Figure 2: inline caption == Bibliography
+[3] mid entry
+Note: something [4] here
+
+== Bibliography
+
+[3] Three <<q>>
+[4] Four {empty}
+[4] Four again
+Note: [3] cite
+image:doc/extracted_media/media/d.png[d]
+
+Figure 9: last
+image:doc/extracted_media/media/e.png[e] image:doc/extracted_media/media/f.png[f] PLEASE
+[#_Toc1 .anchor]####Table 3: x [#_Ref2 .anchor]### y [#_Ref2 .anchor]####Tablex [#_Toc .anchor]##z
+image:doc/extracted_media/media/g.png[g]
+
+
+Figure 3: after blanks
+image:doc/extracted_media/media/h.png[h]
+image:doc/extracted_media/media/i.png[i]
+   
+Figure 4: after image run [3]
+Figure 5 image:doc/extracted_media/media/j.png[j]
+image:x.png[] Figure 6: same line
+"""
+
+# Lines a generated document is made of, see generated_document()
+GENERATED_LINES = ["Some text [1] and [2].\n", "\n", "Note: a boxed line\n", "EXAMPLE 2: another\n",
+                   "image:doc/extracted_media/media/p.emf[p]\n", "Figure 3: a caption\n", "x ++ y <<ref>>\n",
+                   "[SOURCE: somewhere]\n", "[#_Ref5 .anchor]####Table 1: t\n", "{empty}\n", "=== Heading\n"]
+
+
+def generated_document(rng, lines):
+    body = [rng.choice(GENERATED_LINES) for _ in range(lines)]
+    bibliography = [f"[{key}] Entry {key} <<x>>\n" for key in range(1, rng.randint(2, 6))]
+    return "".join(["Table of Contents\n\n", "toc line\n\n", "== Start\n"] + body +
+                   ["\n== Bibliography\n\n"] + bibliography + body[:rng.randint(0, 10)])
+
+
+def format_streaming(content, output_file="doc"):
+    bibliography = formatting.index_bibliography(io.StringIO(content))
+    return "".join(formatting.format_lines(io.StringIO(content), output_file, bibliography))
+
+
+class BibliographyTest(unittest.TestCase):
+    def test_entry_quoted_inside_another_is_linked_not_anchored(self):
+        # The one-replace-per-entry version also anchored the quoted text,
+        # splitting entry 3 and giving the document two bib1 anchors
+        content = ("See [1] and [3].\n\n== Bibliography\n\n"
+                   "[1] Smith, J. Title.\n\n"
+                   "[3] Reprinted from [1] Smith, J. Title.\n")
+        keys, content = formatting.add_anchors_to_bibliography(content)
+        self.assertEqual(formatting.add_links_to_bibliography(content, keys),
+                         "See link:#bib1[[1\\]] and link:#bib3[[3\\]].\n\n== Bibliography\n\n"
+                         "[#bib1]\n[1] Smith, J. Title.\n\n"
+                         "[#bib3]\n[3] Reprinted from link:#bib1[[1\\]] Smith, J. Title.\n")
+
+    def test_repeated_key_anchors_its_last_entry(self):
+        content = "== Bibliography\n\n[1] First.\n\n[1] Second.\n"
+        keys, content = formatting.add_anchors_to_bibliography(content)
+        self.assertEqual(list(keys), ["1"])
+        self.assertEqual(content, "== Bibliography\n\n[1] First.\n\n[#bib1]\n[1] Second.\n")
+
+
+class StreamingTest(unittest.TestCase):
+    """format_content and the streaming formatter write what the one-rule-at-a-time functions did."""
+
+    def setUp(self):
+        self.block_lines = formatting.BLOCK_LINES
+
+    def tearDown(self):
+        formatting.BLOCK_LINES = self.block_lines
+
+    def assert_same_output(self, content):
+        expected = main_no_gui.process_content_legacy(content, "doc")
+        self.assertEqual(formatting.format_content(content, "doc"), expected)
+        # Block boundaries fall on every line, a few lines and never
+        for block_lines in (1, 3, self.block_lines):
+            formatting.BLOCK_LINES = block_lines
+            self.assertEqual(format_streaming(content), expected, f"{block_lines} lines per block")
+
+    def test_edge_cases(self):
+        self.assert_same_output(EDGE_DOCUMENT)
+
+    def test_without_bibliography(self):
+        with self.assertLogs(level="WARNING"):
+            self.assert_same_output("Text [1] and image:doc/extracted_media/media/a.png[a]\nFigure 1: cap\n")
+
+    def test_generated_documents(self):
+        rng = random.Random(0)
+        for _ in range(30):
+            self.assert_same_output(generated_document(rng, rng.randint(1, 40)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import sections
+
+DOCUMENT = """Preamble text
+
+[[_Toc1]]
+== First Part
+
+Text of the first part.
+
+=== Detail
+
+----
+== not a title inside a listing
+----
+
+== Second Part
+
+image::extracted_media/media/a.png[a]
+**PLEASE REVIEW HERE**
+
+== First Part
+
+Same title again.
+"""
+
+
+class SplitSectionsTest(unittest.TestCase):
+    def split(self, level):
+        return list(sections.split_sections(DOCUMENT.splitlines(keepends=True), level))
+
+    def test_texts_join_to_the_document(self):
+        for level in (1, 2):
+            self.assertEqual("".join(text for _, text in self.split(level)), DOCUMENT)
+
+    def test_splits_at_titles_of_the_level_and_above(self):
+        self.assertEqual([title for title, _ in self.split(1)], [None, "First Part", "Second Part", "First Part"])
+        self.assertEqual([title for title, _ in self.split(2)],
+                         [None, "First Part", "Detail", "Second Part", "First Part"])
+
+    def test_anchor_above_a_title_moves_with_it(self):
+        preamble, (_, first) = self.split(1)[:2]
+        self.assertEqual(preamble, (None, "Preamble text\n\n"))
+        self.assertTrue(first.startswith("[[_Toc1]]\n== First Part\n"))
+
+    def test_lines_inside_delimited_blocks_are_not_titles(self):
+        _, first = self.split(1)[1]
+        self.assertIn("== not a title inside a listing\n", first)
+
+    def test_chunks_split_mid_line_give_the_same_lines(self):
+        chunks = [DOCUMENT[start:start + 7] for start in range(0, len(DOCUMENT), 7)]
+        self.assertEqual(list(sections.lines_of(chunks)), DOCUMENT.splitlines(keepends=True))
+
+
+class WriteSectionsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "doc", "doc.adoc")
+        os.makedirs(os.path.dirname(self.output))
+        self.sections_dir = os.path.join(self.directory.name, "doc", sections.SECTIONS_DIR)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+
+    def mtimes(self):
+        paths = [self.output] + [os.path.join(self.sections_dir, name) for name in os.listdir(self.sections_dir)]
+        return {path: os.stat(path).st_mtime_ns for path in paths}
+
+    def backdate(self):
+        # Older than any write the test makes, whatever the clock's resolution
+        for path in self.mtimes():
+            os.utime(path, ns=(0, 0))
+
+    def test_master_includes_the_sections_in_order(self):
+        result = sections.write_sections(self.output, DOCUMENT, 1)
+        self.assertEqual(result, {"sections": 3, "written": 4, "removed": 0})
+        self.assertEqual(self.read(self.output),
+                         "Preamble text\n\n"
+                         "include::sections/first-part.adoc[]\n"
+                         "// second-part: 1 image to review\n"
+                         "include::sections/second-part.adoc[]\n"
+                         "include::sections/first-part-2.adoc[]\n")
+        self.assertEqual(self.read(os.path.join(self.sections_dir, "first-part-2.adoc")),
+                         "== First Part\n\nSame title again.\n")
+
+    def test_unchanged_files_keep_their_mtime(self):
+        sections.write_sections(self.output, DOCUMENT, 1)
+        self.backdate()
+        result = sections.write_sections(self.output, DOCUMENT, 1)
+        self.assertEqual(result["written"], 0)
+        self.assertEqual(set(self.mtimes().values()), {0})
+
+    def test_only_changed_section_is_rewritten(self):
+        sections.write_sections(self.output, DOCUMENT, 1)
+        self.backdate()
+        changed = DOCUMENT.replace("Same title again.", "Edited.")
+        result = sections.write_sections(self.output, iter([changed[:40], changed[40:]]), 1)
+        self.assertEqual(result["written"], 1)
+        self.assertEqual([os.path.basename(path) for path, mtime in self.mtimes().items() if mtime],
+                         ["first-part-2.adoc"])
+
+    def test_sections_that_no_longer_exist_are_removed(self):
+        sections.write_sections(self.output, DOCUMENT, 1)
+        shorter = DOCUMENT[:DOCUMENT.index("== Second Part")]
+        result = sections.write_sections(self.output, shorter, 1)
+        self.assertEqual(result["removed"], 2)
+        self.assertEqual(os.listdir(self.sections_dir), ["first-part.adoc"])
+
+    def test_write_if_changed(self):
+        path = os.path.join(self.directory.name, "file.adoc")
+        self.assertTrue(sections.write_if_changed(path, "text"))
+        self.assertFalse(sections.write_if_changed(path, "text"))
+        self.assertTrue(sections.write_if_changed(path, "other"))
+        self.assertEqual(self.read(path), "other")
+        self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import shards
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        # Manifests record the outputs under <stem>/ of the working directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous = os.getcwd()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.previous)
+        self.directory.cleanup()
+
+    def write(self, path, size):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"x" * size)
+        return path
+
+
+class ParseShardTest(unittest.TestCase):
+    def test_parses_index_and_count(self):
+        self.assertEqual(shards.parse_shard("2/4"), (2, 4))
+
+    def test_rejects_shards_that_do_not_exist(self):
+        for text in ("0/4", "5/4", "2", "a/b"):
+            with self.assertRaises(ValueError):
+                shards.parse_shard(text)
+
+
+class AssignShardsTest(ShardTest):
+    def test_every_input_goes_to_one_shard_in_input_order(self):
+        inputs = [self.write(f"in/doc{n}.docx", 1000 * n) for n in range(20)]
+        assigned = shards.assign_shards(inputs, 3)
+        self.assertEqual(len(assigned), 3)
+        self.assertEqual(sorted(sum(assigned, [])), sorted(inputs))
+        for shard in assigned:
+            self.assertEqual(shard, [input for input in inputs if input in shard])
+
+    def test_same_split_every_time(self):
+        inputs = [self.write(f"in/doc{n}.docx", 1000 * n) for n in range(20)]
+        self.assertEqual(shards.assign_shards(inputs, 4), shards.assign_shards(list(inputs), 4))
+
+    def test_shards_stay_within_the_slack_of_an_even_share(self):
+        inputs = [self.write(f"in/doc{n}.docx", 50000 + 7919 * n % 40000) for n in range(40)]
+        work = {input: os.path.getsize(input) + shards.FILE_COST_BYTES for input in inputs}
+        share = sum(work.values()) / 4
+        for shard in shards.assign_shards(inputs, 4):
+            self.assertLessEqual(sum(work[input] for input in shard), share * (1 + shards.BALANCE_SLACK))
+
+    def test_adding_a_file_moves_few_others(self):
+        inputs = [self.write(f"in/doc{n}.docx", 1000) for n in range(40)]
+        before = {input: index for index, shard in enumerate(shards.assign_shards(inputs, 4)) for input in shard}
+        added = inputs + [self.write("in/new.docx", 1000)]
+        after = {input: index for index, shard in enumerate(shards.assign_shards(added, 4)) for input in shard}
+        moved = [input for input in inputs if before[input] != after[input]]
+        self.assertLessEqual(len(moved), 4)
+
+
+class ManifestTest(ShardTest):
+    def result(self, input, error=None, seconds=1.0):
+        # The tuple convert_file returns
+        return input, error, seconds, (0, 1), []
+
+    def test_records_outputs_with_checksums(self):
+        self.write("a.docx", 10)
+        self.write("a/a.adoc", 5)
+        shards.start_manifest("m.jsonl", ["a.docx"], "1/2")
+        shards.add_to_manifest("m.jsonl", self.result("a.docx"), "1/2")
+        header, records = shards.read_manifest("m.jsonl")
+        self.assertEqual((header["shard"], header["inputs"]), ("1/2", ["a.docx"]))
+        self.assertEqual([output["path"] for output in records[0]["outputs"]], ["a/a.adoc"])
+        self.assertEqual(records[0]["outputs"][0]["bytes"], 5)
+
+    def test_incomplete_last_line_is_ignored(self):
+        self.write("a.docx", 10)
+        shards.start_manifest("m.jsonl", ["a.docx", "b.docx"])
+        shards.add_to_manifest("m.jsonl", self.result("a.docx"))
+        with open("m.jsonl", "a", encoding="utf-8") as file:
+            file.write('{"input": "b.do')
+        with self.assertLogs(level="WARNING"):
+            _, records = shards.read_manifest("m.jsonl")
+        self.assertEqual([record["input"] for record in records], ["a.docx"])
+
+    def test_merge_keeps_latest_record_and_reports_gaps(self):
+        for name in ("a.docx", "b.docx", "c.docx"):
+            self.write(name, 10)
+        shards.start_manifest("1.jsonl", ["a.docx", "b.docx"], "1/3")
+        shards.add_to_manifest("1.jsonl", self.result("a.docx", error="pandoc failed"), "1/3")
+        shards.add_to_manifest("1.jsonl", self.result("b.docx"), "1/3")
+        shards.start_manifest("rerun.jsonl", ["a.docx"], "1/3")
+        shards.add_to_manifest("rerun.jsonl", self.result("a.docx"), "1/3")
+
+        inputs, latest, failed, missing, missing_shards = shards.merge_manifests(
+            ["rerun.jsonl", "1.jsonl"], expected_inputs=["c.docx"])
+        self.assertEqual(inputs, ["c.docx", "a.docx", "b.docx"])
+        self.assertIsNone(latest["a.docx"]["error"])
+        self.assertEqual(failed, [])
+        self.assertEqual(missing, ["c.docx"])
+        self.assertEqual(missing_shards, ["2/3", "3/3"])
+
+        shards.write_merged_manifest("merged.jsonl", inputs, latest)
+        header, records = shards.read_manifest("merged.jsonl")
+        self.assertEqual(header["inputs"], inputs)
+        self.assertEqual([record["input"] for record in records], ["a.docx", "b.docx"])
+
+    def test_unfinished_inputs_are_failed_and_missing_ones(self):
+        for name in ("a.docx", "b.docx"):
+            self.write(name, 10)
+        shards.start_manifest("m.jsonl", ["a.docx", "b.docx", "c.docx"])
+        shards.add_to_manifest("m.jsonl", self.result("a.docx"))
+        shards.add_to_manifest("m.jsonl", self.result("b.docx", error="pandoc failed"))
+        self.assertEqual(shards.unfinished_inputs("m.jsonl"), ["b.docx", "c.docx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
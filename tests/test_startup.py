@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+# Loaded by the converters that need them, never when an entry point starts
+LAZY_MODULES = ["pandas", "openpyxl", "PIL", "xlsxConverter", "imageConverter", "docxConverter", "imageOptimizer"]
+
+
+def modules_loaded_by(module):
+    """Imports module in a fresh interpreter and returns the LAZY_MODULES it loaded."""
+    script = f"import sys\nimport {module}\nprint(','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=SRC_DIR, check=True,
+                            capture_output=True, text=True)
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+class StartupTest(unittest.TestCase):
+    def test_cli_does_not_load_backends(self):
+        self.assertEqual(modules_loaded_by("main_no_gui"), [])
+
+    def test_api_does_not_load_backends(self):
+        self.assertEqual(modules_loaded_by("api"), [])
+
+    def test_gui_does_not_load_backends(self):
+        try:
+            import tkinter
+        except ImportError:
+            self.skipTest("tkinter is not installed")
+        self.assertEqual(modules_loaded_by("main"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import random
+import datetime
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+import xlsxConverter
+
+# Cell values whose typing depends on the rest of their column
+VALUES = [0, 1, 2, -1, 3, 10 ** 20, 1.5, -0.25, True, False, "x", "l1\nl2", "a|b", "1", "0", "1.0", "True",
+          "false", "nan", "NA", "", None, " 7 ", "1e5", datetime.datetime(2024, 1, 2), datetime.date(2024, 1, 3)]
+
+
+class XlsxStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "book.xlsx")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_sheet(self, rows):
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.title = "Sheet"
+        for row in rows:
+            worksheet.append(row)
+        workbook.save(self.path)
+
+    def read_both(self, chunk_rows=xlsxConverter.TABLE_CHUNK_ROWS):
+        """(columns, table rows) of the sheet as DataFrame parsing and as streaming read it."""
+        df = pd.read_excel(self.path, sheet_name="Sheet")
+        expected = list(df.columns), "".join(xlsxConverter.render_table_rows(df))
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            columns, rows = xlsxConverter.read_sheet_streaming(workbook["Sheet"], chunk_rows)
+            return expected, (list(columns), "".join(rows))
+        finally:
+            workbook.close()
+
+    def test_int_before_equal_bool_keeps_its_value(self):
+        self.write_sheet([["a"], [3], [1], ["l1\nl2"], [True]])
+        expected, streamed = self.read_both()
+        self.assertEqual(expected[1], "| 3\n| 1\n| l1 +\nl2\n| 1\n")
+        self.assertEqual(streamed, expected)
+
+    def test_bool_before_equal_int_keeps_its_value(self):
+        self.write_sheet([["a"], [False], ["x"], [0], [True], [1]])
+        expected, streamed = self.read_both(chunk_rows=2)
+        self.assertEqual(streamed, expected)
+
+    def test_random_sheets_match_dataframe_parsing(self):
+        rng = random.Random(0)
+        for _ in range(40):
+            columns = rng.randint(1, 4)
+            self.write_sheet([[f"c{n}" for n in range(columns)]] +
+                             [[rng.choice(VALUES) for _ in range(columns)] for _ in range(rng.randint(1, 25))])
+            chunk_rows = rng.choice([1, 3, 100])
+            expected, streamed = self.read_both(chunk_rows)
+            self.assertEqual(streamed, expected)
+
+    def test_sample_cap_is_reported(self):
+        self.write_sheet([["a"], ["1"], ["1.5"], ["-1"]])
+        original = xlsxConverter.MAX_COLUMN_SAMPLES
+        xlsxConverter.MAX_COLUMN_SAMPLES = 1
+        try:
+            with self.assertLogs(level="WARNING") as logs:
+                self.read_both()
+        finally:
+            xlsxConverter.MAX_COLUMN_SAMPLES = original
+        self.assertIn("Column 1 of sheet Sheet", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
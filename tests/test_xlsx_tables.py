@@ -0,0 +1,58 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import numpy as np
+import pandas as pd
+import xlsxConverter
+
+
+def render_iterrows(df):
+    """The table rows as they were written before render_table_rows, one iterrows() row at a time."""
+    return "".join("| " + " | ".join(map(str, row)) + "\n" for _, row in df.iterrows())
+
+
+def render(df, chunk_rows=xlsxConverter.TABLE_CHUNK_ROWS):
+    return "".join(xlsxConverter.render_table_rows(df, chunk_rows))
+
+
+class RenderTableRowsTest(unittest.TestCase):
+    def test_int_beside_float_reads_as_float(self):
+        df = pd.DataFrame({"id": [1, 2], "score": [1.5, 2.25]})
+        self.assertEqual(render(df), "| 1.0 | 1.5\n| 2.0 | 2.25\n")
+
+    def test_int_beside_text_keeps_its_value(self):
+        df = pd.DataFrame({"id": [1, 2], "name": ["a", None]})
+        self.assertEqual(render(df), "| 1 | a\n| 2 | nan\n")
+
+    def test_missing_cell_in_row_of_dates_reads_nat(self):
+        df = pd.DataFrame({"name": ["a", None], "date": pd.to_datetime(["2024-01-02", "2024-01-03"])})
+        self.assertEqual(render(df), "| a | 2024-01-02 00:00:00\n| NaT | 2024-01-03 00:00:00\n")
+
+    def test_cells_are_escaped(self):
+        df = pd.DataFrame({"text": ["a|b", "l1\nl2"], "count": [1, 2]})
+        self.assertEqual(render(df), "| a\\|b | 1\n| l1 +\nl2 | 2\n")
+
+    def test_random_frames_match_iterrows(self):
+        rng = random.Random(0)
+        columns = [
+            lambda rows: [rng.randint(-5, 5) for _ in range(rows)],
+            lambda rows: [rng.random() for _ in range(rows)],
+            lambda rows: [rng.random() > 0.5 for _ in range(rows)],
+            lambda rows: [rng.choice(["a", "b", None]) for _ in range(rows)],
+            lambda rows: [rng.choice([1.0, float("nan")]) for _ in range(rows)],
+            # read_excel leaves empty cells as NaN, never None
+            lambda rows: [rng.choice([1, True, "x", float("nan")]) for _ in range(rows)],
+            lambda rows: pd.to_datetime([rng.choice(["2024-01-02", None]) for _ in range(rows)]),
+            lambda rows: np.array([rng.randint(0, 9) for _ in range(rows)], dtype=np.uint8),
+        ]
+        for _ in range(300):
+            rows = rng.randint(1, 8)
+            df = pd.DataFrame({f"c{n}": rng.choice(columns)(rows) for n in range(rng.randint(1, 4))})
+            self.assertEqual(render(df, rng.choice([1, 3, 100])), render_iterrows(df))
+
+
+if __name__ == "__main__":
+    unittest.main()